@@ -1,16 +1,47 @@
+import os
 import time
+import threading
 import requests
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from docker_engine import DockerEngine, DockerError, DOCKER_SOCKET, container_event
 
 CLOUD_API_URL = "http://localhost:8000"
 API_KEY = "secretAPIkey"
+DEVICE_TOKEN_KEY = os.getenv("DEVICE_TOKEN_KEY", "")  # handed to the gateways it starts
 POLL_INTERVAL = 15
 SCALE_UP_THRESHOLD = 1500
 SCALE_DOWN_THRESHOLD = 100
 MAX_GATEWAYS = 10
 COOLDOWN = 30
 
+# Warm pool: standby gateways (GATEWAY_STANDBY=1) that are booted, configured and
+# connected but not subscribed. Scale-up activates one over its control port
+# (gateway/control.py) and the pool is refilled in the background.
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", "1"))
+CONTROL_PORT = 5002
+ACTIVATE_TIMEOUT = 2
+
+# Docker is driven through the Engine API on its unix socket (docker_engine.py)
+# instead of the docker CLI. Container state is kept in `containers`, seeded
+# by one list call and then updated from the engine's event stream, so a dead
+# gateway is noticed (and deregistered) when it exits rather than at the next poll.
+GATEWAY_IMAGE = "5ggateway-gateway-01"
+GATEWAY_NETWORK = "5ggateway_default"
+DOCKER_WORKERS = 4  # concurrent start/stop/deregister calls
+EVENT_RETRY_SECONDS = 1
+
+engine = DockerEngine(os.getenv("DOCKER_SOCKET", DOCKER_SOCKET))
+docker_pool = ThreadPoolExecutor(max_workers=DOCKER_WORKERS)
+containers = {}  # gateway container name -> state ("created", "running", "exited", ...)
+containers_lock = threading.Lock()
+containers_synced = threading.Event()
+wake = threading.Event()  # set on container state changes to run the control loop early
+
 last_scale_time = 0
+warm_pool = {}  # gateway_id -> control URL of a standby ready to activate
+pool_starting = set()  # standby containers started but not answering on their control port yet
+pool_lock = threading.Lock()
+refill_running = threading.Lock()
 
 def get_gateway_status():
     """Fetch current gateway load status from cloud API"""
@@ -23,27 +54,69 @@ def get_gateway_status():
     return None
 
 
+def is_gateway_container(name):
+    # filter out compose-managed names like 5ggateway-gateway-01-1
+    return bool(name) and name.startswith("gateway-") and name.count("-") == 1
+
+
+def sync_containers():
+    """Replace the container map with a fresh listing from the engine"""
+    listed = engine.list_containers("gateway-")
+    with containers_lock:
+        containers.clear()
+        containers.update({name: state for name, state in listed.items() if is_gateway_container(name)})
+    containers_synced.set()
+
+
+def on_container_event(event):
+    """Apply one engine event to the container map"""
+    name, action = container_event(event)
+    if not is_gateway_container(name):
+        return
+    with containers_lock:
+        if action == "destroy":
+            containers.pop(name, None)
+        elif action == "create":
+            containers[name] = "created"
+        elif action in ("start", "unpause"):
+            containers[name] = "running"
+        elif action == "die":
+            containers[name] = "exited"
+        else:
+            return
+    if action == "die":
+        print(f"[autoscaler] {name} exited")
+        with pool_lock:
+            warm_pool.pop(name, None)
+        if name != "gateway-01":
+            docker_pool.submit(deregister, name)
+    if action in ("die", "destroy"):
+        wake.set()
+
+
+def watch_containers():
+    """Keep the container map current from the engine's event stream, resyncing on every (re)connect"""
+    since = None
+    while True:
+        try:
+            started = time.time()
+            sync_containers()
+            # replay from the last stream's start so nothing between list and subscribe is lost
+            engine.events(on_container_event, threading.Event(), since=since or started)
+            print("[autoscaler] Docker event stream closed, resyncing")
+        except Exception as e:
+            print(f"[autoscaler] Docker event stream failed: {e}")
+            containers_synced.clear()
+            time.sleep(EVENT_RETRY_SECONDS)
+        since = started
+
+
 def get_running_gateways():
-    """Fetch list of running gateway containers from Docker"""
-    try:
-        result = subprocess.run(
-            ["docker", "ps", "--filter", "name=gateway-", "--format", "{{.Names}}"],
-            capture_output=True, text=True, timeout=10
-        )
-        if result.returncode == 0:
-            names = []
-            for n in result.stdout.strip().split("\n"):
-                if n.strip():
-                    names.append(n.strip())
-            # filter out compose-managed names like 5ggateway-gateway-01-1
-            filtered_names = set()
-            for n in names:
-                if n.startswith("gateway-") and n.count("-") == 1:
-                    filtered_names.add(n)
-            return filtered_names
-    except Exception as e:
-        print(f"[autoscaler] Docker check failed: {e}")
-    return None
+    """Names of running gateway containers, or None until the container map is synced"""
+    if not containers_synced.is_set():
+        return None
+    with containers_lock:
+        return {name for name, state in containers.items() if state == "running"}
 
 
 def cleanup_stale(cloud_gateways, running):
@@ -55,40 +128,38 @@ def cleanup_stale(cloud_gateways, running):
             deregister(gateway_id)
 
 
-def start_gateway(num):
-    """Start a new Docker container for the gateway with given number"""
+def start_gateway(num, standby=False):
+    """Start a new Docker container for the gateway with given number (as a warm standby if standby)"""
     gateway_id = f"gateway-{num:02d}"
-    print(f"[autoscaler] Starting {gateway_id}...")
-
-    cmd = [
-        "docker", "run", "-d",
-        "--name", gateway_id,
-        "--network", "5ggateway_default",
-        "-e", f"GATEWAY_ID={gateway_id}",
-        "-e", "PYTHONUNBUFFERED=1",
-        "5ggateway-gateway-01"
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode == 0:
-        print(f"[autoscaler] {gateway_id} started")
-        return True
-
-    print(f"[autoscaler] Failed to start {gateway_id}: {result.stderr.strip()}")
-    return False
+    print(f"[autoscaler] Starting {gateway_id}{' (standby)' if standby else ''}...")
+
+    env = {"GATEWAY_ID": gateway_id, "DEVICE_TOKEN_KEY": DEVICE_TOKEN_KEY, "PYTHONUNBUFFERED": "1"}
+    ports = ()
+    if standby:
+        # control port on an ephemeral loopback port so the autoscaler (on the host) can reach it
+        env["GATEWAY_STANDBY"] = "1"
+        ports = (CONTROL_PORT,)
+    try:
+        engine.run_container(gateway_id, GATEWAY_IMAGE, env, GATEWAY_NETWORK, publish_ports=ports)
+    except Exception as e:
+        print(f"[autoscaler] Failed to start {gateway_id}: {e}")
+        return False
+    with containers_lock:
+        containers[gateway_id] = "running"  # don't wait for the start event
+    print(f"[autoscaler] {gateway_id} started")
+    return True
 
 
 def stop_gateway(gateway_id):
     """Stop and remove the Docker container for this gateway"""
     print(f"[autoscaler] Stopping {gateway_id}...")
     try:
-        r = subprocess.run(["docker", "stop", gateway_id], capture_output=True, text=True, timeout=30)
-        if r.returncode == 0:
-            subprocess.run(["docker", "rm", gateway_id], capture_output=True, text=True, timeout=10)
+        if engine.stop_container(gateway_id):
             print(f"[autoscaler] {gateway_id} removed")
-        elif "No such container" in r.stderr:
-            print(f"[autoscaler] {gateway_id} already gone")
         else:
-            print(f"[autoscaler] stop failed: {r.stderr.strip()}")
+            print(f"[autoscaler] {gateway_id} already gone")
+    except DockerError as e:
+        print(f"[autoscaler] stop failed: {e}")
     except Exception as e:
         print(f"[autoscaler] Error stopping {gateway_id}: {e}")
 
@@ -111,6 +182,97 @@ def deregister(gateway_id):
         print(f"[autoscaler] Deregister error for {gateway_id}: {e}")
 
 
+def control_url(gateway_id):
+    """Host URL of a standby container's control port, or None if it has none published"""
+    try:
+        address = engine.host_port(gateway_id, CONTROL_PORT)
+        if address:
+            return f"http://{address}/control"
+    except Exception as e:
+        print(f"[autoscaler] Control port lookup for {gateway_id} failed: {e}")
+    return None
+
+
+def standby_ready(url):
+    try:
+        return requests.get(f"{url}/status", timeout=2).json().get("status") == "standby"
+    except Exception:
+        return False
+
+
+def activate_standby():
+    """Take one gateway from the warm pool into service. Returns its ID, or None if the pool had none."""
+    while True:
+        with pool_lock:
+            if not warm_pool:
+                return None
+            gateway_id, url = warm_pool.popitem()
+        try:
+            started = time.time()
+            resp = requests.post(f"{url}/activate", headers={"Authorization": f"Bearer {API_KEY}"},
+                                 timeout=ACTIVATE_TIMEOUT)
+            if resp.status_code == 200:
+                print(f"[autoscaler] {gateway_id} activated from warm pool in {(time.time() - started) * 1000:.0f} ms")
+                return gateway_id
+            print(f"[autoscaler] Activating {gateway_id} failed: {resp.status_code} {resp.text}")
+        except Exception as e:
+            print(f"[autoscaler] Activating {gateway_id} failed: {e}")
+
+
+def refill_pool(cloud_gateways, running):
+    """Adopt standby containers already running, then start new ones until the pool is full"""
+    for gateway_id, info in cloud_gateways.items():
+        with pool_lock:
+            known = gateway_id in warm_pool or gateway_id in pool_starting
+        if info.get("status") == "standby" and gateway_id in running and not known:
+            url = control_url(gateway_id)
+            if url and standby_ready(url):
+                with pool_lock:
+                    warm_pool[gateway_id] = url
+
+    with pool_lock:
+        taken = set(running) | set(cloud_gateways) | set(warm_pool) | pool_starting
+        missing = WARM_POOL_SIZE - len(warm_pool) - len(pool_starting)
+        top = highest_gateway_number(taken)
+        nums = [top + i for i in range(1, missing + 1)]
+        pool_starting.update(f"gateway-{num:02d}" for num in nums)
+    # the standbys boot concurrently
+    list(docker_pool.map(start_standby, nums))
+
+
+def start_standby(num):
+    """Start one standby container and add it to the warm pool once its control port answers"""
+    gateway_id = f"gateway-{num:02d}"
+    try:
+        if not start_gateway(num, standby=True):
+            return
+        url = control_url(gateway_id)
+        deadline = time.time() + 120
+        while url and time.time() < deadline and containers.get(gateway_id) == "running" and not standby_ready(url):
+            time.sleep(1)
+        if url and standby_ready(url):
+            with pool_lock:
+                warm_pool[gateway_id] = url
+            print(f"[autoscaler] {gateway_id} ready in warm pool")
+    finally:
+        with pool_lock:
+            pool_starting.discard(gateway_id)
+
+
+def refill_in_background(cloud_gateways, running):
+    """Run refill_pool on a thread unless a refill is already in progress"""
+    if not refill_running.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            refill_pool(cloud_gateways, running)
+        finally:
+            refill_running.release()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
 def highest_gateway_number(gateways):
     """Return the highest numeric suffix among the given gateway IDs."""
     nums = []
@@ -128,18 +290,28 @@ def highest_gateway_number(gateways):
     return max_num
 
 
+def wait_for_poll():
+    """Sleep until the next poll, or until a gateway container exits"""
+    wake.wait(POLL_INTERVAL)
+    wake.clear()
+
+
 def main():
     global last_scale_time
+    if not DEVICE_TOKEN_KEY:
+        raise SystemExit("DEVICE_TOKEN_KEY is not set (gateways need the device token key to start)")
 
     print(f"Autoscaler started | poll={POLL_INTERVAL}s | "
           f"up>{SCALE_UP_THRESHOLD} down<{SCALE_DOWN_THRESHOLD} | max={MAX_GATEWAYS}")
+    threading.Thread(target=watch_containers, daemon=True).start()
+    containers_synced.wait(5)
 
     while True:
         status = get_gateway_status()
         running = get_running_gateways()
 
         if not status:
-            time.sleep(POLL_INTERVAL)
+            wait_for_poll()
             continue
 
         cloud_gateways = status.get("gateways", {})
@@ -154,11 +326,16 @@ def main():
                         if gid in running or gid == "gateway-01"}
         else:
             gateways = cloud_gateways
+        # gateways past the cloud's heartbeat expiry are reported "dead" and warm-pool ones
+        # "standby"; neither carries load
+        gateways = {gid: info for gid, info in gateways.items() if info.get("status") not in ("dead", "standby")}
+        if running is not None and WARM_POOL_SIZE > 0:
+            refill_in_background(cloud_gateways, running)
 
         count = len(gateways)
         if count == 0:
             print("[autoscaler] No gateways reporting yet")
-            time.sleep(POLL_INTERVAL)
+            wait_for_poll()
             continue
 
         total_rate = 0
@@ -186,7 +363,7 @@ def main():
             print(f"  {gid}: rate={rate} sent={sent}")
 
         if cooldown:
-            time.sleep(POLL_INTERVAL)
+            wait_for_poll()
             continue
 
         top = highest_gateway_number(gateways)
@@ -194,16 +371,24 @@ def main():
         # scale up
         if avg_rate > SCALE_UP_THRESHOLD and count < MAX_GATEWAYS:
             print(f"[autoscaler] SCALE UP — avg {avg_rate:.0f} > {SCALE_UP_THRESHOLD}")
-            if start_gateway(top + 1):
+            if activate_standby():
                 last_scale_time = now
+                refill_in_background(cloud_gateways, running or set())
+            else:
+                # pool empty: cold start, numbered past every container (standbys included)
+                with pool_lock:
+                    taken = set(running or ()) | set(cloud_gateways) | set(warm_pool) | pool_starting
+                if start_gateway(highest_gateway_number(taken) + 1):
+                    last_scale_time = now
 
         # scale down (never remove gateway-01)
         elif avg_rate < SCALE_DOWN_THRESHOLD and count > 1 and top > 1:
             print(f"[autoscaler] SCALE DOWN — avg {avg_rate:.0f} < {SCALE_DOWN_THRESHOLD}")
-            stop_gateway(f"gateway-{top:02d}")
+            # stop waits out the gateway's graceful shutdown; don't hold the loop for it
+            docker_pool.submit(stop_gateway, f"gateway-{top:02d}")
             last_scale_time = now
 
-        time.sleep(POLL_INTERVAL)
+        wait_for_poll()
 
 
 if __name__ == "__main__":
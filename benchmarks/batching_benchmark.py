@@ -0,0 +1,133 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gateway"))
+
+from data_buffer import DataBuffer
+from batch_policy import AdaptiveBatchPolicy
+
+# Compares the fixed batching policy (batch_size=50, max_wait=5s) with the
+# adaptive policy against a simulated cloud API, over a light and a heavy phase.
+
+SENDER_THREADS = 20          # same as the gateway worker pool
+PRODUCER_TICK_SECONDS = 0.01
+
+
+class SimulatedCloud:
+    """Cloud stand-in: fixed per-request cost plus per-record cost, limited concurrency."""
+
+    def __init__(self, base_latency, per_record_latency, concurrency):
+        self.base_latency = base_latency
+        self.per_record_latency = per_record_latency
+        self._slots = threading.Semaphore(concurrency)
+        self._lock = threading.Lock()
+        self.posts = 0
+        self.latencies = []
+        self.delivered = 0
+
+    def send(self, batch):
+        with self._slots:
+            time.sleep(self.base_latency + self.per_record_latency * len(batch))
+        done = time.time()
+        with self._lock:
+            self.posts += 1
+            self.delivered += len(batch)
+            self.latencies.extend(done - record["t0"] for record in batch)
+        return True
+
+    def take_stats(self):
+        with self._lock:
+            stats = (self.posts, self.delivered, self.latencies)
+            self.posts, self.delivered, self.latencies = 0, 0, []
+        return stats
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+def produce(buffer, rate, duration):
+    """Add records at a constant rate in small ticks."""
+    end = time.time() + duration
+    owed = 0.0
+    while time.time() < end:
+        owed += rate * PRODUCER_TICK_SECONDS
+        for _ in range(int(owed)):
+            buffer.add({"t0": time.time()})
+        owed -= int(owed)
+        time.sleep(PRODUCER_TICK_SECONDS)
+
+
+def run_policy(name, adaptive, phases, cloud_args, target_latency):
+    cloud = SimulatedCloud(*cloud_args)
+    buffer = DataBuffer(batch_size=50, max_wait_seconds=5)
+    policy = AdaptiveBatchPolicy(target_latency_seconds=target_latency)
+    pool = ThreadPoolExecutor(max_workers=SENDER_THREADS)
+    stop = threading.Event()
+
+    def send(batch):
+        started = time.time()
+        ok = cloud.send(batch)
+        policy.observe_send(len(batch), time.time() - started, ok)
+
+    def sender_loop():
+        while not stop.is_set():
+            if adaptive:
+                policy.tune(buffer)
+            batch = buffer.wait_for_batch(timeout=0.5)
+            if batch:
+                pool.submit(send, batch)
+
+    sender = threading.Thread(target=sender_loop, daemon=True)
+    sender.start()
+
+    results = []
+    for phase_name, rate, duration in phases:
+        cloud.take_stats()
+        started = time.time()
+        produce(buffer, rate, duration)
+        elapsed = time.time() - started
+        posts, delivered, latencies = cloud.take_stats()
+        results.append((name, phase_name, rate, delivered / elapsed, posts,
+                        percentile(latencies, 50), percentile(latencies, 99)))
+
+    stop.set()
+    sender.join()
+    pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed vs adaptive batching benchmark")
+    parser.add_argument("--light-rate", type=float, default=20.0, help="records/s in the light phase")
+    parser.add_argument("--heavy-rate", type=float, default=12000.0, help="records/s in the heavy phase")
+    parser.add_argument("--phase-seconds", type=float, default=8.0)
+    parser.add_argument("--target-latency", type=float, default=1.0, help="adaptive target in seconds")
+    parser.add_argument("--cloud-base-ms", type=float, default=25.0, help="fixed cost per POST")
+    parser.add_argument("--cloud-per-record-us", type=float, default=20.0, help="cost per record in a POST")
+    parser.add_argument("--cloud-concurrency", type=int, default=2, help="POSTs the cloud serves in parallel")
+    args = parser.parse_args()
+
+    phases = [
+        ("light", args.light_rate, args.phase_seconds),
+        ("heavy", args.heavy_rate, args.phase_seconds),
+    ]
+    cloud_args = (args.cloud_base_ms / 1000.0, args.cloud_per_record_us / 1e6, args.cloud_concurrency)
+
+    rows = run_policy("fixed", False, phases, cloud_args, args.target_latency)
+    rows += run_policy("adaptive", True, phases, cloud_args, args.target_latency)
+
+    print(f"{'policy':<10}{'phase':<8}{'offered/s':>11}{'delivered/s':>13}{'POSTs':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, phase, rate, throughput, posts, p50, p99 in rows:
+        print(f"{name:<10}{phase:<8}{rate:>11.0f}{throughput:>13.0f}{posts:>8}{p50 * 1000:>10.0f}{p99 * 1000:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
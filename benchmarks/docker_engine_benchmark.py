@@ -0,0 +1,243 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, unquote, urlparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+# Autoscaler Docker control path against a fake Docker Engine on a local unix
+# socket (no Docker needed). The fake serves the calls docker_engine.py makes
+# (containers/json, create, start, stop, DELETE, inspect, a chunked /events
+# stream) and sleeps --op-ms in create/start/stop to stand in for engine work.
+#
+# Measures:
+#   - API call latency over the kept-alive connection vs a new connection per
+#     call, next to the cost of just spawning a process (the floor for any
+#     `docker` CLI call the autoscaler used to make)
+#   - how long after a container dies the autoscaler's container map knows
+#   - starting/stopping N gateways one by one vs through the autoscaler's pool
+#
+#   python benchmarks/docker_engine_benchmark.py --calls 2000 --gateways 8 --op-ms 50
+
+
+class FakeEngine:
+    """In-memory containers plus the event subscribers to notify."""
+
+    def __init__(self, op_seconds):
+        self.op_seconds = op_seconds
+        self.lock = threading.Lock()
+        self.containers = {}  # name -> {"State": ..., "Ports": ...}
+        self.subscribers = []
+        self.emitted = {}  # (name, action) -> perf_counter when the event was written
+
+    def emit(self, name, action):
+        line = json.dumps({
+            "Type": "container", "Action": action, "status": action,
+            "Actor": {"ID": name, "Attributes": {"name": name}}, "timeNano": time.time_ns()
+        }).encode() + b"\n"
+        with self.lock:
+            subscribers = list(self.subscribers)
+            self.emitted[(name, action)] = time.perf_counter()
+        for subscriber in subscribers:
+            subscriber(line)
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.split("/")[2:]  # drop "" and the API version
+            if parts == ["containers", "json"]:
+                wanted = json.loads(parse_qs(url.query).get("filters", ["{}"])[0]).get("name", [""])
+                with fake.lock:
+                    listing = [{"Names": ["/" + name], "State": c["State"]} for name, c in fake.containers.items()
+                               if any(w in name for w in wanted)]
+                self._reply(200, listing)
+            elif len(parts) == 3 and parts[0] == "containers" and parts[2] == "json":
+                container = fake.containers.get(unquote(parts[1]))
+                if container is None:
+                    self._reply(404, {"message": "No such container"})
+                else:
+                    self._reply(200, {"State": {"Status": container["State"]},
+                                      "NetworkSettings": {"Ports": container["Ports"]}})
+            elif parts == ["events"]:
+                self._stream_events()
+            else:
+                self._reply(404, {"message": "not found"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            parts = url.path.split("/")[2:]
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            if parts == ["containers", "create"]:
+                name = parse_qs(url.query)["name"][0]
+                time.sleep(fake.op_seconds)
+                ports = {port: [{"HostIp": "127.0.0.1", "HostPort": str(40000 + len(fake.containers))}]
+                         for port in body.get("ExposedPorts", {})}
+                with fake.lock:
+                    if name in fake.containers:
+                        self._reply(409, {"message": f"Conflict. The container name \"/{name}\" is already in use"})
+                        return
+                    fake.containers[name] = {"State": "created", "Ports": ports}
+                fake.emit(name, "create")
+                self._reply(201, {"Id": name, "Warnings": []})
+            elif len(parts) == 3 and parts[0] == "containers" and parts[2] in ("start", "stop"):
+                name = unquote(parts[1])
+                container = fake.containers.get(name)
+                if container is None:
+                    self._reply(404, {"message": "No such container"})
+                    return
+                target = "running" if parts[2] == "start" else "exited"
+                if container["State"] == target:
+                    self._reply(304, None)
+                    return
+                time.sleep(fake.op_seconds)
+                container["State"] = target
+                fake.emit(name, "start" if target == "running" else "die")
+                self._reply(204, None)
+            else:
+                self._reply(404, {"message": "not found"})
+
+        def do_DELETE(self):
+            name = unquote(urlparse(self.path).path.split("/")[3])
+            with fake.lock:
+                removed = fake.containers.pop(name, None)
+            if removed is None:
+                self._reply(404, {"message": "No such container"})
+                return
+            fake.emit(name, "destroy")
+            self._reply(204, None)
+
+        def _stream_events(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.flush()
+            closed = threading.Event()
+            write_lock = threading.Lock()
+
+            def send(line):
+                with write_lock:
+                    try:
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                        self.wfile.flush()
+                    except OSError:
+                        closed.set()
+
+            with fake.lock:
+                fake.subscribers.append(send)
+            try:
+                closed.wait()
+            finally:
+                with fake.lock:
+                    fake.subscribers.remove(send)
+            self.close_connection = True
+
+        def _reply(self, code, body):
+            data = json.dumps(body).encode() if body is not None and code != 304 else b""
+            self.send_response(code)
+            if data:
+                self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *a):
+            pass
+
+    return Handler
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def timed(call, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        call()
+    return (time.perf_counter() - started) / n * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Autoscaler Docker control path against a fake engine socket")
+    parser.add_argument("--calls", type=int, default=2000, help="list calls per latency measurement")
+    parser.add_argument("--gateways", type=int, default=8, help="containers started/stopped per run")
+    parser.add_argument("--op-ms", type=float, default=50.0, help="simulated engine time per create/start/stop")
+    parser.add_argument("--events", type=int, default=200, help="container deaths to time")
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "docker.sock")
+    fake = FakeEngine(0.0)
+    server = ThreadingUnixServer(socket_path, make_handler(fake))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ["DOCKER_SOCKET"] = socket_path
+    import autoscaler
+    from docker_engine import DockerEngine
+    autoscaler.deregister = lambda gateway_id: None  # no cloud API here
+    engine = autoscaler.engine
+
+    print(f"API call latency (GET /containers/json, mean of {args.calls}):")
+    engine.list_containers("gateway-")
+    keep_alive = timed(lambda: engine.list_containers("gateway-"), args.calls)
+    per_call = timed(lambda: DockerEngine(socket_path).list_containers("gateway-"), args.calls)
+    spawn = timed(lambda: subprocess.run([sys.executable, "-c", "pass"], check=True), 20)
+    print(f"  kept-alive connection   {keep_alive:8.3f} ms")
+    print(f"  connection per call     {per_call:8.3f} ms")
+    print(f"  process spawn only      {spawn:8.3f} ms  (floor for one docker CLI call)")
+
+    quiet = contextlib.redirect_stdout(io.StringIO())  # the autoscaler's own per-container log lines
+    threading.Thread(target=autoscaler.watch_containers, daemon=True).start()
+    autoscaler.containers_synced.wait(5)
+    delays = []
+    with quiet:
+        for i in range(args.events):
+            name = f"gateway-{90 + i % 9}"
+            engine.run_container(name, "image", {}, "net")
+            while autoscaler.containers.get(name) != "running":
+                time.sleep(0)
+            autoscaler.wake.clear()
+            engine.request("POST", f"/containers/{name}/stop")
+            autoscaler.wake.wait(5)
+            noticed = time.perf_counter()
+            delays.append((noticed - fake.emitted[(name, "die")]) * 1000)
+            engine.request("DELETE", f"/containers/{name}")
+    delays.sort()
+    print(f"\nContainer death -> autoscaler notified ({args.events} deaths):")
+    print(f"  event stream   p50 {delays[len(delays) // 2]:.3f} ms  p99 {delays[int(len(delays) * 0.99)]:.3f} ms")
+    print(f"  polling        ~{autoscaler.POLL_INTERVAL * 1000 / 2:.0f} ms on average (half of the {autoscaler.POLL_INTERVAL}s poll)")
+
+    fake.op_seconds = args.op_ms / 1000.0
+    numbers = list(range(10, 10 + args.gateways))
+    names = [f"gateway-{num:02d}" for num in numbers]
+    print(f"\n{args.gateways} gateways, {args.op_ms:.0f} ms engine time per create/start/stop:")
+    with contextlib.redirect_stdout(io.StringIO()):
+        sequential_start = timed(lambda: [autoscaler.start_gateway(num) for num in numbers], 1)
+        sequential_stop = timed(lambda: [autoscaler.stop_gateway(name) for name in names], 1)
+        pool_start = timed(lambda: list(autoscaler.docker_pool.map(autoscaler.start_gateway, numbers)), 1)
+        pool_stop = timed(lambda: list(autoscaler.docker_pool.map(autoscaler.stop_gateway, names)), 1)
+    print(f"  {'':12}{'start ms':>10}{'stop ms':>10}")
+    print(f"  {'sequential':12}{sequential_start:>10.0f}{sequential_stop:>10.0f}")
+    print(f"  {'pool of ' + str(autoscaler.DOCKER_WORKERS):12}{pool_start:>10.0f}{pool_stop:>10.0f}")
+
+    server.shutdown()
+    os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gateway"))
+
+from anomaly_detector import AnomalyDetector
+from model_format import open_model, write_model
+
+# What a gateway pays per model refresh: parsing the JSON artifact into nested
+# dicts vs mapping the binary artifact, for growing numbers of sensor profiles,
+# and the per-reading score() cost with each.
+#
+#   python benchmarks/model_benchmark.py --profiles 10000 100000 300000
+
+SCORE_SAMPLES = 50000
+
+
+def make_artifact(profiles):
+    features = {}
+    for i in range(profiles):
+        features[f"device-{i:07d}::temperature"] = {
+            "mean": random.gauss(20.0, 5.0),
+            "stddev": random.uniform(0.1, 2.0),
+            "samples": 50,
+            "n_sigma": 3.0
+        }
+    return {"model_type": "zscore_anomaly_detector", "generated_at": int(time.time()), "training_window_size": 50, "features": features}
+
+
+def timed_load(load):
+    """Load once for the time and once under tracemalloc for the memory it keeps."""
+    started = time.perf_counter()
+    load()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    model = load()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return model, elapsed, memory
+
+
+def score_cost(detector, keys):
+    started = time.perf_counter()
+    for key in keys:
+        detector.score(key, 21.0)
+    return (time.perf_counter() - started) / len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON vs binary model artifact benchmark")
+    parser.add_argument("--profiles", type=int, nargs="+", default=[10000, 100000, 300000])
+    args = parser.parse_args()
+
+    random.seed(1)
+    print(f"{'profiles':>10}{'format':>8}{'size MB':>10}{'load ms':>10}{'heap MB':>10}{'score us':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for profiles in args.profiles:
+            artifact = make_artifact(profiles)
+            json_path = os.path.join(tmp, "model.json")
+            bin_path = os.path.join(tmp, "model.bin")
+            with open(json_path, "w") as f:
+                json.dump(artifact, f)
+            with open(bin_path, "wb") as f:
+                f.write(write_model(artifact))
+            keys = random.choices(list(artifact["features"]), k=SCORE_SAMPLES)
+            del artifact
+
+            # JSON: parse into the nested dicts gateways used to hold
+            def load_json():
+                with open(json_path, "rb") as f:
+                    return json.loads(f.read())
+
+            model, elapsed, memory = timed_load(load_json)
+            print(f"{profiles:>10}{'json':>8}{os.path.getsize(json_path) / 1e6:>10.1f}{elapsed * 1000:>10.1f}{memory / 1e6:>10.1f}{'-':>10}")
+            del model
+
+            # Binary: map the file; score() fills the detector's cache on first use of a profile
+            model, elapsed, memory = timed_load(lambda: open_model(bin_path))
+            detector = AnomalyDetector()
+            detector.update_model(model)
+            first = score_cost(detector, keys)
+            cached = score_cost(detector, keys)
+            print(f"{profiles:>10}{'binary':>8}{os.path.getsize(bin_path) / 1e6:>10.1f}{elapsed * 1000:>10.1f}{memory / 1e6:>10.1f}"
+                  f"{cached * 1e6:>10.2f}  (first use {first * 1e6:.2f} us)")
+            del model, detector
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "gateway"))
+
+# Throughput and latency of gateway MQTT ingress at QoS 0 vs QoS 1 with
+# deferred acks, against a real broker (e.g. the compose EMQX on localhost).
+#
+# The subscriber is built by gateway/mqtt_client.py (create_client/connect), so
+# it runs with the same protocol, session and receive-maximum settings as the
+# gateway. At QoS 1 with manual acks, deliveries are acked the way the gateway
+# does it: in batches of --batch, after a simulated cloud send of --send-ms.
+# The publisher uses the same QoS, as devices must for end-to-end QoS 1.
+#
+#   python benchmarks/qos_benchmark.py --messages 20000
+#   python benchmarks/qos_benchmark.py --protocol 5 --receive-maximum 200 2000
+
+TOPIC = "bench/qos"
+DRAIN_TIMEOUT_SECONDS = 60
+
+
+def run(mqtt_client, qos, messages, batch, send_seconds):
+    import paho.mqtt.client as mqtt
+
+    mqtt_client.MQTT_QOS = qos
+    manual = mqtt_client.manual_acks()
+    tag = f"{os.getpid()}-{qos}-{mqtt_client.MQTT_RECEIVE_MAXIMUM}"
+    subscriber = mqtt_client.create_client(f"qos-bench-sub-{tag}")
+    lock = threading.Lock()
+    unacked = []
+    latencies = []
+    stats = {"max_unacked": 0, "last": None}
+    done = threading.Event()
+
+    def on_message(client, userdata, msg):
+        now = time.time()
+        with lock:
+            latencies.append(now - json.loads(msg.payload)["t0"])
+            stats["last"] = now
+            if manual:
+                unacked.append(msg.mid)
+                stats["max_unacked"] = max(stats["max_unacked"], len(unacked))
+            if len(latencies) >= messages:
+                done.set()
+
+    def acker():
+        """Stand-in for the send path: take a batch, 'send' it, ack it."""
+        while not done.is_set() or unacked:
+            with lock:
+                taken = unacked[:batch] if len(unacked) >= batch or done.is_set() else []
+                del unacked[:len(taken)]
+            if not taken:
+                time.sleep(0.001)
+                continue
+            time.sleep(send_seconds)
+            for mid in taken:
+                subscriber.ack(mid, qos)
+
+    subscribed = threading.Event()
+    subscriber.on_message = on_message
+    subscriber.on_subscribe = lambda *args: subscribed.set()
+    mqtt_client.connect(subscriber)
+    subscriber.subscribe(TOPIC, qos=qos)
+    subscriber.loop_start()
+    subscribed.wait(10)
+    if manual:
+        threading.Thread(target=acker, daemon=True).start()
+
+    publisher = mqtt.Client(client_id=f"qos-bench-pub-{tag}")
+    publisher.max_inflight_messages_set(1000)
+    publisher.max_queued_messages_set(0)
+    publisher.connect(mqtt_client.BROKER, mqtt_client.PORT)
+    publisher.loop_start()
+    started = time.time()
+    payload = {"deviceId": "bench-device", "sensorType": "temperature", "unit": "C", "value": 20.0}
+    for _ in range(messages):
+        payload["t0"] = time.time()
+        publisher.publish(TOPIC, json.dumps(payload), qos=qos)
+
+    done.wait(DRAIN_TIMEOUT_SECONDS)
+    done.set()
+    publisher.loop_stop()
+    publisher.disconnect()
+    subscriber.loop_stop()
+    subscriber.disconnect()
+
+    received = len(latencies)
+    wall = (stats["last"] or time.time()) - started
+    ordered = sorted(latencies)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))] * 1000 if ordered else 0.0
+    acks = "manual" if manual else ("none" if qos == 0 else "on receipt")
+    return {
+        "qos": qos, "acks": acks, "received": received, "rate": received / wall if wall > 0 else 0.0,
+        "p50": pick(50), "p99": pick(99), "max_unacked": stats["max_unacked"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gateway MQTT ingress: QoS 0 vs QoS 1 with deferred acks")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=50, help="records per simulated cloud send")
+    parser.add_argument("--send-ms", type=float, default=20.0, help="simulated cloud send latency")
+    parser.add_argument("--protocol", choices=["311", "5"], default="311")
+    parser.add_argument("--receive-maximum", type=int, nargs="+", default=[2000],
+                        help="QoS 1 receive windows to try (sent on MQTT 5 only)")
+    args = parser.parse_args()
+
+    import mqtt_client
+    mqtt_client.BROKER = args.broker
+    mqtt_client.PORT = args.port
+    mqtt_client.MQTT_PROTOCOL = args.protocol
+
+    runs = [(0, args.receive_maximum[0])] + [(1, window) for window in args.receive_maximum]
+    print(f"{args.messages} messages, MQTT {args.protocol}, ack batches of {args.batch} after {args.send_ms:.0f} ms")
+    print(f"{'qos':>4}{'acks':>12}{'recv max':>10}{'received':>10}{'msg/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max unacked':>13}")
+    baseline = None
+    for qos, window in runs:
+        mqtt_client.MQTT_RECEIVE_MAXIMUM = window
+        result = run(mqtt_client, qos, args.messages, args.batch, args.send_ms / 1000.0)
+        baseline = baseline or result["rate"]
+        cost = f"  ({result['rate'] / baseline:.0%} of QoS 0)" if qos else ""
+        print(f"{qos:>4}{result['acks']:>12}{window if qos else '-':>10}{result['received']:>10}{result['rate']:>10,.0f}"
+              f"{result['p50']:>10.1f}{result['p99']:>10.1f}{result['max_unacked']:>13}{cost}")
+
+
+if __name__ == "__main__":
+    main()
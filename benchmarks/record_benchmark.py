@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gateway"))
+
+from record import Record, to_wire
+
+# Memory and CPU cost of holding readings in the gateway: the old path (a dict
+# per message, mutated in place, copied again for the replication log) against
+# Record (one slotted object shared by the buffer and the log, interned ids,
+# no per-message UUID now that batches carry sequence numbers).
+#
+#   python benchmarks/record_benchmark.py --records 100000 --devices 5000
+
+SENSOR_TYPES = ("temperature", "humidity", "pressure")
+GATEWAY_ID = "gateway-01"
+
+
+def make_payloads(count, devices):
+    payloads = []
+    for i in range(count):
+        sensor_type = SENSOR_TYPES[i % len(SENSOR_TYPES)]
+        body = {
+            "deviceId": f"device-{random.randrange(devices):06d}",
+            "sensorType": sensor_type,
+            "unit": "C",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S") + "Z",
+            "value": round(random.gauss(20.0, 2.0), 3),
+        }
+        payloads.append((f"sensors/{sensor_type}", json.dumps(body).encode()))
+    return payloads
+
+
+def dict_pipeline(payloads, buffer, log):
+    for topic, payload in payloads:
+        message = json.loads(payload.decode())
+        message["topic"] = topic
+        message["messageId"] = str(uuid.uuid4())
+        message["gatewayReceivedAt"] = time.time()
+        profile_key = f"{message.get('deviceId', 'unknown-device')}::{message.get('sensorType', 'unknown-sensor')}"
+        message["profileKey"] = profile_key
+        message["isAnomaly"] = False
+        message["anomalyScore"] = abs(message["value"] - 20.0) / 2.0
+        message["modelTimestamp"] = "2024-01-01T00:00:00Z"
+        buffer.append(message)
+        log.append(dict(message, _repl_ts=time.time(), _origin=GATEWAY_ID))
+
+
+def record_pipeline(payloads, buffer, log):
+    for topic, payload in payloads:
+        record = Record.from_dict(json.loads(payload.decode()), topic)
+        record.received_at = time.time()
+        record.profile_key = record.profile
+        record.is_anomaly = False
+        record.anomaly_score = abs(record.value - 20.0) / 2.0
+        record.model_timestamp = "2024-01-01T00:00:00Z"
+        buffer.append(record)
+        record.repl_ts = time.time()
+        record.origin = GATEWAY_ID
+        log.append(record)
+
+
+def measure(name, pipeline, payloads, batch_size):
+    started = time.perf_counter()
+    pipeline(payloads, [], [])
+    elapsed = time.perf_counter() - started
+
+    buffer, log = [], []
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    pipeline(payloads, buffer, log)
+    blocks = sys.getallocatedblocks() - blocks_before
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for i in range(0, len(buffer), batch_size):
+        json.dumps({"gatewayId": GATEWAY_ID, "data": to_wire(buffer[i:i + batch_size])})
+    serialize = time.perf_counter() - started
+
+    count = len(payloads)
+    print(f"{name:<8}{retained / count:>12.0f}{blocks / count:>14.1f}{elapsed / count * 1e6:>14.2f}{serialize / count * 1e6:>14.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dict vs Record memory/CPU benchmark")
+    parser.add_argument("--records", type=int, default=100000, help="readings held in buffer + replication log")
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500, help="records per serialized ingest request")
+    args = parser.parse_args()
+
+    random.seed(1)
+    payloads = make_payloads(args.records, args.devices)
+    print(f"{args.records} readings from {args.devices} devices, each held in the buffer and the replication log")
+    print(f"{'repr':<8}{'bytes/rec':>12}{'blocks/rec':>14}{'ingest us':>14}{'to_wire us':>14}")
+    measure("dict", dict_pipeline, payloads, args.batch_size)
+    measure("record", record_pipeline, payloads, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
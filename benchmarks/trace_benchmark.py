@@ -0,0 +1,362 @@
+import argparse
+import gzip
+import json
+import os
+import resource
+import statistics
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "devices"))
+sys.path.insert(0, os.path.join(ROOT, "gateway"))
+
+# Record / synthesize MQTT traffic into a compact trace file and replay it through
+# the real gateway code (main.process_message, DataBuffer, AnomalyDetector,
+# rest_client, PeerSync) against in-process stand-ins for the broker and cloud API.
+#
+#   python benchmarks/trace_benchmark.py synthesize trace.bin --sensors 2000 --seconds 30
+#   python benchmarks/trace_benchmark.py record trace.bin --seconds 60
+#   python benchmarks/trace_benchmark.py replay trace.bin --speedup 10
+
+TRACE_MAGIC = b"GWTRACE1"
+RECORD_HEADER = struct.Struct("<dHI")  # offset seconds, topic index, payload length
+DEFAULT_N_SIGMA = 3.0
+PEER_PULL_INTERVAL = 1.0
+DRAIN_TIMEOUT_SECONDS = 60
+
+
+def open_trace(path, mode):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+def write_trace(path, messages):
+    """messages: iterable of (offset_seconds, topic, payload_bytes), in offset order."""
+    topics = {}
+    body = []
+    for offset, topic, payload in messages:
+        index = topics.setdefault(topic, len(topics))
+        body.append(RECORD_HEADER.pack(offset, index, len(payload)))
+        body.append(payload)
+
+    with open_trace(path, "wb") as f:
+        f.write(TRACE_MAGIC)
+        f.write(struct.pack("<H", len(topics)))
+        for topic in topics:
+            encoded = topic.encode()
+            f.write(struct.pack("<H", len(encoded)))
+            f.write(encoded)
+        f.write(b"".join(body))
+
+
+def read_trace(path):
+    with open_trace(path, "rb") as f:
+        data = f.read()
+    if data[:len(TRACE_MAGIC)] != TRACE_MAGIC:
+        raise ValueError(f"{path} is not a gateway trace file")
+    pos = len(TRACE_MAGIC)
+    (topic_count,) = struct.unpack_from("<H", data, pos)
+    pos += 2
+    topics = []
+    for _ in range(topic_count):
+        (length,) = struct.unpack_from("<H", data, pos)
+        pos += 2
+        topics.append(data[pos:pos + length].decode())
+        pos += length
+
+    messages = []
+    while pos < len(data):
+        offset, index, length = RECORD_HEADER.unpack_from(data, pos)
+        pos += RECORD_HEADER.size
+        messages.append((offset, topics[index], data[pos:pos + length]))
+        pos += length
+    return messages
+
+
+def synthesize(args):
+    """Build a trace from SensorFleet: every sensor publishes once per second, spread over the second."""
+    from sensor import SensorFleet, SENSOR_CONFIG
+    from auth import issue_token
+
+    fleet = SensorFleet.create(args.sensors, seed=args.seed)
+    tokens = [issue_token(device_id) for device_id in fleet.device_ids]
+    base_time = datetime(2025, 1, 1)
+    spacing = 1.0 / fleet.size
+    messages = []
+    for second in range(args.seconds):
+        values, _ = fleet.tick(float(second))
+        for i, value in enumerate(values.tolist()):
+            offset = second + i * spacing
+            sensor_type = fleet.sensor_types[i]
+            payload = {
+                "deviceId": fleet.device_ids[i],
+                "signature": tokens[i],
+                "sensorType": sensor_type,
+                "timestamp": (base_time + timedelta(seconds=offset)).isoformat() + "Z",
+                "value": value,
+                "unit": SENSOR_CONFIG[sensor_type]["unit"]
+            }
+            messages.append((offset, SENSOR_CONFIG[sensor_type]["topic"], json.dumps(payload).encode()))
+
+    write_trace(args.trace, messages)
+    print(f"Wrote {len(messages)} messages ({os.path.getsize(args.trace) / 1e6:.1f} MB) to {args.trace}")
+
+
+def record(args):
+    """Capture live MQTT traffic from a broker into a trace."""
+    import paho.mqtt.client as mqtt
+
+    messages = []
+    lock = threading.Lock()
+    started = time.time()
+
+    def on_message(client, userdata, msg):
+        with lock:
+            messages.append((time.time() - started, msg.topic, bytes(msg.payload)))
+
+    client = mqtt.Client(client_id=f"trace-recorder-{os.getpid()}", protocol=mqtt.MQTTv311)
+    client.on_message = on_message
+    client.connect(args.broker, args.port)
+    client.subscribe(args.topic)
+    client.loop_start()
+    print(f"Recording {args.topic} from {args.broker}:{args.port} for {args.seconds}s...")
+    time.sleep(args.seconds)
+    client.loop_stop()
+    client.disconnect()
+
+    with lock:
+        captured = list(messages)
+    write_trace(args.trace, captured)
+    print(f"Wrote {len(captured)} messages to {args.trace}")
+
+
+class StageStats:
+    """Thread-safe latency samples per pipeline stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def extend(self, stage, values):
+        with self._lock:
+            self.samples.setdefault(stage, []).extend(values)
+
+    def count(self, stage):
+        with self._lock:
+            return len(self.samples.get(stage, []))
+
+    def report(self):
+        print(f"{'stage':<14}{'count':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        with self._lock:
+            stages = {k: sorted(v) for k, v in self.samples.items()}
+        for stage in ("decode", "queue_wait", "process", "buffer_wait", "send", "end_to_end", "e2e_priority", "peer_pull"):
+            values = stages.get(stage)
+            if not values:
+                continue
+            pick = lambda pct: values[min(len(values) - 1, int(len(values) * pct / 100.0))] * 1000
+            print(f"{stage:<14}{len(values):>10}{pick(50):>10.2f}{pick(90):>10.2f}{pick(99):>10.2f}{values[-1] * 1000:>10.2f}")
+
+
+def start_cloud_stand_in(stats):
+    """In-process cloud API: accepts /ingest batches and records end-to-end latency."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            now = time.time()
+            records = json.loads(body).get("data", [])
+            stats.extend("end_to_end", [now - r["_bench_t0"] for r in records if "_bench_t0" in r])
+            stats.extend("e2e_priority", [now - r["_bench_t0"] for r in records if "_bench_t0" in r and r.get("isAnomaly")])
+            self._reply({"status": "ok", "received": len(records), "duplicates": 0})
+
+        def do_GET(self):
+            self._reply({})
+
+        def _reply(self, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *a):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_model(messages):
+    """Per-profile center/spread over the whole trace, in the artifact format the gateway consumes.
+
+    Uses median and scaled MAD so the trace's own spikes do not inflate the
+    profile and hide themselves (short traces have too few samples per key).
+    """
+    values = {}
+    for _, topic, payload in messages:
+        msg = json.loads(payload)
+        key = f"{msg.get('deviceId', 'unknown-device')}::{msg.get('sensorType', 'unknown-sensor')}"
+        values.setdefault(key, []).append(float(msg["value"]))
+
+    features = {}
+    for key, samples in values.items():
+        center = statistics.median(samples)
+        spread = 1.4826 * statistics.median(abs(v - center) for v in samples) or 0.0001
+        features[key] = {"mean": center, "stddev": spread, "samples": len(samples), "n_sigma": DEFAULT_N_SIGMA}
+    return {"model_type": "zscore_anomaly_detector", "generated_at": int(time.time()), "features": features}
+
+
+def replay(args):
+    messages = read_trace(args.trace)
+    if not messages:
+        print("Trace is empty")
+        return
+
+    import main as gateway
+    import rest_client
+    import mqtt_client
+    import peer_sync as peer_sync_module
+    from peer_sync import PeerSync
+    from data_buffer import DataBuffer
+
+    stats = StageStats()
+    cloud = start_cloud_stand_in(stats)
+    rest_client.CLOUD_API_URL = f"http://127.0.0.1:{cloud.server_address[1]}/ingest"
+
+    gateway.CONFIG["batch_mode"] = args.batch_mode
+    gateway.apply_batch_config()
+    gateway.detector.update_model(build_model(messages))
+
+    # Replication: the gateway serves its log; a second PeerSync pulls from it like a peer would
+    with ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler) as probe:
+        peer_sync_module.PEER_PORT = probe.server_address[1]
+    threading.Thread(target=gateway.peer_sync._serve, args=(gateway.shutdown_event,), daemon=True).start()
+    peer = PeerSync("bench-peer", DataBuffer(batch_size=10 ** 9, max_wait_seconds=10 ** 9))
+    peer._peers = ["127.0.0.1"]
+
+    # Stage instrumentation around the real gateway functions
+    process_message = gateway.process_message
+    send_batch = gateway.send_batch
+
+    def timed_process_message(message):
+        started = time.time()
+        stats.add("queue_wait", started - message["_bench_t0"])
+        process_message(message)
+        finished = time.time()
+        message["_bench_t1"] = finished
+        stats.add("process", finished - started)
+
+    def timed_send_batch(batch, lane=gateway.NORMAL_LANE):
+        started = time.time()
+        stats.extend("buffer_wait", [started - m.get("_bench_t1", started) for m in batch])
+        send_batch(batch, lane)
+        stats.add("send", time.time() - started)
+
+    gateway.process_message = timed_process_message
+    gateway.send_batch = timed_send_batch
+
+    def peer_loop():
+        while not gateway.shutdown_event.is_set():
+            started = time.time()
+            peer.pull_from_peers()
+            stats.add("peer_pull", time.time() - started)
+            gateway.shutdown_event.wait(PEER_PULL_INTERVAL)
+
+    threading.Thread(target=gateway.batch_sender_loop, daemon=True).start()
+    threading.Thread(target=gateway.priority_sender_loop, daemon=True).start()
+    threading.Thread(target=peer_loop, daemon=True).start()
+    time.sleep(0.2)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    speedup = args.speedup
+    replay_started = time.time()
+    first_offset = messages[0][0]
+    admit = gateway.admission.admit_payload if args.admission else None
+    shed = 0
+
+    for offset, topic, payload in messages:
+        if speedup > 0:
+            due = replay_started + (offset - first_offset) / speedup
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        t0 = time.time()
+        if admit is not None and not admit(topic, payload):
+            shed += 1
+            continue
+        data = mqtt_client.decode_message(topic, payload)
+        stats.add("decode", time.time() - t0)
+        if data is not None:
+            data["_bench_t0"] = t0
+            gateway.mqtt_message_callback(data)
+
+    offered_seconds = time.time() - replay_started
+    deadline = time.time() + DRAIN_TIMEOUT_SECONDS
+    while stats.count("end_to_end") < len(messages) - shed and time.time() < deadline:
+        time.sleep(0.05)
+    wall = time.time() - replay_started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    gateway.shutdown_event.set()
+
+    delivered = stats.count("end_to_end")
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    print(f"\nReplayed {len(messages)} messages from {args.trace} "
+          f"(speedup={'max' if speedup <= 0 else speedup}, batch_mode={args.batch_mode})")
+    print(f"Offered:   {len(messages) / offered_seconds:,.0f} msg/s over {offered_seconds:.2f}s")
+    if admit is not None:
+        print(f"Shed:      {shed} messages by per-device admission control")
+    print(f"Delivered: {delivered} to cloud stand-in, {delivered / wall:,.0f} msg/s over {wall:.2f}s")
+    print(f"CPU:       {cpu / len(messages) * 1e6:.1f} us/msg (process total, includes stand-ins)")
+    print(f"Memory:    max RSS {rss_before / 1024:.0f} MB before replay, "
+          f"{usage_after.ru_maxrss / 1024:.0f} MB high-water")
+    print()
+    stats.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/synthesize and replay gateway traffic traces")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("synthesize", help="build a trace from devices/sensor.py")
+    p.add_argument("trace")
+    p.add_argument("--sensors", type=int, default=1000)
+    p.add_argument("--seconds", type=int, default=30)
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=synthesize)
+
+    p = sub.add_parser("record", help="capture live traffic from an MQTT broker")
+    p.add_argument("trace")
+    p.add_argument("--broker", default="localhost")
+    p.add_argument("--port", type=int, default=1883)
+    p.add_argument("--topic", default="sensors/#")
+    p.add_argument("--seconds", type=float, default=60)
+    p.set_defaults(func=record)
+
+    p = sub.add_parser("replay", help="replay a trace through the gateway pipeline")
+    p.add_argument("trace")
+    p.add_argument("--speedup", type=float, default=1.0, help="replay speed multiplier (0 = as fast as possible)")
+    p.add_argument("--batch-mode", choices=["fixed", "adaptive"], default="fixed")
+    p.add_argument("--admission", action="store_true",
+                   help="apply per-device admission control (sheds most traffic at high speedups)")
+    p.set_defaults(func=replay)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+SPARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "spark")
+sys.path.insert(0, SPARK_DIR)
+
+# Wall time and memory of the training backends (spark/trainers.py) on
+# historical data files of growing size, shaped like the cloud export: up to
+# TRAINING_WINDOW_SIZE readings per profile plus some gateway summary records.
+# Each run is a fresh subprocess so that start-up cost (SparkSession/JVM) and
+# peak memory are counted per backend. The spark backend is skipped when
+# pyspark is not installed.
+#
+#   python benchmarks/trainer_benchmark.py --profiles 1000 10000 50000
+
+TRAINING_WINDOW_SIZE = 50
+SUMMARY_SHARE = 0.2  # profiles whose gateway sends window summaries instead of raw readings
+SUMMARY_WINDOW = 10
+
+
+def write_dataset(path, profiles):
+    records = []
+    for p in range(profiles):
+        profile_key = f"device-{p:07d}::temperature"
+        mean = random.gauss(20.0, 5.0)
+        if random.random() < SUMMARY_SHARE:
+            for _ in range(TRAINING_WINDOW_SIZE // SUMMARY_WINDOW):
+                values = [random.gauss(mean, 1.0) for _ in range(SUMMARY_WINDOW)]
+                window_mean = sum(values) / len(values)
+                records.append({
+                    "recordType": "summary", "profileKey": profile_key, "value": window_mean,
+                    "count": len(values), "mean": window_mean, "m2": sum((v - window_mean) ** 2 for v in values)
+                })
+        else:
+            for _ in range(TRAINING_WINDOW_SIZE):
+                records.append({"profileKey": profile_key, "value": random.gauss(mean, 1.0)})
+    with open(path, "w") as f:
+        json.dump(records, f)
+    return len(records)
+
+
+def run_backend(backend, data_path):
+    """Train once in a child process.
+
+    Returns (wall seconds, profiles, max RSS in KB of the child or of any
+    process it reaped, e.g. the JVM), or None if the backend is unavailable.
+    """
+    child = (
+        "import json, sys, time\n"
+        f"sys.path.insert(0, {SPARK_DIR!r})\n"
+        "from trainers import create_trainer\n"
+        "started = time.perf_counter()\n"
+        f"trainer = create_trainer({backend!r})\n"
+        f"model = trainer.train({data_path!r})\n"
+        "elapsed = time.perf_counter() - started\n"
+        "trainer.close()\n"
+        "print(json.dumps([elapsed, len(model)]))\n"
+    )
+    with tempfile.TemporaryFile("w+") as out:
+        proc = subprocess.Popen([sys.executable, "-c", child], stdout=out, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            return None
+        out.seek(0)
+        elapsed, trained = json.loads(out.read().strip().splitlines()[-1])
+    return elapsed, trained, usage.ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy vs Spark training backend benchmark")
+    parser.add_argument("--profiles", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--backends", nargs="+", default=["numpy", "spark"])
+    args = parser.parse_args()
+
+    random.seed(7)
+    print(f"{'profiles':>10}{'records':>10}{'file MB':>9}{'backend':>9}{'wall s':>9}{'max RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, "historical_data.json")
+        for profiles in args.profiles:
+            records = write_dataset(data_path, profiles)
+            size = os.path.getsize(data_path) / 1e6
+            for backend in args.backends:
+                outcome = run_backend(backend, data_path)
+                if outcome is None:
+                    print(f"{profiles:>10}{records:>10}{size:>9.1f}{backend:>9}  unavailable (not installed?)")
+                    continue
+                elapsed, trained, rss = outcome
+                print(f"{profiles:>10}{records:>10}{size:>9.1f}{backend:>9}{elapsed:>9.2f}{rss / 1024:>12.0f}"
+                      f"  ({trained} profiles trained)")
+
+
+if __name__ == "__main__":
+    main()
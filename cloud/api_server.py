@@ -1,32 +1,36 @@
 import json
 import os
 import time
-import threading
-from collections import defaultdict, deque, OrderedDict
 from fastapi import FastAPI, Header, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Any, Dict
 from datetime import datetime
-from provisioning import register_device, validate_gateway, register_gateway
+from provisioning import register_device, validate_gateway, register_gateway, issue_device_token
 from logger import log_info, log_error
+from rollups import RESOLUTIONS
+from query_engine import GROUP_BY_FIELDS, parse_aggregates
+from storage import create_storage, json_default, is_summary
+from live_stream import LiveHub, KEEPALIVE_SECONDS, record_event
 
 API_KEY = "secretAPIkey"
-PROTECTED_PATHS = ["/ingest"]
+PROTECTED_PATHS = frozenset({"/ingest"})
+MAX_TOKENS_PER_REQUEST = 10000
 MODEL_PATH = "/data/anomaly_model.json"
+MODEL_BINARY_PATH = "/data/anomaly_model.bin"  # same model in the binary format (gateway/model_format.py)
 HISTORICAL_PATH = "/data/historical_data.json"
-TRAINING_WINDOW_SIZE = 50
 AUTO_EXPORT_INTERVAL_SECONDS = 20
-INGEST_DEDUP_MAX = 50000
+RAW_RETENTION_SECONDS = int(os.getenv("RAW_RETENTION_SECONDS", 6 * 3600))
+RETENTION_CHECK_INTERVAL_SECONDS = 60
+INGEST_LOG_SECONDS = 10  # ingest lines are sampled to one per gateway per window
+SUMMARY_FIELDS = ("count", "min", "max", "mean", "m2")
+GATEWAY_EXPIRY_SECONDS = 90  # three missed heartbeats (gateways report every config_check_interval = 30s)
 
-gateway_configs = {"gateway-01": {"batch_size": 50, "max_wait_seconds": 5} }
-gateway_loads = {}
 app = FastAPI(title="IoT Cloud API")
-database = []
-profile_buffers = defaultdict(lambda: deque(maxlen=TRAINING_WINDOW_SIZE))
-last_export_timestamp = 0
-ingested_ids = OrderedDict()
-ingested_lock = threading.Lock()
+# All mutable state lives behind the storage layer (STORAGE_BACKEND=memory|sqlite)
+storage = create_storage()
+# /stream subscribers of this worker; with several workers each one tails the shared database
+live = LiveHub(storage, tail=int(os.getenv("CLOUD_WORKERS", "1")) > 1)
 
 class SensorData(BaseModel):
     model_config = {"extra": "allow"}  # allow replication metadata fields
@@ -36,11 +40,18 @@ class SensorData(BaseModel):
     value: float
     unit: str
     topic: Optional[str] = None
-    messageId: Optional[str] = None  # UUID for deduplication
+    messageId: Optional[str] = None
 
 class IngestPayload(BaseModel):
     gatewayId: str
     data: List[SensorData]
+    # Batch sequence for deduplication (sequences.py): record i is seqStart + i of origin's epoch
+    origin: Optional[str] = None  # sending process, defaults to gatewayId
+    epoch: Optional[int] = None
+    seqStart: Optional[int] = None
+
+class TokenRequest(BaseModel):
+    deviceIds: List[str]
 
 def make_profile_key(record):
     """Build unique profile key for per-sensor-type model lookup"""
@@ -49,17 +60,28 @@ def make_profile_key(record):
     return f"{device_id}::{sensor_type}"
 
 
-def snapshot_training_records():
-    """Get a snapshot of recent records for training, grouped by profile key"""
-    records = []
-    for buffer in profile_buffers.values():
-        records.extend(buffer)
-    return sorted(records, key=lambda x: x.get("timestamp", ""))
+def validate_summary(row):
+    """Coerce a gateway summary's statistics to numbers; raise 422 if they are missing or inconsistent."""
+    try:
+        row["count"] = int(row["count"])
+        for field in SUMMARY_FIELDS[1:]:
+            row[field] = float(row[field])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=422, detail=f"Summary record needs numeric {', '.join(SUMMARY_FIELDS)}")
+    if row["count"] < 1 or row["m2"] < 0 or row["min"] > row["max"]:
+        raise HTTPException(status_code=422, detail="Summary record statistics are inconsistent")
+
+
+def apply_retention(now):
+    """Age raw rows out of the database; their history stays available as rollups"""
+    expired, removed_buckets = storage.apply_retention(now, now - RAW_RETENTION_SECONDS)
+    if expired or removed_buckets:
+        log_info(f"Retention: dropped {expired} raw rows and {removed_buckets} rollup buckets")
 
 @app.middleware("http")
 async def gateway_auth_middleware(request: Request, call_next):
     """Middleware to authenticate gateways on protected endpoints and auto-register new ones."""
-    if any(request.url.path.startswith(p) for p in PROTECTED_PATHS):
+    if request.url.path in PROTECTED_PATHS:
         gateway_id = request.headers.get("gatewayid")
         gateway_secret = request.headers.get("secret")
 
@@ -69,7 +91,7 @@ async def gateway_auth_middleware(request: Request, call_next):
                 register_gateway(gateway_id, gateway_secret)
                 log_info(f"Auto-registered new gateway: {gateway_id}")
             else:
-                log_error(f"Unauthorized access attempt to {request.url.path} by {gateway_id}")
+                log_error(f"Unauthorized access attempt to {request.url.path} by {gateway_id}", key=f"unauthorized:{gateway_id}")
                 return JSONResponse(status_code=401, content={"detail": "Invalid Gateway"})
 
     return await call_next(request)
@@ -77,43 +99,41 @@ async def gateway_auth_middleware(request: Request, call_next):
 @app.post("/ingest")
 def ingest_data(payload: IngestPayload, authorization: str = Header(None)):
     """ Ingest sensor data from gateways, with cloud-side deduplication and OTA config support """
-    global last_export_timestamp
-
     # check for valid API key
     if authorization != f"Bearer {API_KEY}":
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    # Add entries to database (with cloud-side deduplication)
-    accepted = 0
-    duplicates = 0
+    # Add entries to database (storage deduplicates sequenced batches)
+    received_at = time.time()
+    rows = []
     for entry in payload.data:
         row = entry.model_dump()
-
-        # Deduplicate by messageId — handles at-least-once delivery
-        msg_id = row.get("messageId")
-        if msg_id:
-            with ingested_lock:
-                if msg_id in ingested_ids:
-                    duplicates += 1
-                    continue
-                ingested_ids[msg_id] = True
-                while len(ingested_ids) > INGEST_DEDUP_MAX:
-                    ingested_ids.popitem(last=False)
-
         row["profileKey"] = make_profile_key(row)
-        database.append(row)
-        profile_buffers[row["profileKey"]].append(row)
-        accepted += 1
-
-    log_info(f"Received {accepted} records from {payload.gatewayId} ({duplicates} duplicates skipped)")
-    if accepted > 0:
-        log_info(f"  Sample: {payload.data[0].sensorType}")
-    log_info(f"Total stored records: {len(database)}")
-
+        row["receivedAt"] = received_at
+        if is_summary(row):
+            validate_summary(row)
+        rows.append(row)
+    sequence = None
+    if payload.epoch is not None and payload.seqStart is not None:
+        sequence = (payload.origin or payload.gatewayId, payload.epoch, payload.seqStart)
+    accepted_rows, duplicates = storage.ingest(rows, sequence)
+    accepted = len(accepted_rows)
+    live.publish(accepted_rows)
+
+    # One line per gateway per window; the stored total is only counted when the line is written
+    log_info(
+        lambda: f"Received {accepted} records from {payload.gatewayId} ({duplicates} duplicates skipped, "
+                f"{storage.count()} stored in total)",
+        key=f"ingest:{payload.gatewayId}", every=INGEST_LOG_SECONDS
+    )
+
+    # Periodic tasks run in whichever worker claims them first
     now = time.time()
-    if now - last_export_timestamp >= AUTO_EXPORT_INTERVAL_SECONDS:
+    if storage.claim_task("export", AUTO_EXPORT_INTERVAL_SECONDS, now):
         export_data()
-        last_export_timestamp = now
+
+    if storage.claim_task("retention", RETENTION_CHECK_INTERVAL_SECONDS, now):
+        apply_retention(now)
 
     return {
         "status": "ok",
@@ -124,42 +144,165 @@ def ingest_data(payload: IngestPayload, authorization: str = Header(None)):
 @app.post("/devices/register")
 def create_device(gateway_id: str):
     """Register a new device and return its credentials"""
-    device_id, device_secret = register_device(gateway_id)
+    device_id, device_secret, device_token = register_device(gateway_id)
     log_info(f"Device registered: {device_id}")
     return {
         "device_id": device_id,
-        "device_secret": device_secret
+        "device_secret": device_secret,
+        "device_token": device_token
     }
 
+@app.post("/devices/token")
+def create_device_tokens(request: TokenRequest, authorization: str = Header(None)):
+    """Issue signed tokens for existing device IDs: an operator step (mint_tokens.py, the load generator), never called by devices"""
+    if authorization != f"Bearer {API_KEY}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if len(request.deviceIds) > MAX_TOKENS_PER_REQUEST:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_TOKENS_PER_REQUEST} devices per request")
+    revocations = storage.device_revocations(request.deviceIds)
+    refused = sorted(device_id for device_id, (_, reinstated) in revocations.items() if not reinstated)
+    if refused:
+        raise HTTPException(status_code=403, detail=f"Revoked devices (reinstate them first): {', '.join(refused[:20])}")
+    issued_at = int(time.time())
+    tokens = {}
+    for device_id in request.deviceIds:
+        revoked = revocations.get(device_id)
+        # A reinstated device's new token must be dated after the revocation second to verify
+        tokens[device_id] = issue_device_token(device_id, issued_at if revoked is None else max(issued_at, int(revoked[0]) + 1))
+    return {"tokens": tokens}
+
+@app.post("/devices/{device_id}/revoke")
+def revoke_device(device_id: str, authorization: str = Header(None)):
+    """Revoke every token issued to a device so far; gateways pick this up on their next sync"""
+    if authorization != f"Bearer {API_KEY}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    # Whole seconds, the resolution of token issued_at (storage moves a re-revoke past the previous one,
+    # since a reinstated device's tokens may be dated a second ahead)
+    storage.revoke_device(device_id, int(time.time()))
+    log_info(f"Device revoked: {device_id}")
+    return {"status": "revoked", "device_id": device_id}
+
+@app.post("/devices/{device_id}/reinstate")
+def reinstate_device(device_id: str, authorization: str = Header(None)):
+    """Let /devices/token sign new tokens for a revoked device; tokens from before the revocation stay revoked"""
+    if authorization != f"Bearer {API_KEY}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if not storage.reinstate_device(device_id):
+        raise HTTPException(status_code=404, detail="Device is not revoked")
+    log_info(f"Device reinstated: {device_id}")
+    return {"status": "reinstated", "device_id": device_id}
+
+@app.get("/devices/revocations")
+def get_revocations(authorization: str = Header(None), if_none_match: str = Header(None)):
+    """Revocation list for gateways, answering 304 when the gateway already has this version"""
+    if authorization != f"Bearer {API_KEY}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    revoked, version = storage.get_revocations()
+    etag = f'"{version}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content={"revoked": revoked}, headers={"ETag": etag})
+
 @app.get("/data")
 def get_all_data():
     """Retrieve all ingested data"""
+    data = storage.all_rows()
     return {
-        "count": len(database),
-        "data": database
+        "count": len(data),
+        "data": data
     }
 
 @app.get("/export")
 def export_data():
-    def json_serializer(obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        raise TypeError(f"Type {type(obj)} not serializable")
-
-    training_records = snapshot_training_records()
-    temp_path = HISTORICAL_PATH + ".tmp"
+    training_records = storage.training_records()
+    temp_path = f"{HISTORICAL_PATH}.{os.getpid()}.tmp"
     with open(temp_path, "w") as f:
-        json.dump(training_records, f, default=json_serializer)
+        json.dump(training_records, f, default=json_default)
     
     if os.path.exists(temp_path):
         os.replace(temp_path, HISTORICAL_PATH)
 
     return {"status": "exported"}
 
+@app.get("/data/rollup")
+def get_rollup(resolution: str = "1m", profileKey: Optional[str] = None,
+               start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Range query over pre-aggregated 1m/1h buckets (count, min, max, mean, stddev, anomalies)"""
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {list(RESOLUTIONS)}")
+    profiles = storage.rollup_query(
+        resolution,
+        start=start.timestamp() if start else None,
+        end=end.timestamp() if end else None,
+        profile_key=profileKey
+    )
+    return {
+        "resolution": resolution,
+        "count": sum(len(buckets) for buckets in profiles.values()),
+        "profiles": profiles
+    }
+
+@app.get("/query")
+def query_data(start: Optional[datetime] = None, end: Optional[datetime] = None,
+               lastSeconds: Optional[float] = None, deviceId: Optional[str] = None,
+               sensorType: Optional[str] = None, profileKey: Optional[str] = None,
+               anomalyOnly: bool = False, agg: str = "count,avg,min,max",
+               groupBy: Optional[str] = None, bucketSeconds: int = 60,
+               rows: bool = False, limit: int = 1000):
+    """Time-range query with filters and aggregates (avg/min/max/sum/stddev/pNN), or raw rows with rows=true"""
+    try:
+        aggregates = parse_aggregates(agg)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if groupBy is not None and groupBy not in GROUP_BY_FIELDS:
+        raise HTTPException(status_code=400, detail=f"groupBy must be one of {list(GROUP_BY_FIELDS)}")
+    if bucketSeconds <= 0:
+        raise HTTPException(status_code=400, detail="bucketSeconds must be positive")
+
+    filters = {
+        "start": start.timestamp() if start else None,
+        "end": end.timestamp() if end else None,
+        "device_id": deviceId,
+        "sensor_type": sensorType,
+        "profile_key": profileKey,
+        "anomaly_only": anomalyOnly
+    }
+    if lastSeconds is not None:
+        filters["start"] = time.time() - lastSeconds
+
+    if rows:
+        data = storage.query_rows(limit=limit, **filters)
+        return {"count": len(data), "data": data}
+    return storage.query(aggregates=aggregates, group_by=groupBy, bucket_seconds=bucketSeconds, **filters)
+
+@app.get("/stream")
+async def stream_data(request: Request, deviceId: Optional[str] = None, sensorType: Optional[str] = None,
+                      anomalyOnly: bool = False):
+    """Server-Sent Events push of newly ingested records (events: reading, anomaly, summary, dropped)"""
+    subscriber = live.subscribe(device_id=deviceId, sensor_type=sensorType, anomaly_only=anomalyOnly)
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                rows, dropped = await subscriber.next_batch(KEEPALIVE_SECONDS)
+                if not rows:
+                    yield ": keepalive\n\n"
+                    continue
+                chunk = [f"event: dropped\ndata: {json.dumps({'dropped': dropped})}\n\n"] if dropped else []
+                chunk += [f"event: {record_event(row)}\ndata: {json.dumps(row, default=json_default)}\n\n"
+                          for row in rows]
+                yield "".join(chunk)
+        finally:
+            live.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/data/by-type/{sensor_type}")
 def get_data_by_type(sensor_type: str):
     """Retrieve data for a specific sensor type"""
-    filtered = [d for d in database if d.get("sensorType") == sensor_type]
+    filtered = storage.rows_where("sensorType", sensor_type)
     return {
         "sensorType": sensor_type,
         "count": len(filtered),
@@ -169,34 +312,38 @@ def get_data_by_type(sensor_type: str):
 @app.get("/data/by-device/{device_id}")
 def get_data_by_device(device_id: str):
     """Retrieve data for a specific device"""
-    filtered = [d for d in database if d.get("deviceId") == device_id]
+    filtered = storage.rows_where("deviceId", device_id)
     return {
         "deviceId": device_id,
         "count": len(filtered),
         "data": filtered
     }
 
+def config_etag(gateway_id, config):
+    """Build the ETag that identifies one version of a gateway's config"""
+    return f'"{gateway_id}-{config.get("config_version", "0")}"'
+
 @app.get("/config/{gateway_id}")
-def get_config(gateway_id: str, authorization: str = Header(None)):
-    """Retrieve configuration for a gateway"""
+def get_config(gateway_id: str, authorization: str = Header(None), if_none_match: str = Header(None)):
+    """Retrieve configuration for a gateway, answering 304 when the gateway already has this version"""
     if authorization != f"Bearer {API_KEY}":
         raise HTTPException(401, "Unauthorized")
-    return {"config": gateway_configs.get(gateway_id, {})}
+    config = storage.get_config(gateway_id)
+    etag = config_etag(gateway_id, config)
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content={"config": config}, headers={"ETag": etag})
 
 @app.post("/config/{gateway_id}")
 def update_config(gateway_id: str, config_data: Dict[str, Any], authorization: str = Header(None)):
-    """Update configuration for a gateway"""
+    """Update configuration for a gateway and bump its config version"""
     if authorization != f"Bearer {API_KEY}":
         raise HTTPException(status_code=401, detail="Unauthorized")
     
-    # Old values stay same
-    if gateway_id not in gateway_configs:
-        gateway_configs[gateway_id] = {}
+    config = storage.update_config(gateway_id, config_data)
     
-    gateway_configs[gateway_id].update(config_data) 
-    
-    log_info(f"OTA Config updated for {gateway_id}: {gateway_configs[gateway_id]}")
-    return {"status": "updated", "config": gateway_configs[gateway_id]}
+    log_info(f"OTA Config updated for {gateway_id}: {config}")
+    return {"status": "updated", "config": config}
 
 @app.post("/heartbeat")
 def heartbeat(payload: dict, authorization: str = Header(None)):
@@ -207,21 +354,27 @@ def heartbeat(payload: dict, authorization: str = Header(None)):
     gw_id = payload.get("gatewayId")
     msg_rate = payload.get("message_rate", 0)
     records_sent = payload.get("records_sent", 0)
+    shed_messages = payload.get("shed_messages", 0)
     
     # Update gateway load tracking
-    gateway_loads[gw_id] = {
-        "status": "alive",
+    storage.record_heartbeat(gw_id, {
+        "status": payload.get("status", "alive"),  # "standby" for warm-pool gateways not yet in service
         "message_rate": msg_rate,
         "records_sent": records_sent,
+        "admitted_messages": payload.get("admitted_messages", 0),
+        "shed_messages": shed_messages,
+        "unchecked_messages": payload.get("unchecked_messages", 0),
+        "shed_by_type": payload.get("shed_by_type", {}),
+        "tracked_devices": payload.get("tracked_devices", 0),
+        "lane_latency": payload.get("lane_latency", {}),
         "last_heartbeat": datetime.now().isoformat()
-    }
+    })
     
     # Auto-register gateway config if new
-    if gw_id not in gateway_configs:
-        gateway_configs[gw_id] = {"batch_size": 50, "max_wait_seconds": 5}
+    if storage.ensure_config(gw_id):
         register_gateway(gw_id)
     
-    log_info(f"Heartbeat from {gw_id} (msg_rate={msg_rate}, records_sent={records_sent})")
+    log_info(f"Heartbeat from {gw_id} (msg_rate={msg_rate}, records_sent={records_sent}, shed={shed_messages})")
     return {"ok": True}
 
 
@@ -245,29 +398,63 @@ def get_ml_model(authorization: str = Header(None)):
         "model": model_artifact
     }
 
+@app.get("/ml/model.bin")
+def get_ml_model_binary(authorization: str = Header(None), if_none_match: str = Header(None)):
+    """Binary model artifact, served as the trainer wrote it; 204 until the first model exists"""
+    if authorization != f"Bearer {API_KEY}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        with open(MODEL_BINARY_PATH, "rb") as f:
+            stat = os.fstat(f.fileno())
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+            if if_none_match == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            content = f.read()
+    except FileNotFoundError:
+        return Response(status_code=204)
+
+    return Response(content=content, media_type="application/octet-stream", headers={"ETag": etag})
+
 @app.delete("/gateway/{gateway_id}")
 def remove_gateway(gateway_id: str, authorization: str = Header(None)):
     """Remove a stopped gateway from tracking"""
     if authorization != f"Bearer {API_KEY}":
         raise HTTPException(status_code=401, detail="Unauthorized")
     
-    removed = gateway_loads.pop(gateway_id, None)
+    removed = storage.remove_gateway(gateway_id)
     if removed:
         log_info(f"Gateway {gateway_id} deregistered from tracking")
         return {"status": "removed", "gateway_id": gateway_id}
     return {"status": "not_found", "gateway_id": gateway_id}
 
 
+def gateway_state(info, now):
+    """Reported status, or "dead" once the gateway has missed heartbeats for GATEWAY_EXPIRY_SECONDS"""
+    try:
+        age = (now - datetime.fromisoformat(info.get("last_heartbeat", ""))).total_seconds()
+    except ValueError:
+        return info.get("status", "unknown")
+    return "dead" if age > GATEWAY_EXPIRY_SECONDS else info.get("status", "unknown")
+
+
 @app.get("/gateway-status")
 def get_gateway_status():
-    """Returns load info for all gateways - used by autoscaler"""
+    """Returns load info for all gateways - used by autoscaler and to seed gateway gossip membership"""
+    gateway_loads = storage.get_gateway_loads()
+    now = datetime.now()
     total_records = sum(info.get("records_sent", 0) for info in gateway_loads.values())
     return {
         "gateways": {
             gw_id: {
                 "message_rate": info.get("message_rate", 0),
                 "records_sent": info.get("records_sent", 0),
-                "status": info.get("status", "unknown"),
+                "admitted_messages": info.get("admitted_messages", 0),
+                "shed_messages": info.get("shed_messages", 0),
+                "unchecked_messages": info.get("unchecked_messages", 0),
+                "tracked_devices": info.get("tracked_devices", 0),
+                "lane_latency": info.get("lane_latency", {}),
+                "status": gateway_state(info, now),
                 "last_heartbeat": info.get("last_heartbeat", "")
             }
             for gw_id, info in gateway_loads.items()
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+from collections import deque
+from storage import is_summary
+
+# Live push of ingested records to /stream subscribers (Server-Sent Events).
+#
+# Every subscriber has its own bounded queue. Records are matched against the
+# subscriber's filters on publish; when a consumer falls behind, its oldest
+# queued records are dropped (and counted) instead of growing memory or
+# slowing ingest down.
+#
+# With one worker process, ingest publishes accepted records directly. With
+# several (CLOUD_WORKERS > 1, SQLite storage) a subscriber's worker only sees
+# its own share of the ingest, so each worker instead tails the database for
+# rows stored by any worker while it has subscribers. Only SQLite storage can
+# be tailed; memory storage lives in one process, so it always publishes.
+
+STREAM_QUEUE_SIZE = 1000  # records buffered per subscriber before the oldest are dropped
+KEEPALIVE_SECONDS = 15
+TAIL_INTERVAL_SECONDS = 0.1
+TAIL_BATCH = 1000
+
+
+def record_event(row):
+    """SSE event name for a stored record"""
+    if is_summary(row):
+        return "summary"
+    return "anomaly" if row.get("isAnomaly") else "reading"
+
+
+class Subscriber:
+    """One /stream client: its filters and bounded queue, drained on the event loop."""
+
+    def __init__(self, loop, device_id=None, sensor_type=None, anomaly_only=False, maxsize=STREAM_QUEUE_SIZE):
+        self.device_id = device_id
+        self.sensor_type = sensor_type
+        self.anomaly_only = anomaly_only
+        self.dropped = 0
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._queue = deque(maxlen=maxsize)
+        self._lock = threading.Lock()
+        self._woken = False
+
+    def matches(self, row):
+        if self.anomaly_only and not row.get("isAnomaly"):
+            return False
+        if self.device_id is not None and row.get("deviceId") != self.device_id:
+            return False
+        return self.sensor_type is None or row.get("sensorType") == self.sensor_type
+
+    def offer(self, rows):
+        """Queue the matching rows; safe to call from any thread."""
+        with self._lock:
+            for row in rows:
+                if self.matches(row):
+                    if len(self._queue) == self._queue.maxlen:
+                        self.dropped += 1
+                    self._queue.append(row)
+            if not self._queue or self._woken:
+                return
+            self._woken = True
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def next_batch(self, timeout):
+        """Wait up to timeout for queued rows. Returns (rows, dropped since last call); ([], 0) on timeout."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return [], 0
+        self._ready.clear()
+        with self._lock:
+            rows = list(self._queue)
+            self._queue.clear()
+            dropped, self.dropped = self.dropped, 0
+            self._woken = False
+        return rows, dropped
+
+
+class LiveHub:
+    """Fans accepted records out to the subscribers of this worker process."""
+
+    def __init__(self, storage, tail=False):
+        self.storage = storage
+        self.tail = tail and hasattr(storage, "rows_after")
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._tailer = None
+
+    def subscribe(self, **filters):
+        subscriber = Subscriber(asyncio.get_running_loop(), **filters)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        if self.tail and (self._tailer is None or self._tailer.done()):
+            self._tailer = asyncio.get_running_loop().create_task(self._tail_storage())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, rows):
+        """Offer accepted rows to every subscriber (ingest path; a no-op when tailing or idle)."""
+        if self.tail or not rows:
+            return
+        self._fan_out(rows)
+
+    def _fan_out(self, rows):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(rows)
+
+    async def _tail_storage(self):
+        """Poll storage for rows stored by any worker while this worker has subscribers"""
+        cursor = await asyncio.to_thread(self.storage.live_cursor)
+        while self.subscriber_count():
+            rows, cursor = await asyncio.to_thread(self.storage.rows_after, cursor, TAIL_BATCH)
+            if rows:
+                self._fan_out(rows)
+            if len(rows) < TAIL_BATCH:
+                await asyncio.sleep(TAIL_INTERVAL_SECONDS)
@@ -1,12 +1,29 @@
+import hashlib
+import hmac
+import os
+import time
 import uuid
 
+# Device tokens: "v1.<issued_at>.<hex mac>", mac = HMAC-SHA256(key, "<deviceId>:<issued_at>").
+# Gateways hold the same key and verify tokens without calling back to the cloud.
+DEVICE_TOKEN_KEY = os.getenv("DEVICE_TOKEN_KEY", "").encode()
+if not DEVICE_TOKEN_KEY:
+    raise RuntimeError("DEVICE_TOKEN_KEY is not set (the device token key shared with the gateways)")
+TOKEN_VERSION = "v1"
+
 devices = {}
 gateways = {
     "gateway-01": "gateway-secret"
 }
 
+def issue_device_token(device_id: str, issued_at=None):
+    """Sign a device token for device_id."""
+    issued_at = int(time.time()) if issued_at is None else int(issued_at)
+    mac = hmac.new(DEVICE_TOKEN_KEY, f"{device_id}:{issued_at}".encode(), hashlib.sha256).hexdigest()
+    return f"{TOKEN_VERSION}.{issued_at}.{mac}"
+
 def register_device(gateway_id: str):
-    """Register a new device under the specified gateway and return its credentials."""
+    """Register a new device under the specified gateway and return its credentials and token."""
     device_id = str(uuid.uuid4())
     device_secret = str(uuid.uuid4())
 
@@ -16,13 +33,14 @@ def register_device(gateway_id: str):
         "status": "active"
     }
 
-    return device_id, device_secret
+    return device_id, device_secret, issue_device_token(device_id)
 
 def validate_gateway(gateway_id, gateway_secret):
     """Check if gateway credentials are valid."""
     if not gateway_id or not gateway_secret:
         return False
-    return gateways.get(gateway_id) == gateway_secret
+    expected = gateways.get(gateway_id)
+    return expected is not None and hmac.compare_digest(expected, gateway_secret)
 
 def register_gateway(gateway_id: str, secret: str = "gateway-secret"):
     """Auto-register a new gateway"""
@@ -0,0 +1,243 @@
+import threading
+import numpy as np
+
+# Columnar store for time-range / aggregate queries over raw readings.
+# Rows are appended to an open chunk; full chunks are sorted by timestamp and
+# sealed into NumPy arrays with min/max timestamps so range scans can skip them.
+
+CHUNK_ROWS = 8192
+GROUP_BY_FIELDS = ("profile", "device", "sensorType", "bucket")
+DEFAULT_AGGREGATES = ("count", "avg", "min", "max")
+
+
+class StringTable:
+    """Dictionary encoding: string <-> dense int32 code."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class Chunk:
+    """Time-sorted column arrays for up to CHUNK_ROWS readings."""
+
+    __slots__ = ("ts", "value", "anomaly", "device", "sensor_type", "profile", "min_ts", "max_ts")
+
+    def __init__(self, ts, value, anomaly, device, sensor_type, profile):
+        order = np.argsort(ts, kind="stable")
+        self.ts = ts[order]
+        self.value = value[order]
+        self.anomaly = anomaly[order]
+        self.device = device[order]
+        self.sensor_type = sensor_type[order]
+        self.profile = profile[order]
+        self.min_ts = float(self.ts[0]) if len(self.ts) else 0.0
+        self.max_ts = float(self.ts[-1]) if len(self.ts) else 0.0
+
+    def __len__(self):
+        return len(self.ts)
+
+
+class ColumnStore:
+    """Append-only column chunks with vectorized filtering and aggregation."""
+
+    def __init__(self, chunk_rows=CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+        self._chunks = []
+        self._open = ([], [], [], [], [], [])  # ts, value, anomaly, device, sensor_type, profile
+        self.devices = StringTable()
+        self.sensor_types = StringTable()
+        self.profiles = StringTable()
+
+    def append(self, ts, value, is_anomaly, device_id, sensor_type, profile_key):
+        with self._lock:
+            columns = self._open
+            columns[0].append(ts)
+            columns[1].append(value)
+            columns[2].append(is_anomaly)
+            columns[3].append(self.devices.encode(device_id))
+            columns[4].append(self.sensor_types.encode(sensor_type))
+            columns[5].append(self.profiles.encode(profile_key))
+            if len(columns[0]) >= self.chunk_rows:
+                self._chunks.append(self._build_chunk(columns))
+                self._open = ([], [], [], [], [], [])
+
+    @staticmethod
+    def _build_chunk(columns):
+        return Chunk(
+            np.asarray(columns[0], dtype=np.float64),
+            np.asarray(columns[1], dtype=np.float64),
+            np.asarray(columns[2], dtype=bool),
+            np.asarray(columns[3], dtype=np.int32),
+            np.asarray(columns[4], dtype=np.int32),
+            np.asarray(columns[5], dtype=np.int32),
+        )
+
+    def expire(self, cutoff):
+        """Drop sealed chunks whose newest reading is older than cutoff. Returns rows removed."""
+        with self._lock:
+            keep = [c for c in self._chunks if c.max_ts >= cutoff]
+            removed = sum(len(c) for c in self._chunks) - sum(len(c) for c in keep)
+            self._chunks = keep
+        return removed
+
+    def _snapshot(self):
+        """Sealed chunks plus the open chunk sealed into a temporary copy."""
+        with self._lock:
+            chunks = list(self._chunks)
+            if self._open[0]:
+                chunks.append(self._build_chunk(self._open))
+        return chunks
+
+    def scan(self, start=None, end=None, device_id=None, sensor_type=None,
+             profile_key=None, anomaly_only=False):
+        """Return matching (ts, value, anomaly, device, sensor_type, profile) column arrays."""
+        filters = []
+        for table, wanted, column in (
+            (self.devices, device_id, "device"),
+            (self.sensor_types, sensor_type, "sensor_type"),
+            (self.profiles, profile_key, "profile"),
+        ):
+            if wanted is None:
+                continue
+            code = table.codes.get(wanted)
+            if code is None:
+                return _empty_columns()
+            filters.append((column, code))
+
+        parts = []
+        for chunk in self._snapshot():
+            if start is not None and chunk.max_ts < start:
+                continue
+            if end is not None and chunk.min_ts >= end:
+                continue
+
+            lo = 0 if start is None else int(np.searchsorted(chunk.ts, start, side="left"))
+            hi = len(chunk) if end is None else int(np.searchsorted(chunk.ts, end, side="left"))
+            if lo >= hi:
+                continue
+
+            mask = np.ones(hi - lo, dtype=bool)
+            for column, code in filters:
+                mask &= getattr(chunk, column)[lo:hi] == code
+            if anomaly_only:
+                mask &= chunk.anomaly[lo:hi]
+            if not mask.any():
+                continue
+
+            parts.append(tuple(
+                getattr(chunk, column)[lo:hi][mask]
+                for column in ("ts", "value", "anomaly", "device", "sensor_type", "profile")
+            ))
+
+        if not parts:
+            return _empty_columns()
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def query(self, aggregates=DEFAULT_AGGREGATES, group_by=None, bucket_seconds=60, **filters):
+        """Aggregate matching readings, optionally grouped by profile/device/sensorType/time bucket."""
+        ts, value, anomaly, device, sensor_type, profile = self.scan(**filters)
+        labels = {
+            "profile": (profile, self.profiles.values),
+            "device": (device, self.devices.values),
+            "sensorType": (sensor_type, self.sensor_types.values),
+        }
+        return group_aggregate(ts, value, anomaly, labels, aggregates, group_by, bucket_seconds)
+
+    def rows(self, limit=1000, **filters):
+        """Return up to `limit` newest matching readings as dicts."""
+        ts, value, anomaly, device, sensor_type, profile = self.scan(**filters)
+        order = np.argsort(ts, kind="stable")[::-1][:limit]
+        return [
+            {
+                "timestamp": float(ts[i]),
+                "deviceId": self.devices.values[device[i]],
+                "sensorType": self.sensor_types.values[sensor_type[i]],
+                "profileKey": self.profiles.values[profile[i]],
+                "value": float(value[i]),
+                "isAnomaly": bool(anomaly[i])
+            }
+            for i in order
+        ]
+
+
+def group_aggregate(ts, value, anomaly, labels, aggregates, group_by=None, bucket_seconds=60):
+    """Group scanned columns and aggregate each group.
+
+    labels maps each groupable field to (int code array, list of code -> label).
+    """
+    if group_by is None:
+        return {"count": int(len(value)), "groups": [dict(aggregate(value, anomaly, aggregates))]}
+
+    if group_by == "bucket":
+        keys = np.floor(ts / bucket_seconds) * bucket_seconds
+        names = None
+    else:
+        keys, names = labels[group_by]
+
+    groups = []
+    if len(value):
+        order = np.argsort(keys, kind="stable")
+        boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+        for idx in np.split(order, boundaries):
+            key = keys[idx[0]]
+            group = {"key": names[int(key)] if names is not None else float(key)}
+            group.update(aggregate(value[idx], anomaly[idx], aggregates))
+            groups.append(group)
+
+    return {"count": int(len(value)), "groups": groups}
+
+
+def _empty_columns():
+    return (
+        np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64), np.empty(0, dtype=bool),
+        np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32),
+    )
+
+
+def parse_aggregates(spec):
+    """Parse a comma-separated aggregate list, raising ValueError on unknown names."""
+    names = tuple(name.strip() for name in spec.split(",") if name.strip())
+    for name in names:
+        if name in ("count", "anomalies", "sum", "avg", "min", "max", "stddev"):
+            continue
+        if name.startswith("p") and name[1:].replace(".", "", 1).isdigit() and 0 <= float(name[1:]) <= 100:
+            continue
+        raise ValueError(f"Unknown aggregate: {name}")
+    return names or DEFAULT_AGGREGATES
+
+
+def aggregate(values, anomalies, aggregates):
+    """Compute named aggregates (count, sum, avg, min, max, stddev, anomalies, pNN) over one group."""
+    result = {}
+    empty = len(values) == 0
+    for name in aggregates:
+        if name == "count":
+            result[name] = int(len(values))
+        elif name == "anomalies":
+            result[name] = int(np.count_nonzero(anomalies))
+        elif empty:
+            result[name] = None
+        elif name == "sum":
+            result[name] = float(values.sum())
+        elif name == "avg":
+            result[name] = float(values.mean())
+        elif name == "min":
+            result[name] = float(values.min())
+        elif name == "max":
+            result[name] = float(values.max())
+        elif name == "stddev":
+            result[name] = float(values.std())
+        elif name.startswith("p") and name[1:].replace(".", "", 1).isdigit():
+            result[name] = float(np.percentile(values, float(name[1:])))
+        else:
+            raise ValueError(f"Unknown aggregate: {name}")
+    return result
@@ -0,0 +1,125 @@
+import math
+import threading
+from collections import defaultdict
+
+# Continuous aggregation: per-profileKey rollup buckets updated on ingest
+
+RESOLUTIONS = {"1m": 60, "1h": 3600}
+ROLLUP_RETENTION_SECONDS = {"1m": 7 * 24 * 3600, "1h": 90 * 24 * 3600}
+
+
+class RollupBucket:
+    """Running count/min/max/mean/M2 (Welford) plus anomaly count for one time bucket."""
+
+    __slots__ = ("count", "min", "max", "mean", "m2", "anomalies")
+
+    def __init__(self):
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.anomalies = 0
+
+    def add(self, value, is_anomaly=False):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if is_anomaly:
+            self.anomalies += 1
+
+    def merge(self, count, min_value, max_value, mean, m2, anomalies=0):
+        """Merge pre-aggregated statistics (Chan et al. parallel variance)."""
+        if count <= 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, min_value)
+        self.max = max(self.max, max_value)
+        self.anomalies += anomalies
+
+    def to_dict(self, bucket_start, resolution):
+        return {
+            "bucketStart": bucket_start,
+            "resolution": resolution,
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "stddev": math.sqrt(self.m2 / self.count) if self.count else 0.0,
+            "anomalies": self.anomalies
+        }
+
+
+class RollupStore:
+    """1m/1h rollups per profileKey, keyed by bucket start (epoch seconds)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # resolution -> profileKey -> bucket_start -> RollupBucket
+        self._buckets = {res: defaultdict(dict) for res in RESOLUTIONS}
+
+    def _bucket(self, resolution, profile_key, ts):
+        """Get or create the bucket containing ts. Must hold _lock."""
+        width = RESOLUTIONS[resolution]
+        start = int(ts // width) * width
+        buckets = self._buckets[resolution][profile_key]
+        bucket = buckets.get(start)
+        if bucket is None:
+            bucket = buckets[start] = RollupBucket()
+        return bucket
+
+    def add(self, profile_key, ts, value, is_anomaly=False):
+        """Fold one raw reading into every resolution."""
+        with self._lock:
+            for resolution in RESOLUTIONS:
+                self._bucket(resolution, profile_key, ts).add(value, is_anomaly)
+
+    def merge(self, profile_key, ts, count, min_value, max_value, mean, m2, anomalies=0):
+        """Fold a pre-aggregated window (e.g. a gateway summary starting at ts) into every resolution."""
+        with self._lock:
+            for resolution in RESOLUTIONS:
+                self._bucket(resolution, profile_key, ts).merge(count, min_value, max_value, mean, m2, anomalies)
+
+    def query(self, resolution, start=None, end=None, profile_key=None):
+        """Return {profileKey: [bucket dicts]} for buckets starting in [start, end)."""
+        result = {}
+        with self._lock:
+            profiles = self._buckets[resolution]
+            keys = [profile_key] if profile_key is not None else list(profiles)
+            for key in keys:
+                buckets = profiles.get(key)
+                if not buckets:
+                    continue
+                rows = [
+                    bucket.to_dict(bucket_start, resolution)
+                    for bucket_start, bucket in buckets.items()
+                    if (start is None or bucket_start >= start) and (end is None or bucket_start < end)
+                ]
+                if rows:
+                    rows.sort(key=lambda r: r["bucketStart"])
+                    result[key] = rows
+        return result
+
+    def expire(self, now):
+        """Drop buckets older than their resolution's retention. Returns number removed."""
+        removed = 0
+        with self._lock:
+            for resolution, profiles in self._buckets.items():
+                cutoff = now - ROLLUP_RETENTION_SECONDS[resolution]
+                for key in list(profiles):
+                    buckets = profiles[key]
+                    for bucket_start in [b for b in buckets if b < cutoff]:
+                        del buckets[bucket_start]
+                        removed += 1
+                    if not buckets:
+                        del profiles[key]
+        return removed
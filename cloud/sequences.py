@@ -0,0 +1,101 @@
+import bisect
+import json
+
+# Batch-level ingest deduplication. Gateways number the records they send per
+# origin (a gateway process) and run (epoch), and every batch carries
+# (origin, epoch, seqStart); record i of the batch has sequence seqStart + i.
+# For each origin and epoch the cloud keeps the highest sequence accepted and
+# the gaps below it that have not arrived yet (batches sent concurrently or
+# retried arrive out of order). A record is new if it is above the high-water
+# mark or inside a gap, so state per origin is bounded by MAX_GAPS instead of
+# growing with every message ID.
+#
+# Epochs are the gateway run's start time in milliseconds, so the retained
+# epochs of an origin are its latest runs by value. A batch from an epoch older
+# than all of them is a leftover of a run whose window is gone; it counts as a
+# duplicate instead of opening a window that would push out a live one.
+
+MAX_GAPS = 1024  # per origin epoch; past this the oldest gaps are given up (late records count as duplicates)
+EPOCHS_PER_ORIGIN = 2  # a restarted gateway's previous run may still have batches in flight
+
+
+def expired_epoch(retained, epoch):
+    """True if epoch is older than every one of an origin's retained epochs and there is no room for it."""
+    return len(retained) >= EPOCHS_PER_ORIGIN and epoch < min(retained)
+
+
+class SequenceWindow:
+    """High-water mark and the missing ranges below it for one origin epoch."""
+
+    __slots__ = ("hwm", "gaps")
+
+    def __init__(self, hwm=0, gaps=()):
+        self.hwm = hwm
+        self.gaps = [tuple(gap) for gap in gaps]  # sorted, disjoint (first, last) ranges
+
+    def admit(self, first, last):
+        """Mark first..last as received. Returns the sub-ranges that were not received before."""
+        accepted = []
+        hwm = self.hwm
+        if first <= hwm:
+            # Below the mark only what falls inside a gap is new
+            end = min(last, hwm)
+            start = max(bisect.bisect_right(self.gaps, (first, float("inf"))) - 1, 0)
+            stop = start
+            kept = []
+            while stop < len(self.gaps) and self.gaps[stop][0] <= end:
+                gap_first, gap_last = self.gaps[stop]
+                lo, hi = max(gap_first, first), min(gap_last, end)
+                if lo > hi:
+                    kept.append((gap_first, gap_last))
+                else:
+                    accepted.append((lo, hi))
+                    if gap_first < lo:
+                        kept.append((gap_first, lo - 1))
+                    if hi < gap_last:
+                        kept.append((hi + 1, gap_last))
+                stop += 1
+            self.gaps[start:stop] = kept
+        if last > hwm:
+            lo = max(first, hwm + 1)
+            if lo > hwm + 1:
+                self.gaps.append((hwm + 1, lo - 1))
+                if len(self.gaps) > MAX_GAPS:
+                    del self.gaps[:len(self.gaps) - MAX_GAPS]
+            accepted.append((lo, last))
+            self.hwm = last
+        return accepted
+
+    def to_json(self):
+        return json.dumps([self.hwm, self.gaps])
+
+    @classmethod
+    def from_json(cls, text):
+        hwm, gaps = json.loads(text)
+        return cls(hwm, gaps)
+
+
+def accepted_rows(rows, seq_start, ranges):
+    """The rows (record i has sequence seq_start + i) whose sequence falls in one of ranges."""
+    if len(ranges) == 1 and ranges[0] == (seq_start, seq_start + len(rows) - 1):
+        return rows
+    return [row for i, row in enumerate(rows, seq_start) if any(lo <= i <= hi for lo, hi in ranges)]
+
+
+class SequenceTracker:
+    """SequenceWindows of the latest EPOCHS_PER_ORIGIN epochs of every origin (in-process)."""
+
+    def __init__(self):
+        self._origins = {}  # origin -> {epoch: SequenceWindow}
+
+    def window(self, origin, epoch):
+        """The epoch's window, or None if the epoch has expired (its batches are all duplicates)."""
+        epochs = self._origins.setdefault(origin, {})
+        window = epochs.get(epoch)
+        if window is None:
+            if expired_epoch(epochs, epoch):
+                return None
+            window = epochs[epoch] = SequenceWindow()
+            while len(epochs) > EPOCHS_PER_ORIGIN:
+                del epochs[min(epochs)]
+        return window
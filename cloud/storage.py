@@ -0,0 +1,633 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from rollups import RollupStore, RollupBucket, RESOLUTIONS, ROLLUP_RETENTION_SECONDS
+from query_engine import ColumnStore, group_aggregate, DEFAULT_AGGREGATES
+from training_windows import TrainingWindows, SUMMARY_RECORD_TYPE
+from sequences import SequenceTracker, SequenceWindow, EPOCHS_PER_ORIGIN, accepted_rows, expired_epoch
+
+# Storage layer for cloud API state. MemoryStorage keeps everything in process
+# (single uvicorn worker); SQLiteStorage keeps it in a WAL-mode SQLite file so
+# several uvicorn worker processes can share ingest, dedup and config state.
+# Dedup is per batch: see sequences.py.
+
+TRAINING_WINDOW_SIZE = 50
+DEFAULT_GATEWAY_CONFIG = {"batch_size": 50, "max_wait_seconds": 5, "config_version": "1"}
+SQLITE_PATH = os.getenv("SQLITE_PATH", "/data/cloud.db")
+SQLITE_BUSY_TIMEOUT_MS = 10000
+
+
+def json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def is_summary(row):
+    return row.get("recordType") == SUMMARY_RECORD_TYPE
+
+
+def revocation_version(revoked):
+    """Version string for a revocation list: changes whenever a device is added or re-revoked."""
+    return f"{len(revoked)}-{sum(revoked.values()):.0f}"
+
+
+def bump_config(config, config_data):
+    """Apply an OTA config update and bump its version"""
+    config_data = dict(config_data)
+    config_data.pop("config_version", None)
+    config.update(config_data)
+    config["config_version"] = str(int(config.get("config_version", "0")) + 1)
+    return config
+
+
+class MemoryStorage:
+    """In-process state: only correct with a single uvicorn worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.database = []
+        self.summaries = []
+        self.training = TrainingWindows(TRAINING_WINDOW_SIZE)
+        self.sequences = SequenceTracker()
+        self.gateway_configs = {"gateway-01": dict(DEFAULT_GATEWAY_CONFIG)}
+        self.gateway_loads = {}
+        self.revoked_devices = {}
+        self.reinstated_devices = set()
+        self.rollups = RollupStore()
+        self.columns = ColumnStore()
+        self._task_runs = {}
+
+    def ingest(self, rows, sequence=None):
+        """Store rows that were not seen before. Returns (accepted rows, duplicate count).
+
+        sequence is the batch's (origin, epoch, seqStart); without it every row is accepted.
+        """
+        accepted = []
+        duplicates = 0
+        if sequence is not None and rows:
+            # Deduplicate by sequence number — handles at-least-once delivery
+            origin, epoch, seq_start = sequence
+            with self._lock:
+                window = self.sequences.window(origin, epoch)
+                ranges = [] if window is None else window.admit(seq_start, seq_start + len(rows) - 1)
+            new_rows = accepted_rows(rows, seq_start, ranges)
+            duplicates = len(rows) - len(new_rows)
+            rows = new_rows
+
+        for row in rows:
+            ts = row["timestamp"].timestamp()
+            if is_summary(row):
+                # Summaries feed rollups and training only; raw-reading views stay raw
+                self.training.add(row["profileKey"], ts, row["mean"], row["count"], row["m2"])
+                with self._lock:  # apply_retention rebuilds the list under it
+                    self.summaries.append(row)
+                self.rollups.merge(row["profileKey"], ts, row["count"], row["min"], row["max"], row["mean"], row["m2"])
+                accepted.append(row)
+                continue
+
+            self.training.add(row["profileKey"], ts, row["value"])
+            with self._lock:
+                self.database.append(row)
+            is_anomaly = bool(row.get("isAnomaly"))
+            self.rollups.add(row["profileKey"], ts, row["value"], is_anomaly)
+            self.columns.append(ts, row["value"], is_anomaly, row["deviceId"], row["sensorType"], row["profileKey"])
+            accepted.append(row)
+        return accepted, duplicates
+
+    def count(self):
+        return len(self.database)
+
+    def all_rows(self):
+        return self.database
+
+    def rows_where(self, field, value):
+        return [d for d in self.database if d.get(field) == value]
+
+    def training_records(self):
+        """Training window of every profile key as one summary record (count/mean/m2), oldest first"""
+        return self.training.records()
+
+    def apply_retention(self, now, raw_cutoff):
+        """Age out raw rows older than raw_cutoff and expired rollups. Returns (rows, buckets) removed."""
+        with self._lock:
+            kept = [row for row in self.database if row["timestamp"].timestamp() >= raw_cutoff]
+            expired = len(self.database) - len(kept)
+            if expired:
+                self.database[:] = kept
+            kept = [row for row in self.summaries if row["timestamp"].timestamp() >= raw_cutoff]
+            expired += len(self.summaries) - len(kept)
+            self.summaries[:] = kept
+        self.columns.expire(raw_cutoff)
+        return expired, self.rollups.expire(now)
+
+    def rollup_query(self, resolution, start=None, end=None, profile_key=None):
+        return self.rollups.query(resolution, start=start, end=end, profile_key=profile_key)
+
+    def query(self, aggregates=DEFAULT_AGGREGATES, group_by=None, bucket_seconds=60, **filters):
+        return self.columns.query(aggregates=aggregates, group_by=group_by, bucket_seconds=bucket_seconds, **filters)
+
+    def query_rows(self, limit=1000, **filters):
+        return self.columns.rows(limit=limit, **filters)
+
+    def get_config(self, gateway_id):
+        return dict(self.gateway_configs.get(gateway_id, {}))
+
+    def update_config(self, gateway_id, config_data):
+        with self._lock:
+            # Old values stay same
+            config = self.gateway_configs.setdefault(gateway_id, {"config_version": "0"})
+            return dict(bump_config(config, config_data))
+
+    def ensure_config(self, gateway_id):
+        """Create the default config for a new gateway. Returns True if it was created."""
+        with self._lock:
+            if gateway_id in self.gateway_configs:
+                return False
+            self.gateway_configs[gateway_id] = dict(DEFAULT_GATEWAY_CONFIG)
+            return True
+
+    def record_heartbeat(self, gateway_id, info):
+        self.gateway_loads[gateway_id] = info
+
+    def get_gateway_loads(self):
+        return dict(self.gateway_loads)
+
+    def remove_gateway(self, gateway_id):
+        return self.gateway_loads.pop(gateway_id, None)
+
+    def revoke_device(self, device_id, revoked_at):
+        """Revoke a device's tokens up to revoked_at, which a re-revoke moves past the previous revocation."""
+        with self._lock:
+            previous = self.revoked_devices.get(device_id)
+            self.revoked_devices[device_id] = revoked_at if previous is None else max(revoked_at, previous + 1)
+            self.reinstated_devices.discard(device_id)
+
+    def reinstate_device(self, device_id):
+        """Allow new tokens for a revoked device (its old ones stay revoked). False if it was not revoked."""
+        with self._lock:
+            if device_id not in self.revoked_devices:
+                return False
+            self.reinstated_devices.add(device_id)
+            return True
+
+    def device_revocations(self, device_ids):
+        """{deviceId: (revoked_at, reinstated)} for the given devices that were ever revoked."""
+        with self._lock:
+            return {device_id: (self.revoked_devices[device_id], device_id in self.reinstated_devices)
+                    for device_id in device_ids if device_id in self.revoked_devices}
+
+    def get_revocations(self):
+        """Revoked devices as {deviceId: revoked_at} plus the list's version.
+
+        Reinstated devices stay on the list: their tokens from before the revocation are still dead.
+        """
+        revoked = dict(self.revoked_devices)
+        return revoked, revocation_version(revoked)
+
+    def claim_task(self, name, interval, now):
+        """Return True if periodic task `name` is due and this caller should run it."""
+        with self._lock:
+            if now - self._task_runs.get(name, 0) < interval:
+                return False
+            self._task_runs[name] = now
+            return True
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    device_id TEXT NOT NULL,
+    sensor_type TEXT NOT NULL,
+    profile_key TEXT NOT NULL,
+    value REAL NOT NULL,
+    is_anomaly INTEGER NOT NULL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts);
+CREATE INDEX IF NOT EXISTS readings_profile ON readings (profile_key, id);
+CREATE INDEX IF NOT EXISTS readings_device ON readings (device_id, ts);
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    profile_key TEXT NOT NULL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS summaries_ts ON summaries (ts);
+DROP TABLE IF EXISTS ingested_ids;
+CREATE TABLE IF NOT EXISTS ingest_sequences (
+    origin TEXT NOT NULL,
+    epoch INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (origin, epoch)
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution TEXT NOT NULL,
+    profile_key TEXT NOT NULL,
+    bucket_start INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    mean REAL NOT NULL,
+    m2 REAL NOT NULL,
+    anomalies INTEGER NOT NULL,
+    PRIMARY KEY (resolution, profile_key, bucket_start)
+);
+CREATE TABLE IF NOT EXISTS gateway_configs (
+    gateway_id TEXT PRIMARY KEY,
+    config TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS gateway_loads (
+    gateway_id TEXT PRIMARY KEY,
+    info TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS revoked_devices (
+    device_id TEXT PRIMARY KEY,
+    revoked_at REAL NOT NULL,
+    reinstated INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS task_runs (
+    name TEXT PRIMARY KEY,
+    last_run REAL NOT NULL
+);
+"""
+
+# Chan et al. merge of a pre-aggregated bucket into the stored one; SQL evaluates
+# every right-hand side against the old row, so the formulas can refer to it freely.
+ROLLUP_UPSERT = """
+INSERT INTO rollups (resolution, profile_key, bucket_start, count, min, max, mean, m2, anomalies)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (resolution, profile_key, bucket_start) DO UPDATE SET
+    count = count + excluded.count,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max),
+    mean = mean + (excluded.mean - mean) * excluded.count / (count + excluded.count),
+    m2 = m2 + excluded.m2
+        + (excluded.mean - mean) * (excluded.mean - mean) * count * excluded.count / (count + excluded.count),
+    anomalies = anomalies + excluded.anomalies
+"""
+
+
+class SQLiteStorage:
+    """State shared by all worker processes through one SQLite database in WAL mode."""
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        if "reinstated" not in [column[1] for column in conn.execute("PRAGMA table_info(revoked_devices)")]:
+            conn.execute("ALTER TABLE revoked_devices ADD COLUMN reinstated INTEGER NOT NULL DEFAULT 0")
+        conn.execute(
+            "INSERT OR IGNORE INTO gateway_configs (gateway_id, config) VALUES (?, ?)",
+            ("gateway-01", json.dumps(DEFAULT_GATEWAY_CONFIG))
+        )
+
+    def _conn(self):
+        """One connection per thread (FastAPI runs sync endpoints in a thread pool)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        """Run fn(conn) in an IMMEDIATE transaction so writers from all processes serialize."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _admit(self, conn, rows, sequence):
+        """Rows of a sequenced batch not received before, updating the origin's window in the same transaction."""
+        origin, epoch, seq_start = sequence
+        row = conn.execute(
+            "SELECT state FROM ingest_sequences WHERE origin = ? AND epoch = ?", (origin, epoch)
+        ).fetchone()
+        if row is None:
+            retained = [value for (value,) in conn.execute(
+                "SELECT epoch FROM ingest_sequences WHERE origin = ?", (origin,)
+            )]
+            if expired_epoch(retained, epoch):
+                return []
+        window = SequenceWindow.from_json(row[0]) if row else SequenceWindow()
+        ranges = window.admit(seq_start, seq_start + len(rows) - 1)
+        conn.execute(
+            "INSERT INTO ingest_sequences (origin, epoch, state, created) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (origin, epoch) DO UPDATE SET state = excluded.state",
+            (origin, epoch, window.to_json(), time.time())
+        )
+        if row is None:
+            conn.execute(
+                "DELETE FROM ingest_sequences WHERE origin = ? AND epoch NOT IN "
+                "(SELECT epoch FROM ingest_sequences WHERE origin = ? ORDER BY epoch DESC LIMIT ?)",
+                (origin, origin, EPOCHS_PER_ORIGIN)
+            )
+        return accepted_rows(rows, seq_start, ranges)
+
+    def ingest(self, rows, sequence=None):
+        """Store rows that were not seen before. Returns (accepted rows, duplicate count).
+
+        sequence is the batch's (origin, epoch, seqStart); without it every row is accepted.
+        """
+        def write(conn):
+            accepted = []
+            duplicates = 0
+            buckets = {}
+            new_rows = rows
+            if sequence is not None and rows:
+                new_rows = self._admit(conn, rows, sequence)
+                duplicates = len(rows) - len(new_rows)
+            for row in new_rows:
+                ts = row["timestamp"].timestamp()
+                if is_summary(row):
+                    # Summaries feed rollups and training only; raw-reading views stay raw
+                    conn.execute(
+                        "INSERT INTO summaries (ts, profile_key, doc) VALUES (?, ?, ?)",
+                        (ts, row["profileKey"], json.dumps(row, default=json_default))
+                    )
+                    for resolution, width in RESOLUTIONS.items():
+                        key = (resolution, row["profileKey"], int(ts // width) * width)
+                        bucket = buckets.get(key)
+                        if bucket is None:
+                            bucket = buckets[key] = RollupBucket()
+                        bucket.merge(row["count"], row["min"], row["max"], row["mean"], row["m2"])
+                    accepted.append(row)
+                    continue
+
+                is_anomaly = bool(row.get("isAnomaly"))
+                conn.execute(
+                    "INSERT INTO readings (ts, device_id, sensor_type, profile_key, value, is_anomaly, doc) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (ts, row["deviceId"], row["sensorType"], row["profileKey"], row["value"],
+                     int(is_anomaly), json.dumps(row, default=json_default))
+                )
+                # Pre-aggregate the batch so each rollup bucket is upserted once
+                for resolution, width in RESOLUTIONS.items():
+                    key = (resolution, row["profileKey"], int(ts // width) * width)
+                    bucket = buckets.get(key)
+                    if bucket is None:
+                        bucket = buckets[key] = RollupBucket()
+                    bucket.add(row["value"], is_anomaly)
+                accepted.append(row)
+
+            conn.executemany(ROLLUP_UPSERT, [
+                (resolution, profile_key, bucket_start, b.count, b.min, b.max, b.mean, b.m2, b.anomalies)
+                for (resolution, profile_key, bucket_start), b in buckets.items()
+            ])
+            return accepted, duplicates
+
+        return self._write(write)
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    def all_rows(self):
+        return [json.loads(doc) for (doc,) in self._conn().execute("SELECT doc FROM readings ORDER BY id")]
+
+    def rows_where(self, field, value):
+        column = {"deviceId": "device_id", "sensorType": "sensor_type", "profileKey": "profile_key"}[field]
+        cur = self._conn().execute(f"SELECT doc FROM readings WHERE {column} = ? ORDER BY id", (value,))
+        return [json.loads(doc) for (doc,) in cur]
+
+    def live_cursor(self):
+        """Position just past the newest stored reading and summary, for rows_after"""
+        conn = self._conn()
+        return (conn.execute("SELECT COALESCE(MAX(id), 0) FROM readings").fetchone()[0],
+                conn.execute("SELECT COALESCE(MAX(id), 0) FROM summaries").fetchone()[0])
+
+    def rows_after(self, cursor, limit=1000):
+        """Readings and summaries stored (by any worker) after cursor. Returns (rows, new cursor)."""
+        conn = self._conn()
+        rows = []
+        new_cursor = []
+        for table, last_id in zip(("readings", "summaries"), cursor):
+            found = conn.execute(
+                f"SELECT id, doc FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)).fetchall()
+            if found:
+                last_id = found[-1][0]
+            elif conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0] < last_id:
+                # Tables created before AUTOINCREMENT reuse ids once retention empties them:
+                # every row left is newer than the cursor
+                last_id = 0
+            rows.extend(json.loads(doc) for _, doc in found)
+            new_cursor.append(last_id)
+        return rows, tuple(new_cursor)
+
+    def training_records(self):
+        """Latest TRAINING_WINDOW_SIZE records (readings and gateway summaries) per profile key, oldest first"""
+        cur = self._conn().execute(
+            "SELECT doc FROM ("
+            "  SELECT doc, ts, ROW_NUMBER() OVER (PARTITION BY profile_key ORDER BY ts DESC, id DESC) AS rn FROM ("
+            "    SELECT id, doc, ts, profile_key FROM readings"
+            "    UNION ALL SELECT id, doc, ts, profile_key FROM summaries"
+            "  )"
+            ") WHERE rn <= ? ORDER BY ts",
+            (TRAINING_WINDOW_SIZE,)
+        )
+        return [json.loads(doc) for (doc,) in cur]
+
+    def apply_retention(self, now, raw_cutoff):
+        """Age out raw rows older than raw_cutoff and expired rollups."""
+        def write(conn):
+            expired = conn.execute("DELETE FROM readings WHERE ts < ?", (raw_cutoff,)).rowcount
+            expired += conn.execute("DELETE FROM summaries WHERE ts < ?", (raw_cutoff,)).rowcount
+            removed = 0
+            for resolution, retention in ROLLUP_RETENTION_SECONDS.items():
+                removed += conn.execute(
+                    "DELETE FROM rollups WHERE resolution = ? AND bucket_start < ?",
+                    (resolution, now - retention)
+                ).rowcount
+            return expired, removed
+
+        return self._write(write)
+
+    def rollup_query(self, resolution, start=None, end=None, profile_key=None):
+        sql = "SELECT profile_key, bucket_start, count, min, max, mean, m2, anomalies FROM rollups WHERE resolution = ?"
+        params = [resolution]
+        if profile_key is not None:
+            sql += " AND profile_key = ?"
+            params.append(profile_key)
+        if start is not None:
+            sql += " AND bucket_start >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND bucket_start < ?"
+            params.append(end)
+        sql += " ORDER BY profile_key, bucket_start"
+
+        result = {}
+        for key, bucket_start, count, min_value, max_value, mean, m2, anomalies in self._conn().execute(sql, params):
+            bucket = RollupBucket()
+            bucket.count, bucket.min, bucket.max = count, min_value, max_value
+            bucket.mean, bucket.m2, bucket.anomalies = mean, m2, anomalies
+            result.setdefault(key, []).append(bucket.to_dict(bucket_start, resolution))
+        return result
+
+    def _scan(self, start=None, end=None, device_id=None, sensor_type=None,
+              profile_key=None, anomaly_only=False):
+        """Pull matching readings into NumPy columns (strings dictionary-encoded)."""
+        sql = "SELECT ts, value, is_anomaly, device_id, sensor_type, profile_key FROM readings WHERE 1=1"
+        params = []
+        for clause, param in (
+            ("ts >= ?", start), ("ts < ?", end), ("device_id = ?", device_id),
+            ("sensor_type = ?", sensor_type), ("profile_key = ?", profile_key),
+        ):
+            if param is not None:
+                sql += f" AND {clause}"
+                params.append(param)
+        if anomaly_only:
+            sql += " AND is_anomaly = 1"
+
+        rows = self._conn().execute(sql, params).fetchall()
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return np.empty(0), np.empty(0), np.empty(0, dtype=bool), {
+                "profile": (empty, []), "device": (empty, []), "sensorType": (empty, [])
+            }
+
+        ts, value, anomaly, devices, sensor_types, profiles = zip(*rows)
+        labels = {}
+        for field, strings in (("device", devices), ("sensorType", sensor_types), ("profile", profiles)):
+            names, codes = np.unique(np.asarray(strings, dtype=object), return_inverse=True)
+            labels[field] = (codes, list(names))
+        return (np.asarray(ts, dtype=np.float64), np.asarray(value, dtype=np.float64),
+                np.asarray(anomaly, dtype=bool), labels)
+
+    def query(self, aggregates=DEFAULT_AGGREGATES, group_by=None, bucket_seconds=60, **filters):
+        ts, value, anomaly, labels = self._scan(**filters)
+        return group_aggregate(ts, value, anomaly, labels, aggregates, group_by, bucket_seconds)
+
+    def query_rows(self, limit=1000, **filters):
+        sql = "SELECT ts, device_id, sensor_type, profile_key, value, is_anomaly FROM readings WHERE 1=1"
+        params = []
+        for clause, param in (
+            ("ts >= ?", filters.get("start")), ("ts < ?", filters.get("end")),
+            ("device_id = ?", filters.get("device_id")), ("sensor_type = ?", filters.get("sensor_type")),
+            ("profile_key = ?", filters.get("profile_key")),
+        ):
+            if param is not None:
+                sql += f" AND {clause}"
+                params.append(param)
+        if filters.get("anomaly_only"):
+            sql += " AND is_anomaly = 1"
+        sql += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+        return [
+            {"timestamp": ts, "deviceId": device_id, "sensorType": sensor_type,
+             "profileKey": profile_key, "value": value, "isAnomaly": bool(is_anomaly)}
+            for ts, device_id, sensor_type, profile_key, value, is_anomaly in self._conn().execute(sql, params)
+        ]
+
+    def get_config(self, gateway_id):
+        row = self._conn().execute(
+            "SELECT config FROM gateway_configs WHERE gateway_id = ?", (gateway_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def update_config(self, gateway_id, config_data):
+        def write(conn):
+            row = conn.execute("SELECT config FROM gateway_configs WHERE gateway_id = ?", (gateway_id,)).fetchone()
+            config = bump_config(json.loads(row[0]) if row else {"config_version": "0"}, config_data)
+            conn.execute(
+                "INSERT OR REPLACE INTO gateway_configs (gateway_id, config) VALUES (?, ?)",
+                (gateway_id, json.dumps(config))
+            )
+            return config
+
+        return self._write(write)
+
+    def ensure_config(self, gateway_id):
+        """Create the default config for a new gateway. Returns True if it was created."""
+        cur = self._conn().execute(
+            "INSERT OR IGNORE INTO gateway_configs (gateway_id, config) VALUES (?, ?)",
+            (gateway_id, json.dumps(DEFAULT_GATEWAY_CONFIG))
+        )
+        return cur.rowcount == 1
+
+    def record_heartbeat(self, gateway_id, info):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO gateway_loads (gateway_id, info) VALUES (?, ?)",
+            (gateway_id, json.dumps(info))
+        )
+
+    def get_gateway_loads(self):
+        return {gw: json.loads(info) for gw, info in self._conn().execute("SELECT gateway_id, info FROM gateway_loads")}
+
+    def remove_gateway(self, gateway_id):
+        def write(conn):
+            row = conn.execute("SELECT info FROM gateway_loads WHERE gateway_id = ?", (gateway_id,)).fetchone()
+            conn.execute("DELETE FROM gateway_loads WHERE gateway_id = ?", (gateway_id,))
+            return json.loads(row[0]) if row else None
+
+        return self._write(write)
+
+    def revoke_device(self, device_id, revoked_at):
+        """Revoke a device's tokens up to revoked_at, which a re-revoke moves past the previous revocation."""
+        self._write(lambda conn: conn.execute(
+            "INSERT INTO revoked_devices (device_id, revoked_at, reinstated) VALUES (?, ?, 0) "
+            "ON CONFLICT (device_id) DO UPDATE SET revoked_at = MAX(excluded.revoked_at, revoked_at + 1), reinstated = 0",
+            (device_id, revoked_at)
+        ))
+
+    def reinstate_device(self, device_id):
+        """Allow new tokens for a revoked device (its old ones stay revoked). False if it was not revoked."""
+        return self._write(lambda conn: conn.execute(
+            "UPDATE revoked_devices SET reinstated = 1 WHERE device_id = ?", (device_id,)
+        ).rowcount > 0)
+
+    def device_revocations(self, device_ids):
+        """{deviceId: (revoked_at, reinstated)} for the given devices that were ever revoked."""
+        found = {}
+        device_ids = list(device_ids)
+        for start in range(0, len(device_ids), 500):
+            chunk = device_ids[start:start + 500]
+            for device_id, revoked_at, reinstated in self._conn().execute(
+                f"SELECT device_id, revoked_at, reinstated FROM revoked_devices "
+                f"WHERE device_id IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                found[device_id] = (revoked_at, bool(reinstated))
+        return found
+
+    def get_revocations(self):
+        """Revoked devices as {deviceId: revoked_at} plus the list's version.
+
+        Reinstated devices stay on the list: their tokens from before the revocation are still dead.
+        """
+        revoked = dict(self._conn().execute("SELECT device_id, revoked_at FROM revoked_devices"))
+        return revoked, revocation_version(revoked)
+
+    def claim_task(self, name, interval, now):
+        """Return True if periodic task `name` is due; only one worker process wins each period."""
+        def write(conn):
+            row = conn.execute("SELECT last_run FROM task_runs WHERE name = ?", (name,)).fetchone()
+            if row and now - row[0] < interval:
+                return False
+            conn.execute("INSERT OR REPLACE INTO task_runs (name, last_run) VALUES (?, ?)", (name, now))
+            return True
+
+        return self._write(write)
+
+
+def create_storage(backend=None):
+    """Build the storage backend selected by STORAGE_BACKEND (memory | sqlite)."""
+    backend = backend or os.getenv("STORAGE_BACKEND", "memory")
+    if backend == "sqlite":
+        return SQLiteStorage()
+    if backend == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
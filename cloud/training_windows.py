@@ -0,0 +1,109 @@
+import threading
+from datetime import datetime
+import numpy as np
+from query_engine import StringTable
+
+# Per-profile training windows for the in-memory backend: the last `window`
+# entries of every profile in fixed-size ring arrays (one row per profile), with
+# running sums of n, n*mean and m2 + n*mean^2 kept up to date on insert.
+#
+# An entry is a raw reading (n=1, m2=0) or a gateway summary (n=count, mean,
+# m2), so the sums give each profile's exact combined mean and variance
+# (Chan et al.) without touching the rows. When a profile's ring wraps, its
+# sums are recomputed from the row to stop floating-point drift.
+
+INITIAL_PROFILES = 1024
+SUMMARY_RECORD_TYPE = "summary"  # gateway edge-aggregation window (count/min/max/mean/m2)
+
+
+class TrainingWindows:
+    """Last `window` training entries per profile key."""
+
+    def __init__(self, window, capacity=INITIAL_PROFILES):
+        self.window = window
+        self._lock = threading.Lock()
+        self.profiles = StringTable()
+        self.ts = np.zeros((capacity, window))
+        self.value = np.zeros((capacity, window))  # reading value or window mean
+        self.n = np.zeros((capacity, window))
+        self.m2 = np.zeros((capacity, window))
+        self.head = np.zeros(capacity, dtype=np.int32)  # next slot to write
+        self.filled = np.zeros(capacity, dtype=np.int32)
+        self.sum_n = np.zeros(capacity)
+        self.sum_nv = np.zeros(capacity)
+        self.sum_sq = np.zeros(capacity)
+
+    def __len__(self):
+        return len(self.profiles.values)
+
+    def _grow(self):
+        """Double the number of profile rows. Must hold _lock."""
+        for name in ("ts", "value", "n", "m2", "head", "filled", "sum_n", "sum_nv", "sum_sq"):
+            array = getattr(self, name)
+            grown = np.zeros((array.shape[0] * 2,) + array.shape[1:], dtype=array.dtype)
+            grown[:array.shape[0]] = array
+            setattr(self, name, grown)
+
+    def add(self, profile_key, ts, value, count=1, m2=0.0):
+        """Append a reading (count=1) or a summary window to the profile's ring, evicting the oldest entry when full."""
+        with self._lock:
+            i = self.profiles.encode(profile_key)
+            if i >= len(self.head):
+                self._grow()
+            pos = self.head[i]
+            if self.filled[i] == self.window:
+                old_n, old_v = self.n[i, pos], self.value[i, pos]
+                self.sum_n[i] -= old_n
+                self.sum_nv[i] -= old_n * old_v
+                self.sum_sq[i] -= self.m2[i, pos] + old_n * old_v * old_v
+            else:
+                self.filled[i] += 1
+
+            self.ts[i, pos] = ts
+            self.value[i, pos] = value
+            self.n[i, pos] = count
+            self.m2[i, pos] = m2
+            self.head[i] = (pos + 1) % self.window
+
+            if self.head[i] == 0:
+                n, v = self.n[i], self.value[i]
+                self.sum_n[i] = n.sum()
+                self.sum_nv[i] = (n * v).sum()
+                self.sum_sq[i] = (self.m2[i] + n * v * v).sum()
+            else:
+                self.sum_n[i] += count
+                self.sum_nv[i] += count * value
+                self.sum_sq[i] += m2 + count * value * value
+
+    def stats(self):
+        """(profile keys, samples, mean, m2, newest timestamp) arrays over every profile."""
+        with self._lock:
+            profiles = len(self.profiles.values)
+            keys = list(self.profiles.values)
+            samples = self.sum_n[:profiles].copy()
+            sum_nv = self.sum_nv[:profiles].copy()
+            sum_sq = self.sum_sq[:profiles].copy()
+            newest = self.ts[:profiles].max(axis=1)
+        mean = np.divide(sum_nv, samples, out=np.zeros(profiles), where=samples > 0)
+        m2 = np.maximum(sum_sq - samples * mean * mean, 0.0)
+        return keys, samples, mean, m2, newest
+
+    def records(self):
+        """One summary training record per profile (count/mean/m2 over its window), oldest window first."""
+        keys, samples, mean, m2, newest = self.stats()
+        order = np.argsort(newest, kind="stable")
+        return [
+            {
+                "recordType": SUMMARY_RECORD_TYPE,
+                "profileKey": keys[i],
+                "timestamp": datetime.fromtimestamp(ts),  # inverse of the naive .timestamp() used on insert
+                "value": mu,
+                "count": int(count),
+                "mean": mu,
+                "m2": spread
+            }
+            for i, ts, count, mu, spread in zip(
+                order.tolist(), newest[order].tolist(), samples[order].tolist(), mean[order].tolist(), m2[order].tolist()
+            )
+            if count > 0
+        ]
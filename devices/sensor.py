@@ -1,5 +1,6 @@
 import time
 import random
+import numpy as np
 
 SENSOR_CONFIG = {
     "temperature": {
@@ -64,4 +65,64 @@ class Sensor:
             self.device_base_min,
             self.device_base_max
         ), 2)
-    
\ No newline at end of file
+    
+
+class SensorFleet:
+    """N sensors simulated together: parameters live in NumPy arrays and one call yields a whole tick.
+
+    Same value model as Sensor (per-device baseline shift, optional drift after a delay,
+    5% random spikes), but seedable and with ground-truth labels for the injected spikes.
+    """
+
+    def __init__(self, device_ids, sensor_types, seed=None, anomaly_rate=0.05, drift_fraction=0.4):
+        self.device_ids = list(device_ids)
+        self.sensor_types = list(sensor_types)
+        self.size = len(self.device_ids)
+        self.anomaly_rate = anomaly_rate
+        self.rng = np.random.default_rng(seed)
+        self.start_time = time.time()
+
+        base_min = np.array([SENSOR_CONFIG[t]["baseline_range"][0] for t in self.sensor_types])
+        base_max = np.array([SENSOR_CONFIG[t]["baseline_range"][1] for t in self.sensor_types])
+        span = base_max - base_min
+
+        baseline_shift = self.rng.uniform(-0.3 * span, 0.3 * span)
+        self.device_base_min = base_min + baseline_shift
+        self.device_base_max = base_max + baseline_shift
+
+        self.drift_enabled = self.rng.random(self.size) < drift_fraction
+        self.drift_after = self.rng.uniform(30, 120, self.size)
+        self.drift_offset = self.rng.uniform(-4 * span, 4 * span)
+
+    @classmethod
+    def create(cls, count, seed=None, first_index=1, **kwargs):
+        """Fleet of `count` sensors named sensor-0001... with types cycling like run_load.py."""
+        types = list(SENSOR_CONFIG)
+        indices = range(first_index, first_index + count)
+        return cls(
+            [f"sensor-{i:04d}" for i in indices],
+            [types[i % len(types)] for i in indices],
+            seed=seed,
+            **kwargs
+        )
+
+    def tick(self, elapsed=None):
+        """Return (values, is_anomaly) arrays for one reading per sensor.
+
+        `elapsed` is seconds since fleet start; pass it explicitly for reproducible runs.
+        """
+        if elapsed is None:
+            elapsed = time.time() - self.start_time
+
+        drifted = self.drift_enabled & (elapsed > self.drift_after)
+        low = self.device_base_min + np.where(drifted, self.drift_offset, 0.0)
+        high = self.device_base_max + np.where(drifted, self.drift_offset, 0.0)
+
+        # Random anomaly: spike anywhere within 5 spans around the (undrifted) baseline
+        is_anomaly = self.rng.random(self.size) < self.anomaly_rate
+        anomaly_span = (self.device_base_max - self.device_base_min) * 5
+        low = np.where(is_anomaly, self.device_base_min - anomaly_span, low)
+        high = np.where(is_anomaly, self.device_base_max + anomaly_span, high)
+
+        values = np.round(self.rng.uniform(low, high), 2)
+        return values, is_anomaly
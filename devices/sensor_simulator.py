@@ -11,7 +11,7 @@ PORT = 1883
 DEVICE_ID = os.getenv("DEVICE_ID", "sensor-001")
 SENSOR_TYPE = os.getenv("SENSOR_TYPE", "temperature")
 PUBLISH_INTERVAL = 1
-SIGNATURE = "device-secret"
+DEVICE_TOKEN = os.getenv("DEVICE_TOKEN", "")  # minted by the operator (mint_tokens.py), never by the device
 
 
 def on_connect(client, userdata, flags, rc):
@@ -27,7 +27,11 @@ def main():
         print(f"Invalid sensor type: {SENSOR_TYPE}")
         return
 
+    if not DEVICE_TOKEN:
+        raise SystemExit(f"[{DEVICE_ID}] DEVICE_TOKEN is not set (mint it with mint_tokens.py)")
+
     sensor = Sensor(DEVICE_ID, SENSOR_TYPE)
+    token = DEVICE_TOKEN
 
     topic = SENSOR_CONFIG[SENSOR_TYPE]["topic"]
     unit = SENSOR_CONFIG[SENSOR_TYPE]["unit"]
@@ -52,7 +56,7 @@ def main():
         while True:
             payload = {
                 "deviceId": sensor.device_id,
-                "signature": SIGNATURE,
+                "signature": token,
                 "sensorType": sensor.sensor_type,
                 "timestamp": datetime.now().isoformat() + "Z",
                 "value": sensor.get_value(),
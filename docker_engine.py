@@ -0,0 +1,149 @@
+import http.client
+import json
+import socket
+import threading
+from urllib.parse import quote, urlencode
+
+# Minimal Docker Engine API client for the autoscaler: HTTP/1.1 over the
+# engine's unix socket with keep-alive (one persistent connection per thread),
+# plus the /events stream. Only the calls the autoscaler needs are wrapped.
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+API_VERSION = "v1.41"  # Docker 20.10+
+TIMEOUT_SECONDS = 30  # stop waits for the container's own shutdown
+
+
+class DockerError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection to a unix socket path instead of host:port."""
+
+    def __init__(self, socket_path, timeout=TIMEOUT_SECONDS):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerEngine:
+    """Docker Engine API calls over a persistent unix-socket connection per calling thread."""
+
+    def __init__(self, socket_path=DOCKER_SOCKET):
+        self.socket_path = socket_path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = UnixHTTPConnection(self.socket_path)
+        return conn
+
+    def request(self, method, path, query=None, body=None):
+        """One API call; returns the decoded JSON body (None if empty). Raises DockerError on 4xx/5xx."""
+        url = f"/{API_VERSION}{path}"
+        if query:
+            url += "?" + urlencode(query)
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        for attempt in range(2):
+            conn = self._conn()
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError, BrokenPipeError):
+                # Kept-alive connection closed by the engine: reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        if response.status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode(errors="replace")
+            raise DockerError(response.status, message)
+        return json.loads(data) if data else None
+
+    def list_containers(self, name_filter):
+        """{name: state} for all containers whose name contains name_filter."""
+        containers = self.request("GET", "/containers/json", {
+            "all": "1", "filters": json.dumps({"name": [name_filter]})
+        })
+        return {c["Names"][0].lstrip("/"): c["State"] for c in containers}
+
+    def run_container(self, name, image, env, network, publish_ports=()):
+        """Create and start a container; publish_ports go to ephemeral 127.0.0.1 host ports."""
+        ports = {f"{port}/tcp": {} for port in publish_ports}
+        self.request("POST", "/containers/create", {"name": name}, {
+            "Image": image,
+            "Env": [f"{k}={v}" for k, v in env.items()],
+            "ExposedPorts": ports,
+            "HostConfig": {
+                "NetworkMode": network,
+                "PortBindings": {port: [{"HostIp": "127.0.0.1", "HostPort": ""}] for port in ports}
+            }
+        })
+        self.request("POST", f"/containers/{quote(name)}/start")
+
+    def stop_container(self, name, timeout=10):
+        """Stop and remove a container. Returns False if it did not exist."""
+        try:
+            self.request("POST", f"/containers/{quote(name)}/stop", {"t": str(timeout)})
+        except DockerError as e:
+            if e.status == 404:
+                return False
+            if e.status != 304:  # already stopped
+                raise
+        self.request("DELETE", f"/containers/{quote(name)}", {"force": "1"})
+        return True
+
+    def host_port(self, name, port):
+        """'127.0.0.1:<port>' the container's port is published on, or None."""
+        info = self.request("GET", f"/containers/{quote(name)}/json")
+        bindings = (info.get("NetworkSettings", {}).get("Ports") or {}).get(f"{port}/tcp") or []
+        for binding in bindings:
+            if binding.get("HostPort"):
+                return f"{binding.get('HostIp') or '127.0.0.1'}:{binding['HostPort']}"
+        return None
+
+    def events(self, on_event, stop_event, since=None, filters=None):
+        """Stream engine events to on_event(event) on a dedicated connection.
+
+        Blocks until the stream ends (or stop_event is set when the next event
+        arrives); the caller resyncs and calls again.
+        """
+        query = {"filters": json.dumps(filters or {"type": ["container"]})}
+        if since is not None:
+            query["since"] = f"{since:.9f}"
+        conn = UnixHTTPConnection(self.socket_path, timeout=None)  # events may be minutes apart
+        try:
+            conn.request("GET", f"/{API_VERSION}/events?" + urlencode(query))
+            response = conn.getresponse()
+            if response.status != 200:
+                raise DockerError(response.status, response.read().decode(errors="replace"))
+            while not stop_event.is_set():
+                line = response.readline()
+                if not line:
+                    return
+                if line.strip():
+                    on_event(json.loads(line))
+        finally:
+            conn.close()
+
+
+def container_event(event):
+    """(container name, action) of a container event, or (None, None)."""
+    if event.get("Type") != "container":
+        return None, None
+    name = (event.get("Actor") or {}).get("Attributes", {}).get("name")
+    return name, event.get("Action") or event.get("status")
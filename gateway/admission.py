@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from array import array
+
+# Per-device token-bucket admission control, applied to raw MQTT payloads
+# before JSON decode so a flooding device is shed as cheaply as possible.
+#
+# A device only gets a bucket of its own once a message of it has been
+# admitted through its topic's shared bucket, which also takes every payload
+# without a deviceId. Admission runs before auth, so a flood that rotates
+# deviceIds is held to the shared rate instead of getting a fresh burst per ID.
+# The device table is capped; when it is full, the slots of idle devices whose
+# buckets have refilled (and so carry no state) are reused.
+
+DEFAULT_QUOTA = (10.0, 50.0)  # (tokens per second, burst) — sensors normally publish at 1 Hz
+# All sensor types publish at the same rate, so there are no per-type quotas by
+# default; AdmissionController(type_quotas={...}) sets them.
+SHARED_QUOTA = (
+    float(os.getenv("ADMISSION_NEW_DEVICE_RATE", "1000")),  # new or unidentified messages per second per topic
+    float(os.getenv("ADMISSION_NEW_DEVICE_BURST", "10000"))
+)
+MAX_TRACKED_DEVICES = int(os.getenv("ADMISSION_MAX_DEVICES", "200000"))
+MAX_SHARED_BUCKETS = 1024  # topics with their own shared bucket; further topics share one
+SWEEP_LIMIT = 64  # slots examined per new device once the table is full
+
+DEVICE_ID_FIELD = b'"deviceId"'
+
+
+def peek_device_id(payload):
+    """Extract deviceId from a JSON payload without decoding it. Returns None if not found."""
+    pos = payload.find(DEVICE_ID_FIELD)
+    if pos < 0:
+        return None
+    start = payload.find(b'"', pos + len(DEVICE_ID_FIELD))
+    if start < 0:
+        return None
+    end = payload.find(b'"', start + 1)
+    if end < 0:
+        return None
+    return payload[start + 1:end]
+
+
+class AdmissionController:
+    """Token buckets keyed by deviceId, plus one shared bucket per topic for unknown devices.
+
+    Each device gets a slot index; bucket state lives in flat arrays so the
+    per-device cost is one dict entry, one list entry and 24 bytes.
+    """
+
+    def __init__(self, type_quotas=None, default_quota=DEFAULT_QUOTA, shared_quota=SHARED_QUOTA,
+                 max_devices=MAX_TRACKED_DEVICES):
+        self.type_quotas = dict(type_quotas or {})
+        self.default_quota = default_quota
+        self.shared_quota = shared_quota
+        self.max_devices = max_devices
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._keys = []  # slot -> deviceId
+        self._tokens = array("d")
+        self._updated = array("d")
+        self._full_at = array("d")  # when the slot's bucket has refilled; after that it holds no state
+        self._hand = 0  # clock-sweep position for reclaiming slots
+        self._shared = {}  # topic -> [tokens, updated]
+        self.admitted = 0
+        self.shed = 0
+        self.unchecked = 0
+        self.shed_by_type = {}
+
+    def admit(self, device_id, sensor_type=None, now=None, topic=None):
+        """Take one token from the device's bucket. Returns False if the message should be shed.
+
+        A device without a bucket is admitted through the shared bucket of its
+        topic (sensor_type if no topic is given) and then gets its own.
+        """
+        rate, burst = self.type_quotas.get(sensor_type, self.default_quota)
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slot = self._slots.get(device_id)
+            if slot is None:
+                if not self._take_shared(sensor_type if topic is None else topic, now):
+                    self._count_shed(sensor_type)
+                    return False
+                self._allocate(device_id, rate, burst, now)
+                self.admitted += 1
+                return True
+
+            tokens = self._tokens[slot] + (now - self._updated[slot]) * rate
+            if tokens > burst:
+                tokens = burst
+            self._updated[slot] = now
+
+            if tokens < 1.0:
+                self._tokens[slot] = tokens
+                self._count_shed(sensor_type)
+                return False
+
+            self._tokens[slot] = tokens - 1.0
+            self._full_at[slot] = now + (burst - tokens + 1.0) / rate
+            self.admitted += 1
+            return True
+
+    def admit_payload(self, topic, payload):
+        """Admission on a raw MQTT message: sensor type from the topic, deviceId peeked from the bytes."""
+        sensor_type = topic.rsplit("/", 1)[-1]
+        device_id = peek_device_id(payload)
+        if device_id is not None:
+            return self.admit(device_id, sensor_type, topic=topic)
+        now = time.monotonic()
+        with self._lock:
+            self.unchecked += 1
+            if not self._take_shared(topic, now):
+                self._count_shed(sensor_type)
+                return False
+            self.admitted += 1
+        return True
+
+    def _count_shed(self, sensor_type):
+        """Must hold _lock."""
+        self.shed += 1
+        self.shed_by_type[sensor_type] = self.shed_by_type.get(sensor_type, 0) + 1
+
+    def _take_shared(self, topic, now):
+        """Take one token from the topic's shared bucket. Must hold _lock."""
+        rate, burst = self.shared_quota
+        bucket = self._shared.get(topic)
+        if bucket is None:
+            if len(self._shared) >= MAX_SHARED_BUCKETS:
+                topic = None
+                bucket = self._shared.get(None)
+            if bucket is None:
+                bucket = self._shared[topic] = [burst, now]
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1.0
+        return True
+
+    def _allocate(self, device_id, rate, burst, now):
+        """Give a device a bucket with one token taken: a new slot, or a reclaimed one once the table is full.
+
+        Must hold _lock. If every swept slot belongs to an active device, the
+        device gets none and stays on the shared bucket.
+        """
+        if len(self._keys) < self.max_devices:
+            self._slots[device_id] = len(self._keys)
+            self._keys.append(device_id)
+            self._tokens.append(burst - 1.0)
+            self._updated.append(now)
+            self._full_at.append(now + 1.0 / rate)
+            return
+        # Clock sweep: forgetting a device whose bucket has refilled loses nothing
+        for _ in range(min(SWEEP_LIMIT, len(self._keys))):
+            slot = self._hand
+            self._hand = (slot + 1) % len(self._keys)
+            if self._full_at[slot] <= now:
+                del self._slots[self._keys[slot]]
+                self._slots[device_id] = slot
+                self._keys[slot] = device_id
+                self._tokens[slot] = burst - 1.0
+                self._updated[slot] = now
+                self._full_at[slot] = now + 1.0 / rate
+                return
+
+    def get_and_reset_counters(self):
+        """Counters since the last call, plus the number of tracked devices."""
+        with self._lock:
+            counters = {
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "unchecked": self.unchecked,
+                "shed_by_type": dict(self.shed_by_type),
+                "tracked_devices": len(self._slots)
+            }
+            self.admitted = 0
+            self.shed = 0
+            self.unchecked = 0
+            self.shed_by_type = {}
+        return counters
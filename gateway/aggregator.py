@@ -0,0 +1,139 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Edge pre-aggregation: instead of forwarding every reading, the gateway emits one
+# summary record per profileKey and time window. Summaries carry count/min/max/
+# mean/M2 so the cloud and Spark can merge them exactly (Chan et al.).
+#
+# Windows are aligned to epoch multiples of the window length on the reading's
+# own timestamp, so a window that divides 60 (10, 15, 20, 30, 60) lands whole in
+# one cloud rollup bucket. Anomalies are never aggregated; they go out raw.
+
+FLUSH_GRACE_SECONDS = 2.0  # wait this long after a window ends for late readings
+SUMMARY_RECORD_TYPE = "summary"
+
+
+def reading_epoch(message):
+    """Epoch seconds of a reading's ISO timestamp (UTC, as the cloud parses it); gateway time if missing."""
+    timestamp = message.get("timestamp")
+    if not timestamp:
+        return time.time()
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class WindowStats:
+    """Running count/min/max/mean/M2 (Welford) and last value for one profile window."""
+
+    __slots__ = ("count", "min", "max", "mean", "m2", "last", "device_id", "sensor_type", "unit", "acks")
+
+    def __init__(self, message):
+        self.count = 0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last = None
+        self.device_id = message.get("deviceId")
+        self.sensor_type = message.get("sensorType")
+        self.unit = message.get("unit")
+        self.acks = []  # MQTT deliveries of the folded readings, acked with the summary
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.last = value
+
+
+class EdgeAggregator:
+    """Per-profileKey windowed summaries; window_seconds <= 0 means aggregation is off."""
+
+    def __init__(self, window_seconds=0, delivery=None):
+        self.window_seconds = window_seconds
+        self.delivery = delivery
+        self._lock = threading.Lock()
+        self._windows = {}  # (profileKey, window_start, window_seconds) -> WindowStats
+        self.readings_in = 0
+        self.summaries_out = 0
+
+    @property
+    def enabled(self):
+        return self.window_seconds > 0
+
+    def add(self, message):
+        """Fold a scored reading into its window.
+
+        Returns False if the reading must be forwarded raw instead: aggregation
+        is off, it is an anomaly, or it has no usable value/timestamp.
+        """
+        width = self.window_seconds
+        if width <= 0 or message.get("isAnomaly") or "profileKey" not in message:
+            return False
+        try:
+            window_start = int(reading_epoch(message) // width) * width
+            value = float(message["value"])
+        except (KeyError, TypeError, ValueError):
+            return False
+        key = (message["profileKey"], window_start, width)
+        with self._lock:
+            stats = self._windows.get(key)
+            if stats is None:
+                stats = self._windows[key] = WindowStats(message)
+            stats.add(value)
+            ack_id = getattr(message, "ack_id", None)
+            if ack_id is not None:
+                stats.acks.append(ack_id)
+                del message.ack_id
+            self.readings_in += 1
+        return True
+
+    def flush(self, now=None, force=False):
+        """Close windows that ended more than FLUSH_GRACE_SECONDS ago (all of them if force) and return summary records."""
+        now = time.time() if now is None else now
+        with self._lock:
+            force = force or not self.enabled
+            due = [key for key in self._windows if force or key[1] + key[2] + FLUSH_GRACE_SECONDS <= now]
+            closed = [(key, self._windows.pop(key)) for key in due]
+            self.summaries_out += len(closed)
+
+        summaries = []
+        for (profile_key, window_start, width), stats in closed:
+            message_id = str(uuid.uuid4())
+            if self.delivery is not None:
+                self.delivery.hold(message_id, stats.acks)
+            summaries.append({
+                "recordType": SUMMARY_RECORD_TYPE,
+                "messageId": message_id,
+                "deviceId": stats.device_id,
+                "sensorType": stats.sensor_type,
+                "unit": stats.unit,
+                "profileKey": profile_key,
+                "timestamp": datetime.fromtimestamp(window_start, timezone.utc).replace(tzinfo=None).isoformat() + "Z",
+                "windowSeconds": width,
+                "value": stats.mean,
+                "count": stats.count,
+                "min": stats.min,
+                "max": stats.max,
+                "mean": stats.mean,
+                "m2": stats.m2,
+                "last": stats.last,
+                "gatewayReceivedAt": now
+            })
+        return summaries
+
+    def get_and_reset_counters(self):
+        with self._lock:
+            counters = {"readings_in": self.readings_in, "summaries_out": self.summaries_out}
+            self.readings_in = 0
+            self.summaries_out = 0
+        return counters
@@ -1,34 +1,46 @@
 import threading
+from model_format import BinaryModel, write_model
+
+_UNSEEN = object()
 
 
 class AnomalyDetector:
     """Edge anomaly detector using cloud-trained z-score profiles."""
-    
+
     def __init__(self):
         self._lock = threading.Lock()
-        self._features = {}
+        self._model = None
+        self._profiles = {}  # profile key -> (mean, stddev, n_sigma) or None, filled from the model on first use
         self._generated_at = None
 
-    def update_model(self, model_payload):
-        """Load cloud-trained model artifact into detector."""
-        if not isinstance(model_payload, dict):
-            return
+    @property
+    def model_generated_at(self):
+        """generated_at of the loaded model, or None before the first one arrives."""
+        return self._generated_at
 
-        features = model_payload.get("features") or {}
-        if not isinstance(features, dict):
+    def update_model(self, model_payload):
+        """Load cloud-trained model artifact into detector: a BinaryModel or the JSON artifact dict."""
+        if isinstance(model_payload, dict):
+            if not isinstance(model_payload.get("features") or {}, dict):
+                return
+            model_payload = BinaryModel(write_model(model_payload))
+        elif not isinstance(model_payload, BinaryModel):
             return
 
         with self._lock:
-            self._features = features
-            self._generated_at = model_payload.get("generated_at")
+            self._model = model_payload
+            self._profiles = {}
+            self._generated_at = model_payload.generated_at
 
     def score(self, profile_key, value):
         """Compute z-score anomaly for a sensor reading."""
         with self._lock:
-            profile = self._features.get(profile_key)
+            profile = self._profiles.get(profile_key, _UNSEEN)
+            if profile is _UNSEEN and self._model is not None:
+                profile = self._profiles[profile_key] = self._model.lookup(profile_key)
             model_timestamp = self._generated_at
 
-        if not profile:
+        if profile is None or profile is _UNSEEN:
             return {
                 "isAnomaly": False,
                 "anomalyScore": 0.0,
@@ -36,9 +48,7 @@ class AnomalyDetector:
                 "modelTimestamp": model_timestamp
             }
 
-        mean = float(profile.get("mean", 0.0))
-        stddev = float(profile.get("stddev", 0.0001))
-        n_sigma = float(profile.get("n_sigma", 3.0))
+        mean, stddev, n_sigma = profile
 
         if stddev <= 0.0:
             stddev = 0.0001
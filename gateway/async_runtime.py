@@ -0,0 +1,348 @@
+import asyncio
+import json
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from aiohttp import web
+import paho.mqtt.client as mqtt
+import mqtt_client
+import peer_sync as peer_sync_module
+import rest_client
+from data_buffer import Batch
+from logger import log_info, log_error
+
+# Single event-loop gateway runtime (GATEWAY_RUNTIME=asyncio). It drives the
+# same pipeline as the threaded runtime in main.py: paho runs on the loop's
+# socket callbacks, scoring runs in batches on a small executor, sends are
+# pooled aiohttp requests, the peer server is an aiohttp app, and periodic
+# work runs on timers.
+
+SCORING_THREADS = 2
+SCORE_BATCH_MAX = 500            # messages per executor call
+MAX_CONCURRENT_SENDS = 32        # in-flight normal-lane requests
+SEND_CONNECTIONS = 64            # pooled connections to the cloud API
+KEEPALIVE_SECONDS = 4            # below uvicorn's 5s idle timeout so pooled connections are not reset under us
+AGGREGATION_FLUSH_INTERVAL_SECONDS = 1
+MQTT_MISC_INTERVAL_SECONDS = 1
+MQTT_RECONNECT_DELAY_SECONDS = 2
+
+
+class AsyncioMqtt:
+    """Runs a paho client on an asyncio loop via its socket callbacks instead of loop_start()."""
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        """Keepalive pings and retries; paho expects loop_misc() about once per second."""
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(MQTT_MISC_INTERVAL_SECONDS)
+
+
+class AsyncGateway:
+    """Event-loop runtime around the gateway module's buffers, detector and config."""
+
+    def __init__(self, gateway):
+        self.gw = gateway
+        self.loop = None
+        self.stopping = None
+        self.session = None
+        self.priority_session = None
+        self.scoring_pool = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix="scoring")
+        self.pending = []
+        self.pending_ready = None
+        self.inflight = {gateway.NORMAL_LANE: 0, gateway.PRIORITY_LANE: 0}
+        self.flush_timers = {}
+        self.mqtt = None
+
+    # --- MQTT ingress ---
+
+    def on_message(self, client, userdata, msg):
+        """Runs on the loop (paho's loop_read): admission, decode, then queue for batched scoring."""
+        if not self.gw.admission.admit_payload(msg.topic, msg.payload):
+            self.gw.delivery.ack(msg.mid)
+            return
+        data = mqtt_client.decode_message(msg.topic, msg.payload)
+        if data is None:
+            self.gw.delivery.ack(msg.mid)
+            return
+        self.gw.delivery.track(data, msg.mid)
+        self.pending.append(data)
+        self.pending_ready.set()
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            log_info(f"[{self.gw.GATEWAY_ID}] MQTT connected to broker (asyncio runtime)")
+            mqtt_client.subscribe(client, self.gw.GATEWAY_ID)
+        else:
+            log_error(f"[{self.gw.GATEWAY_ID}] MQTT connection failed: {rc}")
+
+    def on_disconnect(self, client, userdata, rc, properties=None):
+        if rc != 0 and not self.stopping.is_set():
+            log_error(f"[{self.gw.GATEWAY_ID}] MQTT disconnected ({rc}), reconnecting")
+            self.loop.create_task(self.connect_mqtt(reconnect=True))
+
+    async def connect_mqtt(self, reconnect=False):
+        if self.mqtt is None:
+            self.mqtt = mqtt_client.create_client(self.gw.GATEWAY_ID)
+            if mqtt_client.manual_acks():
+                # Acks may come from scoring threads; paho's socket I/O belongs to the loop
+                self.gw.delivery.bind(lambda mid: self.loop.call_soon_threadsafe(self.mqtt.ack, mid, mqtt_client.MQTT_QOS))
+            self.mqtt.on_connect = self.on_connect
+            self.mqtt.on_disconnect = self.on_disconnect
+            self.mqtt.on_message = self.on_message
+            AsyncioMqtt(self.loop, self.mqtt)
+        while not self.stopping.is_set():
+            try:
+                if reconnect:
+                    self.mqtt.reconnect()
+                else:
+                    mqtt_client.connect(self.mqtt)
+                return
+            except Exception as e:
+                log_info(f"Broker not ready, retrying in {MQTT_RECONNECT_DELAY_SECONDS}s... ({e})")
+                await asyncio.sleep(MQTT_RECONNECT_DELAY_SECONDS)
+
+    # --- scoring ---
+
+    def process_batch(self, messages):
+        """Executor thread: auth, scoring and buffering for a batch of messages."""
+        for message in messages:
+            self.gw.process_message(message)
+
+    async def scorer(self):
+        while True:
+            await self.pending_ready.wait()
+            batch = self.pending[:SCORE_BATCH_MAX]
+            del self.pending[:SCORE_BATCH_MAX]
+            if not self.pending:
+                self.pending_ready.clear()
+            if batch:
+                await self.loop.run_in_executor(self.scoring_pool, self.process_batch, batch)
+                self.drain()
+
+    # --- sends ---
+
+    def drain(self):
+        """Start sends for every ready batch while the lane has capacity, then re-arm the age-limit timers."""
+        gw = self.gw
+        if gw.CONFIG["batch_mode"] == "adaptive":
+            gw.batch_policy.tune(gw.buffer)
+
+        while self.inflight[gw.NORMAL_LANE] < MAX_CONCURRENT_SENDS:
+            batch = gw.buffer.get_batch_if_ready()
+            if not batch:
+                break
+            # Filter out peer-replicated records: only origin should send to cloud
+            to_send = batch  # as is, so a requeued batch keeps its sequence range
+            if any(m.get("_replicated_from") for m in batch):
+                to_send = Batch(m for m in batch if not m.get("_replicated_from"))
+            if to_send:
+                self.start_send(to_send, gw.NORMAL_LANE)
+
+        # Priority lane takes a batch only when a sender is free, so anomalies coalesce
+        while self.inflight[gw.PRIORITY_LANE] < gw.PRIORITY_SENDER_THREADS:
+            batch = gw.priority_buffer.get_batch_if_ready()
+            if not batch:
+                break
+            self.start_send(batch, gw.PRIORITY_LANE)
+
+        self.arm_flush_timer(gw.NORMAL_LANE, gw.buffer, MAX_CONCURRENT_SENDS)
+        self.arm_flush_timer(gw.PRIORITY_LANE, gw.priority_buffer, gw.PRIORITY_SENDER_THREADS)
+
+    def arm_flush_timer(self, lane, buffer, capacity):
+        """Wake drain() when the buffer's age limit expires; a full lane is re-drained when a send finishes instead."""
+        timer = self.flush_timers.pop(lane, None)
+        if timer is not None:
+            timer.cancel()
+        flush_at = buffer.next_flush_at()
+        if flush_at is not None and self.inflight[lane] < capacity:
+            self.flush_timers[lane] = self.loop.call_later(max(0.0, flush_at - time.time()), self.drain)
+
+    def start_send(self, batch, lane):
+        self.inflight[lane] += 1
+        self.loop.create_task(self.send(batch, lane))
+
+    async def send(self, batch, lane):
+        gw = self.gw
+        started = time.time()
+        try:
+            if lane == gw.PRIORITY_LANE:
+                ok = await self.post_batch(self.priority_session, batch, gw.priority_buffer, gw.PRIORITY_RETRY_DELAY)
+            else:
+                ok = await self.post_batch(self.session, batch, gw.buffer, rest_client.RETRY_DELAY)
+            if ok:
+                gw.delivery.settle_batch(batch)
+            gw.record_send(batch, lane, started, ok)
+        finally:
+            self.inflight[lane] -= 1
+            self.drain()
+
+    async def post_batch(self, session, batch, requeue_buffer, retry_delay):
+        """Async counterpart of rest_client.send_to_cloud (a permanent 4xx drops and settles the batch)."""
+        headers, payload = rest_client.cloud_request(batch)
+        body = json.dumps(payload)
+        for attempt in range(1, rest_client.MAX_RETRIES + 1):
+            try:
+                async with session.post(rest_client.CLOUD_API_URL, data=body, headers=headers) as response:
+                    if response.status == 200:
+                        total = rest_client.count_sent(len(batch))
+                        log_info(
+                            f"[{self.gw.GATEWAY_ID}] Sent {len(batch)} records to cloud (total: {total})",
+                            key="sent", every=rest_client.SEND_LOG_SECONDS
+                        )
+                        return True
+                    if rest_client.is_rejected(response.status):
+                        rest_client.reject_batch(batch, response.status, await response.text(), self.gw.delivery.settle_batch)
+                        return False
+                    log_error(
+                        f"Cloud error {response.status}: {await response.text()}",
+                        key=f"cloud-error:{response.status}", every=rest_client.SEND_LOG_SECONDS
+                    )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log_error(f"Network error: {e}", key="network-error", every=rest_client.SEND_LOG_SECONDS)
+
+            if attempt < rest_client.MAX_RETRIES:
+                await asyncio.sleep(retry_delay)
+
+        requeue_buffer.requeue(batch)
+        log_error(
+            f"Failed to send batch after retries, re-queued {len(batch)} records",
+            key="requeue", every=rest_client.SEND_LOG_SECONDS
+        )
+        return False
+
+    # --- peers ---
+
+    async def handle_peer_data(self, request):
+        since = float(request.query.get("since", 0))
+        data = self.gw.peer_sync.log_since(since)
+        body = {"gateway_id": self.gw.GATEWAY_ID, "data": data, "count": len(data)}
+        return web.json_response(body, dumps=lambda obj: json.dumps(obj, default=str))
+
+    async def start_peer_server(self):
+        app = web.Application()
+        app.router.add_get("/peer/data", self.handle_peer_data)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", peer_sync_module.PEER_PORT).start()
+        log_info(f"[{self.gw.GATEWAY_ID}] Peer replication server on port {peer_sync_module.PEER_PORT}")
+        return runner
+
+    async def pull_peer(self, peer_id):
+        peer = self.gw.peer_sync
+        since = peer._last_sync.get(peer_id, 0)
+        try:
+            async with self.session.get(f"http://{peer_id}:{peer_sync_module.PEER_PORT}/peer/data",
+                                        params={"since": since}) as response:
+                if response.status == 200:
+                    peer.ingest_peer_data(peer_id, (await response.json()).get("data", []))
+        except aiohttp.ClientConnectionError:
+            pass
+        except Exception as e:
+            log_error(f"[{self.gw.GATEWAY_ID}] Pull from {peer_id} failed: {e}")
+
+    async def peer_sync_loop(self):
+        peer = self.gw.peer_sync
+        await asyncio.sleep(5)
+        while True:
+            peer.update_peers()
+            if peer._peers:
+                await asyncio.gather(*(self.pull_peer(peer_id) for peer_id in list(peer._peers)))
+                self.drain()
+            await asyncio.sleep(peer_sync_module.SYNC_INTERVAL)
+
+    # --- timers ---
+
+    async def every(self, interval, fn, run_first=True):
+        """Run a blocking control-plane call (config, model, heartbeat) off the loop every `interval` seconds."""
+        while True:
+            if run_first:
+                await self.loop.run_in_executor(None, fn)
+            run_first = True
+            await asyncio.sleep(interval() if callable(interval) else interval)
+
+    async def aggregation_flush_loop(self):
+        while True:
+            await asyncio.sleep(AGGREGATION_FLUSH_INTERVAL_SECONDS)
+            summaries = self.gw.aggregator.flush()
+            if summaries:
+                for summary in summaries:
+                    self.gw.buffer.add(summary)
+                self.drain()
+
+    def control_cycle(self):
+        self.gw.get_config()
+        self.gw.sync_revocations()
+        self.gw.heartbeat()
+
+    # --- lifecycle ---
+
+    async def main(self):
+        gw = self.gw
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.pending_ready = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(sig, self.stopping.set)
+
+        timeout = aiohttp.ClientTimeout(total=rest_client.TIMEOUT_SECONDS)
+        self.session = aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(
+            limit=SEND_CONNECTIONS, keepalive_timeout=KEEPALIVE_SECONDS))
+        # Own connection so anomalies never queue behind bulk sends
+        self.priority_session = aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(
+            limit=gw.PRIORITY_SENDER_THREADS, keepalive_timeout=KEEPALIVE_SECONDS))
+
+        log_info(f"[{gw.GATEWAY_ID}] Starting gateway (asyncio runtime)...")
+        await self.loop.run_in_executor(None, self.control_cycle)
+        peer_runner = await self.start_peer_server()
+        gw.peer_sync.membership.start(gw.shutdown_event)  # UDP gossip keeps its own threads
+        await self.connect_mqtt()
+
+        tasks = [self.loop.create_task(coro) for coro in (
+            *(self.scorer() for _ in range(SCORING_THREADS)),
+            self.aggregation_flush_loop(),
+            self.peer_sync_loop(),
+            self.every(gw.MODEL_REFRESH_INTERVAL_SECONDS, gw.refresh_model_once),
+            self.every(lambda: gw.CONFIG["config_check_interval"], self.control_cycle, run_first=False),
+        )]
+        log_info(f"[{gw.GATEWAY_ID}] Gateway running on one event loop ({SCORING_THREADS} scoring threads)")
+
+        await self.stopping.wait()
+        log_info(f"[{gw.GATEWAY_ID}] Shutdown signal received")
+        gw.shutdown_event.set()
+        for task in tasks:
+            task.cancel()
+        self.mqtt.disconnect()
+        await peer_runner.cleanup()
+        await self.session.close()
+        await self.priority_session.close()
+        self.scoring_pool.shutdown(wait=False)
+        log_info(f"[{gw.GATEWAY_ID}] Shutdown complete")
+
+
+def run(gateway):
+    """Run the gateway on a single asyncio event loop. `gateway` is the main module."""
+    asyncio.run(AsyncGateway(gateway).main())
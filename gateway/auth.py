@@ -1,7 +1,98 @@
-devices = {}
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
 
-def add_device(device_id, secret):
-    devices[device_id] = secret
+# Stateless device auth: devices present an HMAC token issued by cloud
+# provisioning, "v1.<issued_at>.<hex mac>" with mac = HMAC-SHA256(key, "<deviceId>:<issued_at>").
+# Verified tokens are cached so the per-message cost is one dict lookup; the
+# revocation list (deviceId -> revoked_at, whole seconds like issued_at) is
+# synced from the cloud.
 
-def validate_device(device_id, provided_secret):
-    return devices.get(device_id) == provided_secret
+DEVICE_TOKEN_KEY = os.getenv("DEVICE_TOKEN_KEY", "").encode()
+if not DEVICE_TOKEN_KEY:
+    raise RuntimeError("DEVICE_TOKEN_KEY is not set (the device token key shared with cloud provisioning)")
+TOKEN_VERSION = "v1"
+VERIFIED_CACHE_MAX = 65536
+
+
+def issue_token(device_id, issued_at=None, key=DEVICE_TOKEN_KEY):
+    """Sign a device token (same scheme as cloud provisioning)."""
+    issued_at = int(time.time()) if issued_at is None else int(issued_at)
+    mac = hmac.new(key, f"{device_id}:{issued_at}".encode(), hashlib.sha256).hexdigest()
+    return f"{TOKEN_VERSION}.{issued_at}.{mac}"
+
+
+class DeviceAuth:
+    """Verifies device tokens with an LRU of already-verified tokens and a revocation list."""
+
+    def __init__(self, key=DEVICE_TOKEN_KEY, cache_size=VERIFIED_CACHE_MAX):
+        self.key = key
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._verified = OrderedDict()  # token -> (device_id, issued_at)
+        self._revoked = {}  # device_id -> revoked_at
+        self.revocation_version = None
+        self.rejected = 0
+
+    def _check_signature(self, device_id, token):
+        """Return the token's issued_at if its MAC is valid for device_id, else None."""
+        parts = token.split(".")
+        if len(parts) != 3 or parts[0] != TOKEN_VERSION:
+            return None
+        try:
+            issued_at = int(parts[1])
+        except ValueError:
+            return None
+        expected = hmac.new(self.key, f"{device_id}:{issued_at}".encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, parts[2]):
+            return None
+        return issued_at
+
+    def verify(self, device_id, token):
+        """True if token is a valid, unrevoked token for device_id."""
+        if not device_id or not isinstance(token, str):
+            return self._reject()
+
+        with self._lock:
+            cached = self._verified.get(token)
+            if cached is not None:
+                self._verified.move_to_end(token)
+
+        if cached is not None:
+            if cached[0] != device_id:
+                return self._reject()
+            issued_at = cached[1]
+        else:
+            issued_at = self._check_signature(device_id, token)
+            if issued_at is None:
+                return self._reject()
+            with self._lock:
+                self._verified[token] = (device_id, issued_at)
+                if len(self._verified) > self.cache_size:
+                    self._verified.popitem(last=False)
+
+        # Tokens issued in or before the second of a revocation are dead. The cloud only
+        # signs new ones after the device is reinstated, and dates them past the revocation.
+        revoked_at = self._revoked.get(device_id)
+        if revoked_at is not None and issued_at <= revoked_at:
+            return self._reject()
+        return True
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        return False
+
+    def update_revocations(self, revoked, version):
+        """Replace the revocation list with the cloud's copy."""
+        self._revoked = {device_id: int(revoked_at) for device_id, revoked_at in revoked.items()}
+        self.revocation_version = version
+
+    def get_and_reset_rejected(self):
+        with self._lock:
+            rejected = self.rejected
+            self.rejected = 0
+        return rejected
@@ -0,0 +1,68 @@
+import threading
+import time
+
+# Adaptive batching: size batches from observed input rate and cloud latency
+# so that records reach the cloud within a target end-to-end latency.
+
+EWMA_ALPHA = 0.3
+ADDITIVE_STEP = 50      # records added to the batch cap after each healthy send
+DECREASE_FACTOR = 0.5   # cap multiplier after a slow or failed send
+RATE_SAMPLE_SECONDS = 0.2  # minimum interval between input rate samples
+
+
+class AdaptiveBatchPolicy:
+    """Nagle/AIMD-style batch sizing for gateway -> cloud sends."""
+
+    def __init__(self, target_latency_seconds=1.0, min_batch=1, max_batch=2000,
+                 min_wait_seconds=0.05, max_wait_seconds=5.0):
+        self.target_latency_seconds = target_latency_seconds
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.min_wait_seconds = min_wait_seconds
+        self.max_wait_seconds = max_wait_seconds
+
+        self._lock = threading.Lock()
+        self.input_rate = 0.0       # records/s (EWMA)
+        self.send_latency = 0.0     # seconds per POST (EWMA)
+        self.cap = max_batch        # AIMD-controlled upper bound on batch size
+        self._last_added = None
+        self._last_sample_time = None
+
+    def observe_input(self, total_added, now=None):
+        """Update the input rate estimate from the buffer's running add counter."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._last_added is not None:
+                if now - self._last_sample_time < RATE_SAMPLE_SECONDS:
+                    return
+                rate = (total_added - self._last_added) / (now - self._last_sample_time)
+                self.input_rate = EWMA_ALPHA * rate + (1 - EWMA_ALPHA) * self.input_rate
+            self._last_added = total_added
+            self._last_sample_time = now
+
+    def observe_send(self, batch_len, latency_seconds, ok=True):
+        """Record one cloud round trip; shrink the cap on slow/failed sends, grow it otherwise."""
+        with self._lock:
+            self.send_latency = EWMA_ALPHA * latency_seconds + (1 - EWMA_ALPHA) * self.send_latency
+            if not ok or latency_seconds > self.target_latency_seconds / 2:
+                self.cap = max(self.min_batch, int(self.cap * DECREASE_FACTOR))
+            else:
+                self.cap = min(self.max_batch, self.cap + ADDITIVE_STEP)
+
+    def next_limits(self):
+        """Return (batch_size, max_wait_seconds) for the current load."""
+        with self._lock:
+            # Whatever the send itself does not use of the latency target is spent waiting for more records
+            wait = self.target_latency_seconds - self.send_latency
+            wait = min(self.max_wait_seconds, max(self.min_wait_seconds, wait))
+            size = int(self.input_rate * wait)
+            size = min(self.cap, self.max_batch, max(self.min_batch, size))
+            return size, wait
+
+    def tune(self, buffer):
+        """Sample the buffer's input rate and apply the resulting limits to it."""
+        self.observe_input(buffer.added)
+        size, wait = self.next_limits()
+        if size != buffer.batch_size or abs(wait - buffer.max_wait_seconds) > 0.01:
+            buffer.reconfigure(size, wait)
+        return size, wait
@@ -0,0 +1,68 @@
+import json
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from logger import log_info
+
+# Control endpoint of a warm-standby gateway (GATEWAY_STANDBY=1). A standby
+# gateway has fetched its config, revocations and model and is connected to
+# the broker, but holds its shared subscription back. The autoscaler takes it
+# into service with POST /control/activate instead of starting a container.
+
+CONTROL_PORT = 5002
+
+
+def serve_control(gateway_id, api_key, status, activate, shutdown_event, port=CONTROL_PORT):
+    """Run the control server until shutdown.
+
+    `status()` returns the JSON-able state for GET /control/status;
+    `activate()` takes the gateway into service and returns False if it
+    already was.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/control/status":
+                self._reply(200, {"gateway_id": gateway_id, **status()})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/control/activate":
+                self._reply(404, {"error": "not found"})
+                return
+            if self.headers.get("Authorization") != f"Bearer {api_key}":
+                self._reply(401, {"error": "unauthorized"})
+                return
+            started = time.perf_counter()
+            activated = activate()
+            self._reply(200, {
+                "gateway_id": gateway_id,
+                "status": "activated" if activated else "already active",
+                "took_ms": round((time.perf_counter() - started) * 1000, 3)
+            })
+
+        def _reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *a):
+            pass
+
+    server = HTTPServer(("0.0.0.0", port), Handler)
+    server.timeout = 1
+    log_info(f"[{gateway_id}] Control server on port {port}")
+    while not shutdown_event.is_set():
+        server.handle_request()
+    server.server_close()
+
+
+def start_control(gateway_id, api_key, status, activate, shutdown_event, port=CONTROL_PORT):
+    threading.Thread(
+        target=serve_control,
+        args=(gateway_id, api_key, status, activate, shutdown_event, port),
+        daemon=True).start()
@@ -1,10 +1,22 @@
 import threading
 import time
-from collections import OrderedDict
+from collections import deque
 
-# Databuffer with lock and deduplication
+# Databuffer with lock. Batches that failed to send come back as a whole
+# (requeue) and go out again unchanged, so a retried batch keeps the sequence
+# range it was first sent with (rest_client.BatchSequencer) and the cloud can
+# recognise it.
+
+
+class Batch(list):
+    """Records taken from a buffer together; seq_start is set when the batch is first sent."""
+
+    __slots__ = ("seq_start",)
+
+    def __init__(self, records=()):
+        super().__init__(records)
+        self.seq_start = None
 
-DEDUP_CACHE_MAX = 100000  # max messageIds tracked for dedup
 
 class DataBuffer:
     def __init__(self, batch_size=10, max_wait_seconds=5):
@@ -13,41 +25,79 @@ class DataBuffer:
 
         self.buffer = []
         self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)  # signalled when a batch may have become ready
         self.last_flush_time = time.time()
-        self._seen_ids = OrderedDict()  # messageId dedup cache (FIFO eviction)
+        self.added = 0  # total records accepted, used to estimate input rate
+        self._retry = deque()  # requeued batches, sent again before anything new
 
     def add(self, data):
         with self.lock:
-            # Deduplicate by messageId if present
-            msg_id = data.get("messageId")
-            if msg_id:
-                if msg_id in self._seen_ids:
-                    return False  # duplicate, skip
-                self._seen_ids[msg_id] = True
-                # Evict oldest entries when cache is full
-                while len(self._seen_ids) > DEDUP_CACHE_MAX:
-                    self._seen_ids.popitem(last=False)
             self.buffer.append(data)
-            return True
+            self.added += 1
+            # Wake the sender when the batch fills up or a new flush deadline starts
+            if len(self.buffer) == 1 or len(self.buffer) >= self.batch_size:
+                self.ready.notify_all()
+
+    def reconfigure(self, batch_size=None, max_wait_seconds=None):
+        """Apply new batching limits in place, keeping buffered records and requeued batches."""
+        with self.lock:
+            if batch_size is not None:
+                self.batch_size = int(batch_size)
+            if max_wait_seconds is not None:
+                self.max_wait_seconds = float(max_wait_seconds)
+            self.ready.notify_all()
 
     # Check if there is enough entries to send it to the database or if enough time has passed since last addition
     def get_batch_if_ready(self):
         with self.lock:
-            now = time.time()
+            return self._take_batch_if_ready(time.time())
+
+    def wait_for_batch(self, timeout=None):
+        """Block until a batch is ready (size or age limit reached) or timeout expires. Returns the batch or None."""
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.ready:
+            while True:
+                now = time.time()
+                batch = self._take_batch_if_ready(now)
+                if batch:
+                    return batch
+                if deadline is not None and now >= deadline:
+                    return None
+
+                wake_at = deadline
+                if self.buffer:
+                    flush_at = self.last_flush_time + self.max_wait_seconds
+                    wake_at = flush_at if wake_at is None else min(wake_at, flush_at)
+                self.ready.wait(None if wake_at is None else max(0.0, wake_at - now))
+
+    def next_flush_at(self):
+        """Time at which the age limit flushes the current contents, or None if the buffer is empty."""
+        with self.lock:
+            if self._retry:
+                return time.time()
+            if not self.buffer:
+                return None
+            return self.last_flush_time + self.max_wait_seconds
 
-            if (
-                len(self.buffer) >= self.batch_size
-                or (self.buffer and now - self.last_flush_time >= self.max_wait_seconds)
-            ):
-                # Return exactly batch_size items (or all if fewer remain)
-                count = min(len(self.buffer), self.batch_size)
-                batch = self.buffer[:count]
-                self.buffer = self.buffer[count:]
-                self.last_flush_time = now
-                return batch
+    def _take_batch_if_ready(self, now):
+        """Pop a requeued batch, or up to batch_size records if the flush condition holds. Must hold lock."""
+        if self._retry:
+            return self._retry.popleft()
+        if (
+            len(self.buffer) >= self.batch_size
+            or (self.buffer and now - self.last_flush_time >= self.max_wait_seconds)
+        ):
+            # Return exactly batch_size items (or all if fewer remain)
+            count = min(len(self.buffer), self.batch_size)
+            batch = Batch(self.buffer[:count])
+            self.buffer = self.buffer[count:]
+            self.last_flush_time = now
+            return batch
 
-            return None
+        return None
 
     def requeue(self, batch):
+        """Put a batch that failed to send back, to be taken again as it is."""
         with self.lock:
-            self.buffer = batch + self.buffer
+            self._retry.append(batch)
+            self.ready.notify_all()
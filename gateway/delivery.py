@@ -0,0 +1,65 @@
+import threading
+
+# Deferred MQTT acknowledgements (MQTT_QOS=1 with manual acks, see mqtt_client.py).
+#
+# Each QoS 1 delivery keeps its packet id on the Record (ack_id) and is acked
+# only when the record is settled:
+#   - its batch was accepted by the cloud (either lane),
+#   - it was folded into an aggregation window whose summary was accepted
+#     (the summary's messageId holds the ids of its readings), or
+#   - the gateway dropped it on purpose (shed, invalid, unauthorized, duplicate).
+# A batch that fails and is re-queued stays unacked, so if the gateway dies the
+# broker redelivers it from the persistent session.
+
+
+class DeliveryTracker:
+    """Acks MQTT deliveries once their records are settled; a no-op until bind() is called."""
+
+    def __init__(self):
+        self.enabled = False
+        self._ack = None
+        self._lock = threading.Lock()
+        self._held = {}  # summary messageId -> ack ids of the readings folded into it
+
+    def bind(self, ack):
+        """Start deferring acks; ack(mid) must send the PUBACK for one delivery (from any thread)."""
+        self._ack = ack
+        self.enabled = True
+
+    def track(self, record, mid):
+        """Attach a delivery's packet id to the record built from it."""
+        if self.enabled:
+            record.ack_id = mid
+
+    def ack(self, mid):
+        """Acknowledge a delivery that never became a record (shed or undecodable)."""
+        if self.enabled:
+            self._ack(mid)
+
+    def settle(self, record):
+        """Acknowledge the delivery behind a record the gateway is done with."""
+        if not self.enabled:
+            return
+        mid = getattr(record, "ack_id", None)
+        if mid is not None:
+            del record.ack_id
+            self._ack(mid)
+
+    def hold(self, message_id, mids):
+        """Defer the acks of readings folded into a summary until the summary is settled."""
+        if self.enabled and mids:
+            with self._lock:
+                self._held[message_id] = mids
+
+    def settle_batch(self, batch):
+        """Acknowledge everything behind a batch the cloud accepted."""
+        if not self.enabled:
+            return
+        for record in batch:
+            if type(record) is dict:
+                with self._lock:
+                    mids = self._held.pop(record.get("messageId"), ())
+                for mid in mids:
+                    self._ack(mid)
+            else:
+                self.settle(record)
@@ -0,0 +1,37 @@
+import threading
+from collections import deque
+
+# Gateway-to-cloud latency per send lane, reported with each heartbeat
+
+LANE_SAMPLE_LIMIT = 10000  # most recent samples kept per lane between heartbeats
+
+
+class LaneMetrics:
+    """Latency samples (gateway receive -> cloud acceptance) per lane."""
+
+    def __init__(self, lanes):
+        self.lock = threading.Lock()
+        self.samples = {lane: deque(maxlen=LANE_SAMPLE_LIMIT) for lane in lanes}
+        self.counts = {lane: 0 for lane in lanes}
+
+    def observe(self, lane, latencies):
+        with self.lock:
+            self.samples[lane].extend(latencies)
+            self.counts[lane] += len(latencies)
+
+    def get_and_reset(self):
+        """Per-lane record count and p50/p99/max latency in ms since the last call."""
+        with self.lock:
+            snapshot = {lane: (self.counts[lane], sorted(values)) for lane, values in self.samples.items()}
+            for lane in self.samples:
+                self.samples[lane].clear()
+                self.counts[lane] = 0
+
+        report = {}
+        for lane, (count, values) in snapshot.items():
+            if not values:
+                report[lane] = {"records": count}
+                continue
+            pick = lambda pct: round(values[min(len(values) - 1, int(len(values) * pct / 100.0))] * 1000, 1)
+            report[lane] = {"records": count, "p50_ms": pick(50), "p99_ms": pick(99), "max_ms": round(values[-1] * 1000, 1)}
+        return report
@@ -1,13 +1,144 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
+# Log calls only put the record on a bounded queue; a background writer thread
+# formats and writes it. If the writer falls behind, records are dropped (and
+# the count is reported on the next line written) rather than blocking callers.
+#
+# Hot-path call sites pass a `key` so that only one line per key is written
+# every `every` seconds; the next line for that key reports how many were
+# suppressed. LOG_FORMAT=json writes one JSON object per line.
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" or "json"
+LOG_QUEUE_SIZE = 10000
+LOG_SAMPLE_SECONDS = 60  # default window for keyed log lines
+SAMPLED_KEYS_MAX = 100000  # keys tracked for sampling; the table is reset past this
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        if getattr(record, "suppressed", 0):
+            line += f" (+{record.suppressed} similar suppressed)"
+        if getattr(record, "dropped", 0):
+            line += f" ({record.dropped} log lines dropped)"
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        for field in ("key", "suppressed", "dropped"):
+            if getattr(record, field, None):
+                entry[field] = getattr(record, field)
+        return json.dumps(entry)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: it drops records when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Messages are already formatted strings; formatting happens on the writer thread
+        return record
+
+    def enqueue(self, record):
+        dropped = self.dropped
+        if dropped:
+            record.dropped = dropped
+        try:
+            self.queue.put_nowait(record)
+            self.dropped -= dropped
+        except queue.Full:
+            self.dropped += 1
+
+
+class Sampler:
+    """Allows one log line per key per window and counts the rest."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = {}  # key -> [window_started, suppressed]
+
+    def admit(self, key, every):
+        """Number of suppressed lines to report if a line for key may be written now, else None."""
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None and now - window[0] < every:
+                window[1] += 1
+                return None
+            if window is None and len(self._windows) >= SAMPLED_KEYS_MAX:
+                self._windows.clear()
+            suppressed = window[1] if window is not None else 0
+            self._windows[key] = [now, 0]
+            return suppressed
+
+
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(
+    JsonFormatter() if LOG_FORMAT == "json" else TextFormatter("%(asctime)s [%(levelname)s] %(message)s")
 )
+queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+sampler = Sampler()
+_listener = None
+
+
+def _start_writer():
+    """Start the writer thread on a fresh queue (also called in forked children, where it is not inherited)."""
+    global _listener
+    queue_handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler.dropped = 0
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+
+
+def stop_logging():
+    """Write out what is queued and stop the writer thread; runs at interpreter exit."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+_start_writer()
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_start_writer)
+
+
+def _log(level, message, key, every):
+    extra = None
+    if key is not None:
+        suppressed = sampler.admit(key, every)
+        if suppressed is None:
+            return
+        extra = {"key": key, "suppressed": suppressed}
+    if callable(message):
+        message = message()
+    logging.log(level, message, extra=extra)
+
+
+def log_info(message, key=None, every=LOG_SAMPLE_SECONDS):
+    """Log at INFO; with a key, at most one line per key every `every` seconds.
+
+    `message` may be a zero-argument callable; it is only called if the line is written.
+    """
+    _log(logging.INFO, message, key, every)
 
-def log_info(message):
-    logging.info(message)
 
-def log_error(message):
-    logging.error(message)
-    
\ No newline at end of file
+def log_error(message, key=None, every=LOG_SAMPLE_SECONDS):
+    """Log at ERROR; with a key, at most one line per key every `every` seconds."""
+    _log(logging.ERROR, message, key, every)
@@ -2,25 +2,30 @@ import time
 import threading
 import signal
 import sys
-import uuid
 import rest_client
 import mqtt_client
 import os
 import requests
-from data_buffer import DataBuffer
+from data_buffer import DataBuffer, Batch
+from batch_policy import AdaptiveBatchPolicy
+from admission import AdmissionController
+from lane_metrics import LaneMetrics
+from aggregator import EdgeAggregator
+from delivery import DeliveryTracker
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
-from auth import validate_device, add_device
+from auth import DeviceAuth
+from record import profile_key_for
 from logger import log_info, log_error
 from anomaly_detector import AnomalyDetector
+from model_format import BinaryModel, write_model
 from peer_sync import PeerSync
-
-# Example of how to add a device
-add_device("sensor-001", "device-secret")
-add_device("sensor-002", "device-secret")
-add_device("sensor-003", "device-secret")
+from control import start_control
 
 WORKER_THREAD_COUNT = 20  # Fixed number of worker threads
+GATEWAY_RUNTIME = os.getenv("GATEWAY_RUNTIME", "threads")  # "threads" or "asyncio" (async_runtime.py)
+GATEWAY_WORKERS = int(os.getenv("GATEWAY_WORKERS", "1"))  # > 1: supervisor + worker processes (supervisor.py)
+GATEWAY_STANDBY = os.getenv("GATEWAY_STANDBY", "0") == "1"  # warm standby until activated (control.py); threads runtime only
 API_KEY = "secretAPIkey"
 GATEWAY_ID = os.getenv("GATEWAY_ID", "gateway-01")
 
@@ -29,24 +34,61 @@ CONFIG = {
     "max_wait_seconds": 5,
     "gateway_id": GATEWAY_ID,
     "config_version": "0",
-    "config_check_interval": 30
+    "config_check_interval": 30,
+    "batch_mode": os.getenv("BATCH_MODE", "fixed"),  # "fixed" or "adaptive"
+    "target_latency_ms": 1000,
+    "adaptive_max_batch": 2000,
+    "aggregation_window_seconds": int(os.getenv("AGGREGATION_WINDOW_SECONDS", "0"))  # 0 = forward raw readings
 }
 
 CONFIG_URL = f"http://cloud-api:8000/config/{GATEWAY_ID}"
 HEARTBEAT_URL = "http://cloud-api:8000/heartbeat"
 MODEL_URL = "http://cloud-api:8000/ml/model"
+MODEL_BINARY_URL = "http://cloud-api:8000/ml/model.bin"
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "binary")  # "binary" (model.bin, mapped as-is) or "json"
+REVOCATIONS_URL = "http://cloud-api:8000/devices/revocations"
 MODEL_REFRESH_INTERVAL_SECONDS = 20
 
+# Priority lane: records flagged isAnomaly skip the normal batching and go out immediately
+NORMAL_LANE = "normal"
+PRIORITY_LANE = "priority"
+PRIORITY_BATCH_SIZE = 20
+PRIORITY_SENDER_THREADS = 2
+PRIORITY_RETRY_DELAY = 0.2  # seconds
+
+AGGREGATION_FLUSH_INTERVAL_SECONDS = 1
+
+# Hot-path log lines are sampled per key (see logger.py)
+ANOMALY_LOG_SECONDS = 10  # at most one anomaly line per profile per window
+ERROR_LOG_SECONDS = 10
+
 buffer = DataBuffer(batch_size=50, max_wait_seconds=5)
+priority_buffer = DataBuffer(batch_size=PRIORITY_BATCH_SIZE, max_wait_seconds=0)
+priority_session = requests.Session()  # own connection so anomalies never queue behind bulk sends
+lane_metrics = LaneMetrics([NORMAL_LANE, PRIORITY_LANE])
+delivery = DeliveryTracker()  # deferred MQTT acks at QoS 1 (mqtt_client.MQTT_QOS)
+aggregator = EdgeAggregator(CONFIG["aggregation_window_seconds"], delivery=delivery)
+config_etag = {"value": None}
+model_etag = {"value": None}
+batch_policy = AdaptiveBatchPolicy()
+admission = AdmissionController()
+device_auth = DeviceAuth()
 message_counter = {"count": 0, "lock": threading.Lock()}
 shutdown_event = threading.Event()
 detector = AnomalyDetector()
 peer_sync = PeerSync(GATEWAY_ID, buffer)
+gateway_state = {"status": "standby" if GATEWAY_STANDBY else "alive", "lock": threading.Lock()}
+subscription = mqtt_client.Subscription(active=not GATEWAY_STANDBY)
 
 worker_pool = ThreadPoolExecutor(
     max_workers=WORKER_THREAD_COUNT,
     thread_name_prefix="iot-worker"
 )
+priority_pool = ThreadPoolExecutor(
+    max_workers=PRIORITY_SENDER_THREADS,
+    thread_name_prefix="priority-sender"
+)
+priority_slots = threading.Semaphore(PRIORITY_SENDER_THREADS)
 
 def increment_message_count():
     with message_counter["lock"]:
@@ -61,29 +103,50 @@ def get_and_reset_message_count():
 
 def make_profile_key(message):
     """Build unique profile key for per-sensor-type model lookup."""
-    device_id = message.get("deviceId", "unknown-device")
-    sensor_type = message.get("sensorType", "unknown-sensor")
-    return f"{device_id}::{sensor_type}"
+    return profile_key_for(message.get("deviceId", "unknown-device"), message.get("sensorType", "unknown-sensor"))
 
 
-def refresh_model_once():
-    """Fetch latest cloud-trained model and update edge detector."""
+def fetch_model():
+    """Fetch the latest cloud-trained model as a BinaryModel, or None if there is none yet or it is unchanged."""
     try:
-        response = requests.get(MODEL_URL, headers={"Authorization": f"Bearer {API_KEY}"}, timeout=5)
+        if MODEL_FORMAT == "json":
+            response = requests.get(MODEL_URL, headers={"Authorization": f"Bearer {API_KEY}"}, timeout=5)
+            if response.status_code != 200:
+                log_error(f"[{GATEWAY_ID}] Model error")
+                return None
+
+            payload = response.json()
+            if payload.get("status") == "pending":
+                log_info(f"[{GATEWAY_ID}] Model not ready")
+                return None
+            return BinaryModel(write_model(payload.get("model", payload)))
+
+        headers = {"Authorization": f"Bearer {API_KEY}"}
+        if model_etag["value"]:
+            headers["If-None-Match"] = model_etag["value"]
+        response = requests.get(MODEL_BINARY_URL, headers=headers, timeout=5)
+        if response.status_code == 304:
+            return None
+        if response.status_code == 204:
+            log_info(f"[{GATEWAY_ID}] Model not ready")
+            return None
         if response.status_code != 200:
             log_error(f"[{GATEWAY_ID}] Model error")
-            return
+            return None
+        model = BinaryModel(response.content)
+        model_etag["value"] = response.headers.get("ETag")
+        return model
+    except Exception as e:
+        log_error(f"[{GATEWAY_ID}] Model refresh failed: {e}")
+        return None
 
-        payload = response.json()
-        if payload.get("status") == "pending":
-            log_info(f"[{GATEWAY_ID}] Model not ready")
-            return
 
-        detector.update_model(payload.get("model", payload))
-        features = payload.get("model", payload).get("features", {})
-        log_info(f"[{GATEWAY_ID}] Model updated with {len(features)} profiles")
-    except Exception as e:
-        log_error(f"[{GATEWAY_ID}] Model refresh failed")
+def refresh_model_once():
+    """Fetch latest cloud-trained model and update edge detector."""
+    model = fetch_model()
+    if model is not None:
+        detector.update_model(model)
+        log_info(f"[{GATEWAY_ID}] Model updated with {len(model)} profiles")
 
 
 def model_refresh_loop():
@@ -93,110 +156,227 @@ def model_refresh_loop():
         time.sleep(MODEL_REFRESH_INTERVAL_SECONDS)
 
 def process_message(message):
-    """Worker thread: process incoming MQTT message, apply ML, add to buffer and to the replication log."""
+    """Worker thread: process an incoming Record, apply ML, add it to the buffer and the replication log."""
     try:
-        # Assign unique ID for deduplication and replication tracking
-        message["messageId"] = str(uuid.uuid4())
+        message.received_at = time.time()
 
-        deviceid = message.get("deviceId")
-        signature = message.pop("signature", None)
-
-        # Auto-register unknown devices with valid signature
-        if not validate_device(deviceid, signature):
-            if signature == "device-secret":
-                add_device(deviceid, signature)
-                log_info(f"[{GATEWAY_ID}] Auto-registered device: {deviceid}")
-            else:
-                log_info(f"[{GATEWAY_ID}] Unauthorized device attempt: {deviceid}")
-                return
+        # Signed device token; rejections are counted and reported with the heartbeat
+        if not device_auth.verify(getattr(message, "device_id", None), message.pop("signature")):
+            delivery.settle(message)
+            return
 
         increment_message_count()
 
+        is_anomaly = False
         if "value" in message:
-            profile_key = make_profile_key(message)
-            ml_result = detector.score(profile_key, message["value"])
-            message["profileKey"] = profile_key
-            message["isAnomaly"] = ml_result["isAnomaly"]
-            message["anomalyScore"] = ml_result["anomalyScore"]
-            if ml_result.get("hasProfile"):
-                message["modelTimestamp"] = ml_result.get("modelTimestamp")
-                if ml_result["isAnomaly"]:
+            profile_key = message.profile
+            ml_result = detector.score(profile_key, message.value)
+            is_anomaly = ml_result["isAnomaly"]
+            message.profile_key = profile_key
+            message.is_anomaly = is_anomaly
+            message.anomaly_score = ml_result["anomalyScore"]
+            if ml_result["hasProfile"]:
+                message.model_timestamp = ml_result["modelTimestamp"]
+                if is_anomaly:
                     log_info(
                         f"[{GATEWAY_ID}] !!!ANOMALY DETECTED!!! {profile_key} "
-                        f"value={message['value']} score={ml_result['anomalyScore']:.2f}"
+                        f"value={message.value} score={ml_result['anomalyScore']:.2f}",
+                        key=f"anomaly:{profile_key}", every=ANOMALY_LOG_SECONDS
                     )
             else:
-                log_info(f"[{GATEWAY_ID}] No profile for {profile_key} yet")
+                log_info(f"[{GATEWAY_ID}] No profile for {profile_key} yet", key=f"no-profile:{profile_key}")
 
-        buffer.add(message)
+        # Anomalies take the priority lane; with edge aggregation on, routine
+        # readings are folded into window summaries instead of sent raw
+        if is_anomaly:
+            priority_buffer.add(message)
+        elif not aggregator.add(message):
+            buffer.add(message)
 
         # Add to replication log so peers can pull this record
         peer_sync.add_to_log(message)
 
     except Exception as e:
-        log_error(f"[{GATEWAY_ID}] Error processing message: {e}")
+        delivery.settle(message)
+        log_error(f"[{GATEWAY_ID}] Error processing message: {e}", key=f"process-error:{type(e).__name__}", every=ERROR_LOG_SECONDS)
 
 def mqtt_message_callback(message):
     worker_pool.submit(process_message, message)
 
+def record_send(batch, lane, started, ok):
+    """Feed a finished send to the lane latency metrics (and the adaptive policy for the normal lane)."""
+    finished = time.time()
+    if lane == NORMAL_LANE:
+        batch_policy.observe_send(len(batch), finished - started, ok)
+    if ok:
+        lane_metrics.observe(lane, [finished - m["gatewayReceivedAt"] for m in batch if "gatewayReceivedAt" in m])
+
+def send_batch(batch, lane=NORMAL_LANE):
+    """Worker thread: send one batch on its lane and record its latency."""
+    started = time.time()
+    if lane == PRIORITY_LANE:
+        ok = rest_client.send_to_cloud(
+            batch, session=priority_session, requeue=priority_buffer.requeue, retry_delay=PRIORITY_RETRY_DELAY,
+            discard=delivery.settle_batch
+        )
+    else:
+        ok = rest_client.send_to_cloud(batch, requeue=buffer.requeue, discard=delivery.settle_batch)
+    if ok:
+        delivery.settle_batch(batch)
+    record_send(batch, lane, started, ok)
+
 def batch_sender_loop():
-    """Background thread: check if batch is ready and send to cloud API."""
+    """Background thread: wait for the buffer to signal a ready batch and send it to cloud API."""
     while not shutdown_event.is_set():
         try:
-            # Drain all ready batches
-            sent_any = False
-            while True:
-                batch = buffer.get_batch_if_ready()
-                if batch:
-                    # Filter out peer-replicated records: only origin should send to cloud
-                    to_send = [m for m in batch if not m.get("_replicated_from")]
-                    replicated_count = len(batch) - len(to_send)
-                    if replicated_count:
-                        log_info(f"[{GATEWAY_ID}] Dropping {replicated_count} replicated records from cloud send")
-
-                    if to_send:
-                        worker_pool.submit(rest_client.send_to_cloud, to_send)
-                    sent_any = True
-                else:
-                    break
-            if not sent_any:
-                time.sleep(0.1)
+            if CONFIG["batch_mode"] == "adaptive":
+                batch_policy.tune(buffer)
+
+            batch = buffer.wait_for_batch(timeout=0.5)
+            if not batch:
+                continue
+
+            # Filter out peer-replicated records: only origin should send to cloud
+            to_send = batch  # as is, so a requeued batch keeps its sequence range
+            replicated_count = sum(1 for m in batch if m.get("_replicated_from"))
+            if replicated_count:
+                to_send = Batch(m for m in batch if not m.get("_replicated_from"))
+                log_info(
+                    f"[{GATEWAY_ID}] Dropping {replicated_count} replicated records from cloud send",
+                    key="replicated-drop", every=ERROR_LOG_SECONDS
+                )
+
+            if to_send:
+                worker_pool.submit(send_batch, to_send)
         except Exception as e:
             log_error(f"[{GATEWAY_ID}] Error sending batch: {e}")
             time.sleep(0.5)
 
+def priority_sender_loop():
+    """Background thread: flush the priority lane as soon as a sender is free.
+
+    Taking a batch only when a sender slot is available lets anomalies that
+    arrive during an in-flight send go out together in the next batch
+    instead of queueing up as one-record requests.
+    """
+    while not shutdown_event.is_set():
+        if not priority_slots.acquire(timeout=0.5):
+            continue
+        try:
+            batch = priority_buffer.wait_for_batch(timeout=0.5)
+            if not batch:
+                priority_slots.release()
+                continue
+            future = priority_pool.submit(send_batch, batch, PRIORITY_LANE)
+            future.add_done_callback(lambda _: priority_slots.release())
+        except Exception as e:
+            priority_slots.release()
+            log_error(f"[{GATEWAY_ID}] Error sending priority batch: {e}")
+            time.sleep(0.1)
+
+def aggregation_flush_loop():
+    """Background thread: move closed aggregation windows into the buffer as summary records."""
+    while not shutdown_event.is_set():
+        try:
+            for summary in aggregator.flush():
+                buffer.add(summary)
+        except Exception as e:
+            log_error(f"[{GATEWAY_ID}] Error flushing aggregation windows: {e}")
+        time.sleep(AGGREGATION_FLUSH_INTERVAL_SECONDS)
+
+def apply_batch_config():
+    """Push CONFIG batching settings into the buffer (fixed mode) or the adaptive policy, and the aggregation window."""
+    aggregator.window_seconds = int(CONFIG["aggregation_window_seconds"])
+    if CONFIG["batch_mode"] == "adaptive":
+        batch_policy.target_latency_seconds = float(CONFIG["target_latency_ms"]) / 1000.0
+        batch_policy.max_batch = int(CONFIG["adaptive_max_batch"])
+        batch_policy.max_wait_seconds = float(CONFIG["max_wait_seconds"])
+        batch_policy.tune(buffer)
+    else:
+        buffer.reconfigure(CONFIG["batch_size"], CONFIG["max_wait_seconds"])
+
 def get_config():
-    """Fetches gateway configs from cloud-api and updates local CONFIG and data buffer"""
-    global buffer, CONFIG
+    """Fetches gateway configs from cloud-api and applies them to the running data buffer when the version changes"""
     try:
-        response = requests.get(CONFIG_URL, headers={"Authorization": f"Bearer {API_KEY}"})
+        headers = {"Authorization": f"Bearer {API_KEY}"}
+        if config_etag["value"]:
+            headers["If-None-Match"] = config_etag["value"]
+        response = requests.get(CONFIG_URL, headers=headers, timeout=5)
+        if response.status_code == 304:
+            return
         if response.status_code == 200:
             new_config = response.json()["config"]
+            config_etag["value"] = response.headers.get("ETag")
+            new_version = str(new_config.get("config_version", CONFIG["config_version"]))
+            if new_version == CONFIG["config_version"]:
+                return
             CONFIG.update(new_config)
-            buffer = DataBuffer(CONFIG["batch_size"], CONFIG["max_wait_seconds"])
-            # Update peer_sync to reference the new buffer
-            peer_sync.buffer = buffer
+            CONFIG["config_version"] = new_version
+            apply_batch_config()
+            log_info(
+                f"[{GATEWAY_ID}] Config v{new_version} applied (mode={CONFIG['batch_mode']}, "
+                f"batch_size={CONFIG['batch_size']}, max_wait_seconds={CONFIG['max_wait_seconds']})"
+            )
     except Exception as e:
         log_error(f"[{GATEWAY_ID}] Configuration fetch failed: {e}")
 
-def heartbeat():
-    """Send heartbeat to cloud-api with current load metrics"""
+def sync_revocations():
+    """Pull the device revocation list from cloud provisioning when it has changed."""
+    try:
+        headers = {"Authorization": f"Bearer {API_KEY}"}
+        if device_auth.revocation_version is not None:
+            headers["If-None-Match"] = device_auth.revocation_version
+        response = requests.get(REVOCATIONS_URL, headers=headers, timeout=5)
+        if response.status_code == 304:
+            return
+        if response.status_code == 200:
+            revoked = response.json()["revoked"]
+            device_auth.update_revocations(revoked, response.headers.get("ETag"))
+            log_info(f"[{GATEWAY_ID}] Revocation list updated ({len(revoked)} revoked devices)")
+    except Exception as e:
+        log_error(f"[{GATEWAY_ID}] Revocation sync failed: {e}")
+
+def collect_stats():
+    """Load metrics since the last heartbeat (counters reset on read)."""
+    admission_counters = admission.get_and_reset_counters()
+    return {
+        "message_rate": get_and_reset_message_count(),
+        "records_sent": rest_client.get_records_sent(),
+        "admitted_messages": admission_counters["admitted"],
+        "shed_messages": admission_counters["shed"],
+        "unchecked_messages": admission_counters["unchecked"],
+        "shed_by_type": admission_counters["shed_by_type"],
+        "tracked_devices": admission_counters["tracked_devices"],
+        "lane_latency": lane_metrics.get_and_reset(),
+        "aggregation": aggregator.get_and_reset_counters(),
+        "auth_rejected": device_auth.get_and_reset_rejected()
+    }
+
+def heartbeat(stats=None):
+    """Send heartbeat to cloud-api with current load metrics (this process's, unless stats are given)"""
     try:
-        msg_rate = get_and_reset_message_count()
-        records_sent = rest_client.get_records_sent()
+        stats = collect_stats() if stats is None else stats
         payload = {
             "gatewayId": GATEWAY_ID,
-            "status": "alive",
+            "status": gateway_state["status"],
             "timestamp": datetime.now().isoformat() + "Z",
-            "message_rate": msg_rate,
-            "records_sent": records_sent
+            **stats
         }
         requests.post(
             HEARTBEAT_URL,
             json=payload,
             headers={"Authorization": f"Bearer {API_KEY}"}
         )
-        log_info(f"[{GATEWAY_ID}] Heartbeat sent (msg_rate={msg_rate}, records_sent={records_sent})")
+        lane_latency = stats["lane_latency"]
+        log_info(
+            f"[{GATEWAY_ID}] Heartbeat sent (msg_rate={stats['message_rate']}, records_sent={stats['records_sent']}, "
+            f"admitted={stats['admitted_messages']}, shed={stats['shed_messages']}, "
+            f"unchecked={stats['unchecked_messages']}, devices={stats['tracked_devices']}, "
+            f"priority_p99={lane_latency[PRIORITY_LANE].get('p99_ms', '-')}ms, "
+            f"normal_p99={lane_latency[NORMAL_LANE].get('p99_ms', '-')}ms, "
+            f"aggregated={stats['aggregation']['readings_in']}->{stats['aggregation']['summaries_out']}, "
+            f"auth_rejected={stats['auth_rejected']})"
+        )
     except Exception as e:
         log_error(f"[{GATEWAY_ID}] Heartbeat failed: {e}")
 
@@ -207,39 +387,86 @@ def graceful_shutdown():
     log_info(f"[{GATEWAY_ID}] Shutdown complete")
     sys.exit(0)
 
-def main():
-    """Main entry point: start MQTT listener, peer sync, model refresh and batch sender threads."""
-    signal.signal(signal.SIGTERM, graceful_shutdown)
-    signal.signal(signal.SIGINT, graceful_shutdown)
-
-    log_info(f"[{GATEWAY_ID}] Starting gateway...")
-    get_config()
-    heartbeat()
-
-    # MQTT client listener
+def activate():
+    """Take a warm-standby gateway into service: subscribe, join replication, report alive. False if already active."""
+    with gateway_state["lock"]:
+        if gateway_state["status"] != "standby":
+            return False
+        gateway_state["status"] = "alive"
+    subscription.activate()
+    peer_sync.start(shutdown_event)
+    threading.Thread(target=heartbeat, daemon=True).start()  # let the autoscaler see the new capacity now
+    log_info(f"[{GATEWAY_ID}] Activated from warm standby")
+    return True
+
+def standby_status():
+    """State reported on the control endpoint."""
+    return {
+        "status": gateway_state["status"],
+        "config_version": CONFIG["config_version"],
+        "model_generated_at": detector.model_generated_at,
+        "mqtt_connected": subscription.client is not None
+    }
+
+def start_pipeline(client_id=None, serve_peers=True, refresh_model=True):
+    """Start the MQTT listener and the background threads of the message pipeline."""
     mqtt_thread = threading.Thread(
         target=mqtt_client.start_mqtt,
-        args=(mqtt_message_callback,),
+        args=(mqtt_message_callback, client_id, admission, delivery, subscription),
         daemon=True
     )
     mqtt_thread.start()
     log_info(f"[{GATEWAY_ID}] MQTT listener started with {WORKER_THREAD_COUNT} workers")
 
-    model_thread = threading.Thread(target=model_refresh_loop, daemon=True)
-    model_thread.start()
+    if refresh_model:
+        model_thread = threading.Thread(target=model_refresh_loop, daemon=True)
+        model_thread.start()
 
-    # Peer-to-peer replication (eventual consistency)
-    peer_sync.start(shutdown_event)
-    log_info(f"[{GATEWAY_ID}] Peer replication enabled")
+    # Peer-to-peer replication (eventual consistency); a standby joins on activation
+    if serve_peers and gateway_state["status"] != "standby":
+        peer_sync.start(shutdown_event)
+        log_info(f"[{GATEWAY_ID}] Peer replication enabled")
 
     # Batch sender
     rest_thread = threading.Thread(target=batch_sender_loop, daemon=True)
     rest_thread.start()
+    priority_thread = threading.Thread(target=priority_sender_loop, daemon=True)
+    priority_thread.start()
+    aggregation_thread = threading.Thread(target=aggregation_flush_loop, daemon=True)
+    aggregation_thread.start()
+
+def main():
+    """Main entry point: start MQTT listener, peer sync, model refresh and batch sender threads."""
+    if GATEWAY_STANDBY and (GATEWAY_WORKERS > 1 or GATEWAY_RUNTIME == "asyncio"):
+        log_error(f"[{GATEWAY_ID}] Warm standby needs the threads runtime; starting active")
+        gateway_state["status"] = "alive"
+        subscription.active = True
+    if GATEWAY_WORKERS > 1:
+        import supervisor
+        supervisor.run(sys.modules[__name__], GATEWAY_WORKERS)
+        return
+    if GATEWAY_RUNTIME == "asyncio":
+        import async_runtime
+        async_runtime.run(sys.modules[__name__])
+        return
+
+    signal.signal(signal.SIGTERM, graceful_shutdown)
+    signal.signal(signal.SIGINT, graceful_shutdown)
+
+    log_info(f"[{GATEWAY_ID}] Starting gateway...")
+    get_config()
+    sync_revocations()
+    heartbeat()
+
+    start_pipeline()
+    if GATEWAY_STANDBY:
+        start_control(GATEWAY_ID, API_KEY, standby_status, activate, shutdown_event)
 
     # Main loop: heartbeat + config check
     while not shutdown_event.is_set():
         time.sleep(CONFIG["config_check_interval"])
         get_config()
+        sync_revocations()
         heartbeat()
 
 if __name__ == "__main__":
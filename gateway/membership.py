@@ -0,0 +1,292 @@
+import json
+import math
+import random
+import socket
+import threading
+import time
+import requests
+from logger import log_info, log_error
+
+# SWIM-style gossip membership among gateways (Das et al., 2002).
+#
+# Every PROTOCOL_PERIOD a gateway pings one member (round-robin over a shuffled
+# list). If no ack arrives within ACK_TIMEOUT it asks INDIRECT_PROBES other
+# members to ping the target for it (ping-req); if the period ends without an
+# ack the target becomes "suspect". A suspect that does not refute within
+# SUSPICION_TIMEOUT is declared "dead". A gateway refutes a suspicion about
+# itself by bumping its incarnation number and gossiping "alive". Incarnations
+# start at the wall-clock second, so a restarted gateway outranks the "dead"
+# entry peers still hold for its previous run and rejoins at once.
+#
+# Membership updates (member, host, port, state, incarnation) ride on every
+# ping/ack, each one retransmitted about RETRANSMIT_MULT * log2(n) times. The
+# cloud's /gateway-status is only used to find seeds to join through at
+# startup (and again while this gateway knows no members at all); seeds are
+# pinged, and only those that answer become members.
+
+GOSSIP_PORT = 5001
+GATEWAY_STATUS_URL = "http://cloud-api:8000/gateway-status"
+PROTOCOL_PERIOD = 1.0  # seconds
+ACK_TIMEOUT = 0.3
+INDIRECT_PROBES = 3
+SUSPICION_TIMEOUT = 3.0
+DEAD_RETAIN_SECONDS = 60  # dead entries are kept this long so stale "alive" gossip cannot resurrect them
+SEED_RETRY_SECONDS = 10
+RETRANSMIT_MULT = 3
+MAX_PIGGYBACK = 8
+MAX_DATAGRAM = 65507
+
+ALIVE = "alive"
+SUSPECT = "suspect"
+DEAD = "dead"
+
+
+class Member:
+    __slots__ = ("host", "port", "state", "incarnation", "changed_at")
+
+    def __init__(self, host, port, state, incarnation, changed_at):
+        self.host = host
+        self.port = port
+        self.state = state
+        self.incarnation = incarnation
+        self.changed_at = changed_at
+
+
+class Membership:
+    """Gossip failure detector and member list for one gateway."""
+
+    def __init__(self, gateway_id, host=None, port=GOSSIP_PORT, seed_url=GATEWAY_STATUS_URL):
+        self.gateway_id = gateway_id
+        self.host = host or gateway_id  # gateway IDs are the container hostnames
+        self.port = port
+        self.seed_url = seed_url
+        self.incarnation = int(time.time())
+        self._lock = threading.Lock()
+        self._members = {}
+        self._updates = {}  # member -> [host, port, state, incarnation, transmissions left]
+        self._acks = {}  # seq -> Event
+        self._seq = 0
+        self._probe_order = []
+        self._probe_index = 0
+        self._last_seed = 0.0
+        self._sock = None
+
+    # --- member table ---
+
+    def alive_members(self):
+        """IDs of members currently believed alive (suspects excluded)."""
+        with self._lock:
+            return [m for m, member in self._members.items() if member.state == ALIVE]
+
+    def members(self):
+        """{member: (state, incarnation)} for every known member, including recently dead ones."""
+        with self._lock:
+            return {m: (member.state, member.incarnation) for m, member in self._members.items()}
+
+    def _gossip(self, member_id, host, port, state, incarnation):
+        """Queue an update for piggybacking. Must hold _lock."""
+        transmissions = RETRANSMIT_MULT * max(1, math.ceil(math.log2(len(self._members) + 2)))
+        self._updates[member_id] = [host, port, state, incarnation, transmissions]
+
+    def _apply(self, member_id, host, port, state, incarnation, now):
+        """Merge one membership update by SWIM precedence rules. Must hold _lock."""
+        if member_id == self.gateway_id:
+            if state != ALIVE and incarnation >= self.incarnation:
+                self.incarnation = incarnation + 1
+                self._gossip(self.gateway_id, self.host, self.port, ALIVE, self.incarnation)
+                log_info(f"[{self.gateway_id}] Refuted {state} rumour (incarnation {self.incarnation})")
+            return
+
+        member = self._members.get(member_id)
+        if member is None:
+            self._members[member_id] = Member(host, port, state, incarnation, now)
+            self._gossip(member_id, host, port, state, incarnation)
+            if state != DEAD:
+                self._probe_order.insert(random.randint(0, len(self._probe_order)), member_id)
+                log_info(f"[{self.gateway_id}] Member {member_id} joined ({state})")
+            return
+
+        if state == ALIVE:
+            newer = incarnation > member.incarnation
+        elif state == SUSPECT:
+            newer = incarnation > member.incarnation or (incarnation == member.incarnation and member.state == ALIVE)
+        else:
+            newer = member.state != DEAD and incarnation >= member.incarnation
+        if not newer:
+            return
+
+        if member.state != state:
+            log_info(f"[{self.gateway_id}] Member {member_id} is {state} (incarnation {incarnation})")
+        if member.state == DEAD and member_id not in self._probe_order:
+            self._probe_order.insert(random.randint(0, len(self._probe_order)), member_id)
+        member.host, member.port = host, port
+        member.state, member.incarnation, member.changed_at = state, incarnation, now
+        self._gossip(member_id, host, port, state, incarnation)
+
+    def _piggyback(self):
+        """Take up to MAX_PIGGYBACK pending updates for an outgoing message. Must hold _lock."""
+        updates = []
+        for member_id in sorted(self._updates, key=lambda m: -self._updates[m][4])[:MAX_PIGGYBACK]:
+            entry = self._updates[member_id]
+            updates.append([member_id] + entry[:4])
+            entry[4] -= 1
+            if entry[4] <= 0:
+                del self._updates[member_id]
+        return updates
+
+    def _expire(self, now):
+        """Suspects past SUSPICION_TIMEOUT become dead; old dead entries are forgotten. Must hold _lock."""
+        for member_id, member in list(self._members.items()):
+            if member.state == SUSPECT and now - member.changed_at >= SUSPICION_TIMEOUT:
+                self._apply(member_id, member.host, member.port, DEAD, member.incarnation, now)
+            elif member.state == DEAD and now - member.changed_at >= DEAD_RETAIN_SECONDS:
+                del self._members[member_id]
+
+    # --- transport ---
+
+    def _send(self, host, port, kind, seq, **fields):
+        with self._lock:
+            message = {
+                "type": kind, "from": self.gateway_id, "host": self.host, "port": self.port,
+                "inc": self.incarnation, "seq": seq, "updates": self._piggyback(), **fields
+            }
+        try:
+            self._sock.sendto(json.dumps(message).encode(), (host, port))
+        except OSError:
+            pass  # unresolvable or unreachable host: the missing ack is the failure signal
+
+    def _next_seq(self):
+        with self._lock:
+            self._seq += 1
+            event = self._acks[self._seq] = threading.Event()
+            return self._seq, event
+
+    def handle(self, message):
+        """Process one decoded datagram."""
+        now = time.monotonic()
+        sender = message.get("from")
+        with self._lock:
+            for update in message.get("updates", []):
+                self._apply(*update, now)
+            if sender and sender != self.gateway_id:
+                # Direct contact is a join from an unknown gateway, and a rejoin from a dead one
+                # that restarted (its incarnation is newer than the dead entry's)
+                self._apply(sender, message["host"], message["port"], ALIVE, message.get("inc", 0), now)
+
+        kind, seq = message.get("type"), message.get("seq")
+        if kind == "ping":
+            self._send(message["host"], message["port"], "ack", seq)
+        elif kind == "ping-req":
+            relay_seq, event = self._next_seq()
+            target = message["target"]
+            self._send(target[0], target[1], "ping", relay_seq)
+            threading.Thread(
+                target=self._relay_ack, args=(event, relay_seq, message["host"], message["port"], seq), daemon=True
+            ).start()
+        elif kind == "ack":
+            with self._lock:
+                event = self._acks.pop(seq, None)
+            if event is not None:
+                event.set()
+
+    def _relay_ack(self, event, relay_seq, host, port, seq):
+        """Forward the target's ack to the member that asked for an indirect probe."""
+        if event.wait(PROTOCOL_PERIOD - ACK_TIMEOUT):
+            self._send(host, port, "ack", seq)
+        with self._lock:
+            self._acks.pop(relay_seq, None)
+
+    # --- protocol ---
+
+    def join(self, addresses):
+        """Ping (host, port) seeds; the ones that answer join the member list."""
+        for host, port in addresses:
+            self._send(host, port, "ping", 0)  # seq 0: nobody waits for these acks
+
+    def seed(self):
+        """Join through the gateways the cloud reports alive."""
+        self._last_seed = time.monotonic()
+        try:
+            resp = requests.get(self.seed_url, timeout=5)
+            if resp.status_code != 200:
+                return
+            gateways = resp.json().get("gateways", {})
+        except Exception as e:
+            log_error(f"[{self.gateway_id}] Membership seeding failed: {e}")
+            return
+        self.join([
+            (gateway_id, GOSSIP_PORT) for gateway_id, info in gateways.items()
+            if gateway_id != self.gateway_id and info.get("status") == "alive"
+        ])
+
+    def _next_target(self):
+        """Next member to probe, round-robin over a list reshuffled each pass. Must hold _lock."""
+        while self._probe_order:
+            if self._probe_index >= len(self._probe_order):
+                random.shuffle(self._probe_order)
+                self._probe_index = 0
+            member_id = self._probe_order[self._probe_index]
+            member = self._members.get(member_id)
+            if member is None or member.state == DEAD:
+                del self._probe_order[self._probe_index]
+                continue
+            self._probe_index += 1
+            return member_id, member
+        return None, None
+
+    def probe(self):
+        """One protocol period: probe one member directly, then indirectly, else suspect it."""
+        started = time.monotonic()
+        with self._lock:
+            self._expire(started)
+            member_id, member = self._next_target()
+            known = any(m.state != DEAD for m in self._members.values())
+        if not known and started - self._last_seed >= SEED_RETRY_SECONDS:
+            self.seed()
+        if member is None:
+            return
+
+        seq, event = self._next_seq()
+        self._send(member.host, member.port, "ping", seq)
+        if not event.wait(ACK_TIMEOUT):
+            with self._lock:
+                helpers = [m for m, h in self._members.items() if h.state == ALIVE and m != member_id]
+                helpers = [self._members[m] for m in random.sample(helpers, min(INDIRECT_PROBES, len(helpers)))]
+            for helper in helpers:
+                self._send(helper.host, helper.port, "ping-req", seq, target=[member.host, member.port])
+            if not event.wait(max(0.0, PROTOCOL_PERIOD - (time.monotonic() - started))):
+                with self._lock:
+                    if member.state == ALIVE:
+                        self._apply(member_id, member.host, member.port, SUSPECT, member.incarnation, time.monotonic())
+        with self._lock:
+            self._acks.pop(seq, None)
+
+    def start(self, shutdown_event):
+        """Bind the gossip socket, seed from the cloud and run the receive and protocol loops."""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(("0.0.0.0", self.port))
+        self._sock.settimeout(1)
+        threading.Thread(target=self._receive_loop, args=(shutdown_event,), daemon=True).start()
+        threading.Thread(target=self._protocol_loop, args=(shutdown_event,), daemon=True).start()
+        log_info(f"[{self.gateway_id}] Gossip membership on udp/{self.port} (period={PROTOCOL_PERIOD}s)")
+
+    def _receive_loop(self, shutdown_event):
+        while not shutdown_event.is_set():
+            try:
+                data, _ = self._sock.recvfrom(MAX_DATAGRAM)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                self.handle(json.loads(data))
+            except Exception as e:
+                log_error(f"[{self.gateway_id}] Bad gossip message: {e}", key="bad-gossip", every=10)
+        self._sock.close()
+
+    def _protocol_loop(self, shutdown_event):
+        self.seed()
+        while not shutdown_event.is_set():
+            started = time.monotonic()
+            self.probe()
+            shutdown_event.wait(max(0.0, PROTOCOL_PERIOD - (time.monotonic() - started)))
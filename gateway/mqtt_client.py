@@ -1,11 +1,31 @@
+import inspect
 import json
+import threading
 import time
 import os
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from record import Record
 from logger import log_info, log_error
 
 BROKER = "mqtt-broker"
 PORT = 1883
+INVALID_LOG_SECONDS = 10  # invalid-payload lines are sampled per topic
+
+# Delivery guarantee. At QoS 1 the subscription survives a gateway restart
+# (persistent session) and, where paho supports manual acks (2.x), a delivery
+# is only acknowledged once its record is settled (see delivery.py): accepted
+# by the cloud, folded into a summary that was, or deliberately dropped.
+MQTT_QOS = int(os.getenv("MQTT_QOS", "0"))
+MQTT_PROTOCOL = os.getenv("MQTT_PROTOCOL", "311")  # "311" or "5"
+# Unacked QoS 1 deliveries the broker may have outstanding to this client. Sent
+# as Receive Maximum on MQTT 5; on 3.1.1 the broker's own inflight setting
+# (EMQX mqtt.max_inflight) is the only limit. Must cover what the gateway holds
+# unacked: buffered batches plus in-flight sends.
+MQTT_RECEIVE_MAXIMUM = int(os.getenv("MQTT_RECEIVE_MAXIMUM", "2000"))
+MQTT_SESSION_EXPIRY_SECONDS = int(os.getenv("MQTT_SESSION_EXPIRY_SECONDS", "300"))  # MQTT 5, QoS 1 only
+MANUAL_ACK_SUPPORTED = "manual_ack" in inspect.signature(mqtt.Client.__init__).parameters
 
 # $share/gw/ prefix = EMQX shared subscription
 # MQTT broker distributes messages across all gateways in the "gw" group automatically
@@ -15,32 +35,110 @@ TOPICS = [
     "$share/gw/sensors/pressure"
 ]
 
-def start_mqtt(on_message_callback, client_id=None):
+def decode_message(topic, payload):
+    """Decode an MQTT payload into a Record, or None if it is not valid JSON."""
+    try:
+        # Strip $share/gw/ prefix from topic for downstream processing
+        real_topic = topic
+        return Record.from_dict(json.loads(payload.decode()), real_topic)
+    except json.JSONDecodeError:
+        log_error(f"Invalid JSON received on {topic}, dropping message", key=f"invalid-json:{topic}", every=INVALID_LOG_SECONDS)
+        return None
+
+def manual_acks():
+    """True if deliveries are acknowledged by the gateway rather than by paho on receipt."""
+    return MQTT_QOS >= 1 and MANUAL_ACK_SUPPORTED
+
+
+def create_client(client_id):
+    """paho client for MQTT_PROTOCOL, with a persistent session and manual acks at QoS 1."""
+    protocol = mqtt.MQTTv5 if MQTT_PROTOCOL == "5" else mqtt.MQTTv311
+    options = {"client_id": client_id, "protocol": protocol}
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        options["callback_api_version"] = mqtt.CallbackAPIVersion.VERSION1  # paho 2.x: keep the 1.x callback signatures
+    if protocol == mqtt.MQTTv311:
+        options["clean_session"] = MQTT_QOS == 0
+    if manual_acks():
+        options["manual_ack"] = True
+    elif MQTT_QOS >= 1:
+        log_error(f"[{client_id}] This paho-mqtt has no manual acks; QoS 1 deliveries are acked on receipt")
+    return mqtt.Client(**options)
+
+
+def connect(client):
+    """Connect to the broker; on MQTT 5 also resume the session and announce the receive window."""
+    if MQTT_PROTOCOL != "5":
+        return client.connect(BROKER, PORT)
+    properties = Properties(PacketTypes.CONNECT)
+    properties.ReceiveMaximum = MQTT_RECEIVE_MAXIMUM
+    if MQTT_QOS >= 1:
+        properties.SessionExpiryInterval = MQTT_SESSION_EXPIRY_SECONDS
+    return client.connect(BROKER, PORT, clean_start=MQTT_QOS == 0, properties=properties)
+
+
+def subscribe(client, client_id):
+    for topic in TOPICS:
+        client.subscribe(topic, qos=MQTT_QOS)
+        log_info(f"[{client_id}] Subscribed to {topic} (qos={MQTT_QOS})")
+
+
+class Subscription:
+    """Subscribes the client on every (re)connect, or holds the topics back until activate() (warm standby)."""
+
+    def __init__(self, active=True):
+        self.active = active
+        self._lock = threading.Lock()
+        self.client = None  # set once connected
+        self._client_id = None
+
+    def connected(self, client, client_id):
+        with self._lock:
+            self.client, self._client_id = client, client_id
+            if self.active:
+                subscribe(client, client_id)
+
+    def activate(self):
+        """Start taking messages; subscribes now if the client is already connected."""
+        with self._lock:
+            if self.active:
+                return
+            self.active = True
+            if self.client is not None:
+                subscribe(self.client, self._client_id)
+
+
+def start_mqtt(on_message_callback, client_id=None, admission=None, delivery=None, subscription=None):
 
     if client_id is None:
         client_id = os.getenv("GATEWAY_ID", "gateway-01")
+    if subscription is None:
+        subscription = Subscription()
 
-    client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311)
+    client = create_client(client_id)
+    if delivery is not None and manual_acks():
+        delivery.bind(lambda mid: client.ack(mid, MQTT_QOS))
 
-    def on_connect(client, userdata, flags, rc):
+    def on_connect(client, userdata, flags, rc, properties=None):
         if rc == 0:
             log_info(f"[{client_id}] MQTT connected to broker")
-            
-            for topic in TOPICS:
-                client.subscribe(topic)
-                log_info(f"[{client_id}] Subscribed to {topic}")
+            subscription.connected(client, client_id)
         else:
             log_error(f"[{client_id}] MQTT connection failed: {rc}")
 
     def on_message(client, userdata, msg):
-        try:
-            data = json.loads(msg.payload.decode())
-            # Strip $share/gw/ prefix from topic for downstream processing
-            real_topic = msg.topic
-            data["topic"] = real_topic
-            on_message_callback(data)
-        except json.JSONDecodeError:
-            log_error(f"Invalid JSON received on {msg.topic}, dropping message")
+        # Shed over-quota devices before paying for the JSON decode
+        if admission is not None and not admission.admit_payload(msg.topic, msg.payload):
+            if delivery is not None:
+                delivery.ack(msg.mid)
+            return
+        data = decode_message(msg.topic, msg.payload)
+        if data is None:
+            if delivery is not None:
+                delivery.ack(msg.mid)
+            return
+        if delivery is not None:
+            delivery.track(data, msg.mid)
+        on_message_callback(data)
 
     client.on_connect = on_connect
     client.on_message = on_message
@@ -48,7 +146,7 @@ def start_mqtt(on_message_callback, client_id=None):
     # Try to connect to broker if failed try again after 2s
     while True:
         try:
-            client.connect(BROKER, PORT)
+            connect(client)
             break
         except Exception as e:
             log_info(f"Broker not ready, retrying in 2s... ({e})")
@@ -1,17 +1,22 @@
 import json
+import queue
 import threading
 import time
 import requests
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
-from collections import deque, OrderedDict
+from collections import deque
 from logger import log_info, log_error
+from membership import Membership
+from record import Record
 
 PEER_PORT = 5000
 SYNC_INTERVAL = 10
 
 LOG_MAX = 50000
-SEEN_MAX = 200000
+REPL_TS_STEP = 1e-6  # keeps log timestamps strictly increasing
+FORWARD_BATCH = 500  # log entries per hand-off from a supervisor worker to worker 0
+FORWARD_INTERVAL_SECONDS = 0.2
 
 
 class PeerSync:
@@ -22,39 +27,114 @@ class PeerSync:
         self.buffer = buffer
         self._lock = threading.Lock()
         self._log = deque(maxlen=LOG_MAX)
-        self._seen = OrderedDict()
+        self._last_repl_ts = 0.0
         self._peers = []
-        self._last_sync = {}
-
-    def _already_seen(self, msg_id):
-        """Check and mark a message ID as seen. Returns True if duplicate. Must hold _lock."""
-        if msg_id in self._seen:
-            return True
-        self._seen[msg_id] = True
-        while len(self._seen) > SEEN_MAX:
-            self._seen.popitem(last=False)
-        return False
-
-    def add_to_log(self, message):
-        """Record a processed message so peers can pull it."""
-        msg_id = message.get("messageId")
-        if not msg_id:
+        self._last_sync = {}  # peer_id -> newest _repl_ts pulled from it (the peer's clock)
+        self._forward = None  # pending entries for worker 0 when this process does not serve peers
+        self._forward_queue = None
+        self.forward_dropped = 0
+        self.membership = Membership(gateway_id)
+
+    def add_to_log(self, record):
+        """Record a processed message so peers can pull it. The log keeps the Record itself, not a copy.
+
+        Log timestamps are strictly increasing, so the newest one a peer has
+        pulled is all it needs to skip entries it already has.
+        """
+        if self._forward is not None:
+            with self._lock:
+                self._forward.append(record.to_wire())
+                full = len(self._forward) >= FORWARD_BATCH
+            if full:
+                self._flush_forward()
             return
         with self._lock:
-            if self._already_seen(msg_id):
-                return
-            entry = dict(message, _repl_ts=time.time(), _origin=self.gateway_id)
-            self._log.append(entry)
+            repl_ts = max(time.time(), self._last_repl_ts + REPL_TS_STEP)
+            self._last_repl_ts = repl_ts
+            record.repl_ts = repl_ts
+            record.origin = self.gateway_id
+            self._log.append(record)
 
-    def discover_peers(self):
-        """Fetch alive gateways from cloud API."""
+    def forward_to(self, log_queue, shutdown_event):
+        """Hand log entries to the process that serves peers instead of logging them here.
+
+        Used by supervisor workers other than worker 0: only one process per
+        container can bind the peer port, so worker 0 serves the log of all.
+        """
+        self._forward = []
+        self._forward_queue = log_queue
+
+        def flush_loop():
+            while not shutdown_event.wait(FORWARD_INTERVAL_SECONDS):
+                self._flush_forward()
+
+        threading.Thread(target=flush_loop, daemon=True).start()
+
+    def _flush_forward(self):
+        with self._lock:
+            entries, self._forward = self._forward, []
+        if not entries:
+            return
         try:
-            resp = requests.get("http://cloud-api:8000/gateway-status", timeout=5)
-            if resp.status_code == 200:
-                gws = resp.json().get("gateways", {})
-                self._peers = [g for g in gws if g != self.gateway_id and gws[g].get("status") == "alive"]
-        except Exception as e:
-            log_error(f"[{self.gateway_id}] Peer discovery failed: {e}")
+            self._forward_queue.put_nowait(entries)
+        except queue.Full:
+            # worker 0 is down or far behind; peers miss these rather than the worker blocking
+            self.forward_dropped += len(entries)
+            log_error(f"[{self.gateway_id}] Replication hand-off queue full, {self.forward_dropped} log entries dropped",
+                      key="forward-dropped", every=10)
+
+    def receive_forwarded(self, log_queue, shutdown_event):
+        """Add the entries other supervisor workers hand over to this process's log (worker 0)."""
+
+        def receive_loop():
+            while not shutdown_event.is_set():
+                try:
+                    entries = log_queue.get(timeout=1)
+                except queue.Empty:
+                    continue
+                except (EOFError, OSError):
+                    return
+                for entry in entries:
+                    self.add_to_log(Record.from_dict(entry))
+
+        threading.Thread(target=receive_loop, daemon=True).start()
+
+    def log_since(self, since):
+        """Log entries added after `since` (epoch seconds), as served to peers."""
+        with self._lock:
+            entries = [r for r in self._log if r.repl_ts > since]
+        return [r.to_wire(replication=True) for r in entries]
+
+    def update_peers(self):
+        """Set the peer list to the members gossip currently considers alive."""
+        self._peers = self.membership.alive_members()
+        known = self.membership.members()
+        for peer_id in list(self._last_sync):
+            if peer_id not in known:
+                del self._last_sync[peer_id]  # dead long enough to be forgotten
+
+    def ingest_peer_data(self, peer_id, data):
+        """Add records pulled from a peer to the local buffer. Returns how many were new."""
+        replicated = 0
+        newest = self._last_sync.get(peer_id, 0)
+        for msg in data:
+            repl_ts = msg.get("_repl_ts")
+            if repl_ts is None or repl_ts <= newest:
+                continue  # pulled before
+            newest = repl_ts
+            # Remove internal replication fields, keep original payload
+            clean = Record()
+            for k, v in msg.items():
+                if not k.startswith("_"):
+                    clean[k] = v
+            clean.replicated_from = msg.get("_origin", peer_id)
+            self.buffer.add(clean)
+            replicated += 1
+
+        self._last_sync[peer_id] = newest
+        if replicated:
+            log_info(f"[{self.gateway_id}] Replicated {replicated} records from {peer_id}")
+        return replicated
 
     def pull_from_peers(self):
         """Pull new messages from every known peer into local buffer."""
@@ -64,34 +144,15 @@ class PeerSync:
                 resp = requests.get(f"http://{peer_id}:{PEER_PORT}/peer/data?since={since}", timeout=3)
                 if resp.status_code != 200:
                     continue
-
-                replicated = 0
-                for msg in resp.json().get("data", []):
-                    msg_id = msg.get("messageId")
-                    if not msg_id:
-                        continue
-                    with self._lock:
-                        if self._already_seen(msg_id):
-                            continue
-                    # Remove internal replication fields, keep original payload
-                    clean = {}
-                    for k, v in msg.items():
-                        if not k.startswith("_"):
-                            clean[k] = v
-                    clean["_replicated_from"] = msg.get("_origin", peer_id)
-                    self.buffer.add(clean)
-                    replicated += 1
-
-                self._last_sync[peer_id] = time.time()
-                if replicated:
-                    log_info(f"[{self.gateway_id}] Replicated {replicated} records from {peer_id}")
+                self.ingest_peer_data(peer_id, resp.json().get("data", []))
             except requests.exceptions.ConnectionError:
                 pass
             except Exception as e:
                 log_error(f"[{self.gateway_id}] Pull from {peer_id} failed: {e}")
 
     def start(self, shutdown_event):
-        """Launch HTTP server and sync loop as background threads."""
+        """Launch gossip membership, HTTP server and sync loop as background threads."""
+        self.membership.start(shutdown_event)
         threading.Thread(
             target=self._sync_loop, 
             args=(shutdown_event,), 
@@ -107,7 +168,7 @@ class PeerSync:
     def _sync_loop(self, shutdown_event):
         time.sleep(5)
         while not shutdown_event.is_set():
-            self.discover_peers()
+            self.update_peers()
             if self._peers:
                 self.pull_from_peers()
             time.sleep(SYNC_INTERVAL)
@@ -120,8 +181,7 @@ class PeerSync:
                 parsed = urlparse(self.path)
                 if parsed.path == "/peer/data":
                     since = float(parse_qs(parsed.query).get("since", [0])[0])
-                    with peer_sync._lock:
-                        data = [m for m in peer_sync._log if m.get("_repl_ts", 0) > since]
+                    data = peer_sync.log_since(since)
                     body = {"gateway_id": peer_sync.gateway_id, "data": data, "count": len(data)}
                 else:
                     body = {"error": "not found"}
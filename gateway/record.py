@@ -0,0 +1,148 @@
+import sys
+
+# Compact in-gateway representation of a sensor reading. A Record is created
+# once per MQTT message and the same object sits in the send buffer and the
+# replication log; it only becomes a dict again (to_wire) when it is sent.
+#
+# deviceId/sensorType/unit/topic are interned, so every reading of a device
+# shares one copy, and profile keys come from a cache instead of being
+# rebuilt per message. A slot that was never set means the field is absent,
+# exactly like a missing key in the old message dict. Fields the gateway does
+# not know about are kept in `extra` and passed through unchanged. `ack_id`
+# is the MQTT delivery still to be acknowledged for it (delivery.py).
+
+PROFILE_KEY_CACHE_MAX = 200000  # devices; the cache is dropped and rebuilt past this
+
+# wire name -> slot, in wire order
+WIRE_FIELDS = {
+    "deviceId": "device_id",
+    "sensorType": "sensor_type",
+    "unit": "unit",
+    "value": "value",
+    "timestamp": "timestamp",
+    "topic": "topic",
+    "messageId": "message_id",
+    "gatewayReceivedAt": "received_at",
+    "profileKey": "profile_key",
+    "isAnomaly": "is_anomaly",
+    "anomalyScore": "anomaly_score",
+    "modelTimestamp": "model_timestamp",
+    "_replicated_from": "replicated_from",
+}
+# Only present on log entries served to peers
+REPLICATION_FIELDS = {"_repl_ts": "repl_ts", "_origin": "origin"}
+# Not forwarded anywhere: the device token is checked and dropped at the gateway
+PRIVATE_FIELDS = {"signature": "signature"}
+
+FIELD_SLOTS = {**WIRE_FIELDS, **REPLICATION_FIELDS, **PRIVATE_FIELDS}
+INTERNED_SLOTS = frozenset({"device_id", "sensor_type", "unit", "topic"})
+_WIRE_ITEMS = tuple(WIRE_FIELDS.items())
+_MISSING = object()
+
+_profile_keys = {}  # device_id -> {sensor_type -> profile key}
+
+
+def profile_key_for(device_id, sensor_type):
+    """Shared "<deviceId>::<sensorType>" string for a device's sensor."""
+    by_type = _profile_keys.get(device_id)
+    if by_type is None:
+        if len(_profile_keys) >= PROFILE_KEY_CACHE_MAX:
+            _profile_keys.clear()
+        by_type = _profile_keys[device_id] = {}
+    key = by_type.get(sensor_type)
+    if key is None:
+        key = by_type[sensor_type] = sys.intern(f"{device_id}::{sensor_type}")
+    return key
+
+
+class Record:
+    """One reading as it moves through the gateway; supports the dict-style access the pipeline used before."""
+
+    __slots__ = tuple(FIELD_SLOTS.values()) + ("extra", "ack_id")
+
+    def __init__(self):
+        self.extra = None
+
+    @classmethod
+    def from_dict(cls, data, topic=None):
+        record = cls()
+        for key, value in data.items():
+            slot = FIELD_SLOTS.get(key)
+            if slot is None:
+                if record.extra is None:
+                    record.extra = {}
+                record.extra[key] = value
+            elif slot in INTERNED_SLOTS and type(value) is str:
+                setattr(record, slot, sys.intern(value))
+            else:
+                setattr(record, slot, value)
+        if topic is not None:
+            record.topic = sys.intern(topic)
+        return record
+
+    @property
+    def profile(self):
+        """Profile key for this reading's deviceId and sensorType."""
+        return profile_key_for(getattr(self, "device_id", "unknown-device"), getattr(self, "sensor_type", "unknown-sensor"))
+
+    def to_wire(self, replication=False):
+        """Dict in the cloud ingest format (plus _repl_ts/_origin for peers if replication)."""
+        wire = {key: value for key, slot in _WIRE_ITEMS if (value := getattr(self, slot, _MISSING)) is not _MISSING}
+        if self.extra:
+            wire.update(self.extra)
+        if replication:
+            for key, slot in REPLICATION_FIELDS.items():
+                value = getattr(self, slot, _MISSING)
+                if value is not _MISSING:
+                    wire[key] = value
+        return wire
+
+    # Dict-style access by wire name, for code that treats readings as messages
+    def get(self, key, default=None):
+        slot = FIELD_SLOTS.get(key)
+        if slot is not None:
+            return getattr(self, slot, default)
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key):
+        slot = FIELD_SLOTS.get(key)
+        if slot is not None:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        slot = FIELD_SLOTS.get(key)
+        if slot is None:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        elif slot in INTERNED_SLOTS and type(value) is str:
+            setattr(self, slot, sys.intern(value))
+        else:
+            setattr(self, slot, value)
+
+    def __contains__(self, key):
+        slot = FIELD_SLOTS.get(key)
+        if slot is not None:
+            return hasattr(self, slot)
+        return bool(self.extra) and key in self.extra
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        slot = FIELD_SLOTS.get(key)
+        if slot is not None:
+            if hasattr(self, slot):
+                delattr(self, slot)
+        elif self.extra:
+            self.extra.pop(key, None)
+        return value
+
+
+def to_wire(records):
+    """Wire dicts for a batch that may mix Records and plain dicts (e.g. aggregation summaries)."""
+    return [r.to_wire() if type(r) is Record else r for r in records]
@@ -3,6 +3,8 @@ import time
 import os
 import threading
 from logger import log_info, log_error
+from record import to_wire
+from data_buffer import Batch
 
 CLOUD_API_URL = "http://cloud-api:8000/ingest"
 API_KEY = "secretAPIkey"
@@ -12,6 +14,8 @@ SECRET = "gateway-secret"
 TIMEOUT_SECONDS = 5
 MAX_RETRIES = 3
 RETRY_DELAY = 2  # seconds
+SEND_LOG_SECONDS = 10  # per-batch send/error lines are sampled to one per window
+RETRYABLE_CLIENT_ERRORS = (408, 429)  # 4xx answers that can succeed later; every other 4xx is permanent
 
 # Track total records successfully sent to cloud
 _records_sent_lock = threading.Lock()
@@ -22,26 +26,90 @@ def get_records_sent():
     with _records_sent_lock:
         return _records_sent
 
-# Sends data in correct format to the database, if fails waits before trying again and has max retries
-
-def send_to_cloud(batch):
-    """Send a batch of records to the cloud API with retries and error handling."""
+def count_sent(count):
+    """Add to the records-sent total and return the new total."""
     global _records_sent
+    with _records_sent_lock:
+        _records_sent += count
+        return _records_sent
+
+class BatchSequencer:
+    """Sequence numbers for the records this process sends to the cloud.
+
+    Each batch takes the next len(batch) numbers the first time it is sent and
+    keeps them on every retry, so the cloud deduplicates whole batches by
+    (origin, epoch, seqStart) instead of by per-record IDs. A new process
+    starts a new epoch (its start time in ms) and numbers from 1 again.
+    """
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.epoch = time.time_ns() // 1_000_000
+        self._next = 1
+        self._lock = threading.Lock()
+
+    def assign(self, batch):
+        """First sequence number of batch, allocating the range if the batch has none yet."""
+        seq_start = batch.seq_start if type(batch) is Batch else None
+        if seq_start is None:
+            with self._lock:
+                seq_start = self._next
+                self._next += len(batch)
+            if type(batch) is Batch:
+                batch.seq_start = seq_start
+        return seq_start
+
+
+# One origin per sending process; supervisor workers replace it with their own
+sequencer = BatchSequencer(GATEWAY_ID)
+
+def cloud_request(batch):
+    """Headers and JSON payload for an ingest request carrying batch."""
     headers = {
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type": "application/json",
         "gatewayId": GATEWAY_ID,
         "secret" : SECRET
     }
-
     payload = {
         "gatewayId": GATEWAY_ID,
-        "data": batch
+        "origin": sequencer.origin,
+        "epoch": sequencer.epoch,
+        "seqStart": sequencer.assign(batch),
+        "data": to_wire(batch)
     }
+    return headers, payload
+
+def is_rejected(status):
+    """True for a 4xx answer the same batch would get again (bad auth, invalid payload)."""
+    return 400 <= status < 500 and status not in RETRYABLE_CLIENT_ERRORS
+
+def reject_batch(batch, status, text, discard):
+    """Drop a batch the cloud refused for good, logging it and handing it to discard (to settle its acks)."""
+    log_error(
+        f"Cloud rejected batch ({status}): {text}, dropping {len(batch)} records",
+        key=f"cloud-rejected:{status}", every=SEND_LOG_SECONDS
+    )
+    if discard is not None:
+        discard(batch)
+
+# Sends data in correct format to the database, if fails waits before trying again and has max retries
+
+def send_to_cloud(batch, session=None, requeue=None, retry_delay=RETRY_DELAY, discard=None):
+    """Send a batch of records to the cloud API with retries and error handling.
+
+    `session` is the connection to post on (defaults to a one-off request) and
+    `requeue` is called with the batch if every attempt fails. Only network
+    errors and 5xx answers are retried: a permanent 4xx (see is_rejected) drops
+    the batch on purpose, since resending it cannot succeed, and `discard` is
+    called with it so the caller can settle its deliveries.
+    """
+    http = session or requests
+    headers, payload = cloud_request(batch)
 
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            response = requests.post(
+            response = http.post(
                 CLOUD_API_URL,
                 json=payload,
                 headers=headers,
@@ -49,29 +117,33 @@ def send_to_cloud(batch):
             )
 
             if response.status_code == 200:
-                with _records_sent_lock:
-                    _records_sent += len(batch)
-                log_info(f"[{GATEWAY_ID}] Sent {len(batch)} records to cloud (total: {_records_sent})")
+                total = count_sent(len(batch))
+                log_info(f"[{GATEWAY_ID}] Sent {len(batch)} records to cloud (total: {total})", key="sent", every=SEND_LOG_SECONDS)
                 return True
+            elif is_rejected(response.status_code):
+                reject_batch(batch, response.status_code, response.text, discard)
+                return False
             else:
                 log_error(
                     f"Cloud error {response.status_code}: "
-                    f"{response.text}"
+                    f"{response.text}",
+                    key=f"cloud-error:{response.status_code}", every=SEND_LOG_SECONDS
                 )
 
         except requests.exceptions.RequestException as e:
-            log_error(f"Network error: {e}")
+            log_error(f"Network error: {e}", key="network-error", every=SEND_LOG_SECONDS)
 
         if attempt < MAX_RETRIES:
-            log_info(f"Retry {attempt}/{MAX_RETRIES} in {RETRY_DELAY}s")
-            time.sleep(RETRY_DELAY)
+            log_info(f"Retry {attempt}/{MAX_RETRIES} in {retry_delay}s", key="retry", every=SEND_LOG_SECONDS)
+            time.sleep(retry_delay)
 
     # Re-queue the batch so messages are not lost
-    log_error("Failed to send batch after retries, re-queuing")
+    if requeue is None:
+        log_error(f"Failed to send batch after retries, dropping {len(batch)} records")
+        return False
     try:
-        from main import buffer
-        buffer.requeue(batch)
-        log_info(f"Re-queued {len(batch)} messages for retry")
+        requeue(batch)
+        log_error(f"Failed to send batch after retries, re-queued {len(batch)} records", key="requeue", every=SEND_LOG_SECONDS)
     except Exception as e:
         log_error(f"Failed to re-queue batch: {e}")
     return False
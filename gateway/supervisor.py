@@ -0,0 +1,267 @@
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+from logger import log_info, log_error, stop_logging
+from model_format import open_model
+
+# Multi-process gateway (GATEWAY_WORKERS > 1). The supervisor owns the control
+# plane (config, revocations, model download, heartbeat); each forked worker
+# runs the threaded message pipeline with its own MQTT shared-subscription
+# client, DataBuffer and AnomalyDetector.
+#
+# The binary model is published as a snapshot file in shared memory (/dev/shm)
+# that workers map when it changes, so all workers share one copy of it. Config and revocation updates and
+# metric collection go over one pipe per worker. Only worker 0 serves and
+# pulls peer replication, since the peer port can be bound once per container;
+# the other workers hand their replication log entries to it over one shared
+# queue, so peers still see all of the gateway's traffic.
+
+SNAPSHOT_DIR = os.getenv("MODEL_SNAPSHOT_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+MODEL_POLL_SECONDS = 1
+STATS_TIMEOUT_SECONDS = 2
+REPLICATION_QUEUE_BATCHES = 1000  # hand-off batches (peer_sync.FORWARD_BATCH entries each) waiting for worker 0
+WORKER_CHECK_SECONDS = 1
+
+
+class ModelSnapshot:
+    """Model artifact shared through a file in shared memory, replaced atomically on publish."""
+
+    def __init__(self, path):
+        self.path = path
+        self._seen = None
+
+    def publish(self, model):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(model.buffer)
+        os.replace(temp_path, self.path)
+
+    def load_if_changed(self):
+        """Return the mapped BinaryModel if the snapshot was replaced since the last call, else None."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns)
+        if stamp == self._seen or st.st_size == 0:
+            return None
+        model = open_model(self.path)
+        self._seen = stamp
+        return model
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def merge_stats(all_stats):
+    """Combine per-worker heartbeat stats: counters add up, latency and device counts take the worst worker."""
+    merged = {
+        "message_rate": 0, "records_sent": 0, "admitted_messages": 0, "shed_messages": 0,
+        "unchecked_messages": 0, "shed_by_type": {},
+        "tracked_devices": 0, "lane_latency": {}, "aggregation": {"readings_in": 0, "summaries_out": 0},
+        "auth_rejected": 0, "workers": len(all_stats)
+    }
+    for stats in all_stats:
+        for key in ("message_rate", "records_sent", "admitted_messages", "shed_messages", "unchecked_messages",
+                    "auth_rejected"):
+            merged[key] += stats[key]
+        # Every worker sees most devices, so the largest table is the best device count
+        merged["tracked_devices"] = max(merged["tracked_devices"], stats["tracked_devices"])
+        for sensor_type, shed in stats["shed_by_type"].items():
+            merged["shed_by_type"][sensor_type] = merged["shed_by_type"].get(sensor_type, 0) + shed
+        for key in merged["aggregation"]:
+            merged["aggregation"][key] += stats["aggregation"][key]
+        for lane, lane_stats in stats["lane_latency"].items():
+            current = merged["lane_latency"].setdefault(lane, {"records": 0})
+            current["records"] += lane_stats["records"]
+            for key in ("p50_ms", "p99_ms", "max_ms"):
+                if key in lane_stats:
+                    current[key] = max(current.get(key, 0.0), lane_stats[key])
+    return merged
+
+
+def worker_main(gw, index, workers, conn, snapshot_path, replication_queue):
+    """Worker process: run the message pipeline and follow the supervisor's control messages."""
+    signal.signal(signal.SIGTERM, lambda *a: gw.shutdown_event.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Shared subscriptions spread each device's messages over all workers, so split its quota too
+    admission = gw.admission
+    admission.type_quotas = {t: (rate / workers, max(1.0, burst / workers)) for t, (rate, burst) in admission.type_quotas.items()}
+    rate, burst = admission.default_quota
+    admission.default_quota = (rate / workers, max(1.0, burst / workers))
+    rate, burst = admission.shared_quota
+    admission.shared_quota = (rate / workers, max(1.0, burst / workers))
+
+    # Workers send concurrently under one gateway ID, so each numbers its batches as its own origin
+    gw.rest_client.sequencer = gw.rest_client.BatchSequencer(f"{gw.GATEWAY_ID}/w{index}")
+
+    if index == 0:
+        gw.peer_sync.receive_forwarded(replication_queue, gw.shutdown_event)
+    else:
+        gw.peer_sync.forward_to(replication_queue, gw.shutdown_event)
+
+    snapshot = ModelSnapshot(snapshot_path)
+
+    def control_loop():
+        while not gw.shutdown_event.is_set():
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                gw.shutdown_event.set()
+                return
+            kind = message[0]
+            if kind == "config":
+                gw.CONFIG.update(message[1])
+                gw.apply_batch_config()
+            elif kind == "revocations":
+                gw.device_auth.update_revocations(message[1], message[2])
+            elif kind == "stats":
+                conn.send(("stats", gw.collect_stats()))
+
+    def model_loop():
+        while not gw.shutdown_event.is_set():
+            try:
+                model = snapshot.load_if_changed()
+                if model is not None:
+                    gw.detector.update_model(model)
+                    log_info(f"[{gw.GATEWAY_ID}/w{index}] Model snapshot loaded ({len(model)} profiles)")
+            except Exception as e:
+                log_error(f"[{gw.GATEWAY_ID}/w{index}] Model snapshot load failed: {e}")
+            gw.shutdown_event.wait(MODEL_POLL_SECONDS)
+
+    threading.Thread(target=control_loop, daemon=True).start()
+    threading.Thread(target=model_loop, daemon=True).start()
+    gw.start_pipeline(client_id=f"{gw.GATEWAY_ID}-w{index}", serve_peers=index == 0, refresh_model=False)
+    log_info(f"[{gw.GATEWAY_ID}/w{index}] Worker {index + 1}/{workers} started (pid {os.getpid()})")
+    gw.shutdown_event.wait()
+    # Forked workers leave through os._exit, which skips the atexit flush
+    stop_logging()
+
+
+class Supervisor:
+    def __init__(self, gw, workers):
+        self.gw = gw
+        self.workers = workers
+        self.ctx = multiprocessing.get_context("fork")
+        self.snapshot = ModelSnapshot(os.path.join(SNAPSHOT_DIR, f"{gw.GATEWAY_ID}-model.bin"))
+        # Created before any fork, so a restarted worker 0 picks up the same queue
+        self.replication_queue = self.ctx.Queue(maxsize=REPLICATION_QUEUE_BATCHES)
+        self.procs = [None] * workers
+        self.conns = [None] * workers
+        self.stopping = threading.Event()
+        self.model_generated_at = None
+
+    def spawn(self, index):
+        parent_conn, child_conn = self.ctx.Pipe()
+        proc = self.ctx.Process(
+            target=worker_main,
+            args=(self.gw, index, self.workers, child_conn, self.snapshot.path, self.replication_queue),
+            name=f"gateway-worker-{index}",
+            daemon=True
+        )
+        proc.start()
+        child_conn.close()
+        self.procs[index] = proc
+        self.conns[index] = parent_conn
+        # Bring the new worker up to date with the current control state
+        self.send(index, ("config", dict(self.gw.CONFIG)))
+        self.send(index, ("revocations", dict(self.gw.device_auth._revoked), self.gw.device_auth.revocation_version))
+
+    def send(self, index, message):
+        try:
+            self.conns[index].send(message)
+        except (OSError, ValueError) as e:
+            log_error(f"[{self.gw.GATEWAY_ID}] Control message to worker {index} failed: {e}")
+
+    def broadcast(self, message):
+        for index in range(self.workers):
+            self.send(index, message)
+
+    def check_workers(self):
+        for index, proc in enumerate(self.procs):
+            if not proc.is_alive():
+                log_error(f"[{self.gw.GATEWAY_ID}] Worker {index} exited ({proc.exitcode}), restarting")
+                self.conns[index].close()
+                self.spawn(index)
+
+    def collect(self):
+        """Ask every worker for its stats and merge the replies."""
+        self.broadcast(("stats",))
+        replies = []
+        deadline = time.time() + STATS_TIMEOUT_SECONDS
+        for index, conn in enumerate(self.conns):
+            try:
+                if conn.poll(max(0.0, deadline - time.time())):
+                    kind, stats = conn.recv()
+                    replies.append(stats)
+                else:
+                    log_error(f"[{self.gw.GATEWAY_ID}] Worker {index} did not report stats")
+            except (EOFError, OSError):
+                pass
+        return merge_stats(replies)
+
+    def refresh_model(self):
+        model = self.gw.fetch_model()
+        if model is not None and model.generated_at != self.model_generated_at:
+            self.snapshot.publish(model)
+            self.model_generated_at = model.generated_at
+            log_info(f"[{self.gw.GATEWAY_ID}] Model snapshot published ({len(model)} profiles)")
+
+    def control_cycle(self):
+        gw = self.gw
+        version = gw.CONFIG["config_version"]
+        gw.get_config()
+        if gw.CONFIG["config_version"] != version:
+            self.broadcast(("config", dict(gw.CONFIG)))
+
+        revocation_version = gw.device_auth.revocation_version
+        gw.sync_revocations()
+        if gw.device_auth.revocation_version != revocation_version:
+            self.broadcast(("revocations", dict(gw.device_auth._revoked), gw.device_auth.revocation_version))
+
+        gw.heartbeat(self.collect())
+
+    def run(self):
+        gw = self.gw
+        signal.signal(signal.SIGTERM, lambda *a: self.stopping.set())
+        signal.signal(signal.SIGINT, lambda *a: self.stopping.set())
+
+        log_info(f"[{gw.GATEWAY_ID}] Starting gateway supervisor with {self.workers} worker processes...")
+        gw.get_config()
+        gw.sync_revocations()
+        self.refresh_model()
+        for index in range(self.workers):
+            self.spawn(index)
+        gw.heartbeat(self.collect())
+
+        next_model = time.time() + gw.MODEL_REFRESH_INTERVAL_SECONDS
+        next_control = time.time() + gw.CONFIG["config_check_interval"]
+        while not self.stopping.wait(WORKER_CHECK_SECONDS):
+            self.check_workers()
+            now = time.time()
+            if now >= next_model:
+                self.refresh_model()
+                next_model = now + gw.MODEL_REFRESH_INTERVAL_SECONDS
+            if now >= next_control:
+                self.control_cycle()
+                next_control = now + gw.CONFIG["config_check_interval"]
+
+        log_info(f"[{gw.GATEWAY_ID}] Shutdown signal received, stopping workers")
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            proc.join(timeout=5)
+        self.snapshot.remove()
+        log_info(f"[{gw.GATEWAY_ID}] Shutdown complete")
+
+
+def run(gateway, workers):
+    """Run `workers` gateway worker processes under a supervisor. `gateway` is the main module."""
+    Supervisor(gateway, workers).run()
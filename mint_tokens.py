@@ -0,0 +1,37 @@
+import argparse
+import requests
+
+# Operator step: sign device tokens through cloud provisioning (which refuses
+# revoked devices) and print them as env assignments for the simulator
+# containers. Devices never hold the API key; each one gets its token in
+# DEVICE_TOKEN.
+#
+#   export $(python mint_tokens.py sensor-001 sensor-002 sensor-003)
+
+CLOUD_API_URL = "http://localhost:8000"
+API_KEY = "secretAPIkey"
+
+
+def token_variable(device_id):
+    """Env variable docker-compose reads the device's token from, e.g. SENSOR_001_TOKEN."""
+    return device_id.upper().replace("-", "_") + "_TOKEN"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mint device tokens for the sensor simulators")
+    parser.add_argument("device_ids", nargs="+")
+    args = parser.parse_args()
+
+    resp = requests.post(
+        f"{CLOUD_API_URL}/devices/token",
+        json={"deviceIds": args.device_ids},
+        headers={"Authorization": f"Bearer {API_KEY}"},
+        timeout=30
+    )
+    resp.raise_for_status()
+    for device_id, token in resp.json()["tokens"].items():
+        print(f"{token_variable(device_id)}={token}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,96 +1,317 @@
-import time
+import argparse
 import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
 from datetime import datetime
 import paho.mqtt.client as mqtt
+import requests
 
-from devices.sensor import Sensor, SENSOR_CONFIG
+from devices.sensor import SensorFleet, SENSOR_CONFIG
 
 BROKER = "localhost"
 PORT = 1883
+CLOUD_API_URL = "http://localhost:8000"
 NUM_SENSORS = 500
 PUBLISH_INTERVAL = 1
-SIGNATURE = "device-secret"
+API_KEY = "secretAPIkey"
+TOKENS_PER_REQUEST = 10000
 SENSORS_PER_BATCH = 100
 BATCH_INTERVAL = 60
+REPORT_INTERVAL = 1.0
+COUNTER_FLUSH_INTERVAL = 0.25
+MAX_QUEUED_MESSAGES = 100000
+LATENCY_SAMPLE_DEVICES = 20
+SETUP_TIMEOUT_SECONDS = 300  # for every publisher to connect and build its sensors
 
 SENSOR_TYPES = ["temperature", "humidity", "pressure"]
 
 
-def main():
-    print(f"Connecting to MQTT broker at {BROKER}:{PORT}...")
+def device_id_for(index):
+    return f"sensor-{index:04d}"
+
+
+def fetch_tokens(device_ids):
+    """Signed device tokens from cloud provisioning, requested in chunks."""
+    tokens = {}
+    for start in range(0, len(device_ids), TOKENS_PER_REQUEST):
+        resp = requests.post(
+            f"{CLOUD_API_URL}/devices/token",
+            json={"deviceIds": device_ids[start:start + TOKENS_PER_REQUEST]},
+            headers={"Authorization": f"Bearer {API_KEY}"},
+            timeout=30
+        )
+        resp.raise_for_status()
+        tokens.update(resp.json()["tokens"])
+    return tokens
+
 
-    client = mqtt.Client(client_id="load-test", protocol=mqtt.MQTTv311)
+def build_template(device_id, sensor_type, run_id, token):
+    """Pre-encode everything but value/timestamp/sentAt so each publish is one bytes % format."""
+    fixed = json.dumps({
+        "deviceId": device_id,
+        "signature": token,
+        "sensorType": sensor_type,
+        "unit": SENSOR_CONFIG[sensor_type]["unit"],
+        "runId": run_id
+    }, separators=(",", ":"))
+    return fixed[:-1].replace("%", "%%").encode() + (
+        b',"value":%.2f,"injectedAnomaly":%s,"timestamp":"%s","sentAt":%.6f}'
+    )
 
+
+def active_sensors(elapsed, total, ramp_step, ramp_interval):
+    """Number of sensors active after `elapsed` seconds (all of them when ramp is disabled)."""
+    if ramp_step <= 0 or ramp_interval <= 0:
+        return total
+    return min(total, ramp_step * (1 + int(elapsed // ramp_interval)))
+
+
+def connect(client_id, qos):
+    client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311)
+    client.max_queued_messages_set(MAX_QUEUED_MESSAGES)
+    if qos > 0:
+        client.max_inflight_messages_set(1000)
     while True:
         try:
             client.connect(BROKER, PORT)
             break
         except Exception as e:
-            print(f"Broker not ready, retrying in 2s... ({e})")
+            print(f"[{client_id}] Broker not ready, retrying in 2s... ({e})")
             time.sleep(2)
-
     client.loop_start()
-    print("Connected!\n")
+    return client
+
+
+def shard_indices(shard, args):
+    return range(shard + 1, args.sensors + 1, args.processes)
 
-    sensors = []
-    total_sensors_created = 0
-    next_batch_time = time.time() + BATCH_INTERVAL
 
-    total_sent = 0
-    start_time = time.time()
+def publisher(shard, args, run_id, tokens, start_at, barrier, sent_counter, lag_ms, stop_event):
+    """One process: publishes for sensors shard, shard+P, shard+2P, ... with open-loop pacing.
 
+    tokens are the signed device tokens of those sensors, in the same order.
+    """
     try:
-        while True:
-            now = time.time()
-            if now >= next_batch_time and total_sensors_created < NUM_SENSORS:
-                batch_size = min(SENSORS_PER_BATCH, NUM_SENSORS - total_sensors_created)
-                for i in range(batch_size):
-                    sensor_index = total_sensors_created + 1
-                    sensor_type = SENSOR_TYPES[sensor_index % len(SENSOR_TYPES)]
-                    device_id = f"sensor-{sensor_index:04d}"
-                    sensors.append(Sensor(device_id, sensor_type))
-                    total_sensors_created += 1
-                print(f"Added {batch_size} new sensors, total: {total_sensors_created}")
-                next_batch_time = now + BATCH_INTERVAL
-
-            sent_this_cycle = 0
-            for sensor in sensors:
-                topic = SENSOR_CONFIG[sensor.sensor_type]["topic"]
-                unit = SENSOR_CONFIG[sensor.sensor_type]["unit"]
-
-                payload = {
-                    "deviceId": sensor.device_id,
-                    "signature": SIGNATURE,
-                    "sensorType": sensor.sensor_type,
-                    "timestamp": datetime.now().isoformat() + "Z",
-                    "value": sensor.get_value(),
-                    "unit": unit
-                }
-
-                result = client.publish(topic, json.dumps(payload))
-                if result[0] == 0:
-                    sent_this_cycle += 1
-
-            total_sent += sent_this_cycle
-            elapsed = time.time() - start_time
-            rate = total_sent / elapsed if elapsed > 0 else 0
+        client = connect(f"load-test-{run_id}-{shard}", args.qos)
+
+        sensors = []
+        for index, token in zip(shard_indices(shard, args), tokens):
+            sensor_type = SENSOR_TYPES[index % len(SENSOR_TYPES)]
+            device_id = device_id_for(index)
+            sensors.append((
+                SENSOR_CONFIG[sensor_type]["topic"],
+                build_template(device_id, sensor_type, run_id, token),
+                device_id,
+                sensor_type,
+            ))
+        seed = None if args.seed is None else args.seed + shard
+        fleet = SensorFleet([s[2] for s in sensors], [s[3] for s in sensors], seed=seed)
+    except Exception as e:
+        # Break the barrier so the other publishers and the main process stop waiting for this one
+        print(f"[publisher {shard}] Setup failed: {e}")
+        barrier.abort()
+        sys.exit(1)
+
+    # Wait until every process is connected and built, then start on the shared schedule
+    try:
+        barrier.wait()
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        client.loop_stop()
+        client.disconnect()
+        sys.exit(1)
+    started_at = start_at.value
+
+    per_sensor_rate = args.rate / args.sensors
+    poisson = args.pacing == "poisson"
+    qos = args.qos
+    publish = client.publish
+
+    next_send = started_at
+    cursor = 0
+    values, injected = [], []
+    local_sent = 0
+    worst_lag = 0.0
+    last_flush = time.time()
+    stamp_ms = None
+    stamp = b""
+
+    while not stop_event.is_set():
+        now = time.time()
+        active = active_sensors(now - started_at, args.sensors, args.ramp_step, args.ramp_interval)
+        # This shard owns indices shard+1, shard+1+P, ... so its active count is arithmetic
+        active_here = max(0, (active - shard - 1) // args.processes + 1)
+        rate = per_sensor_rate * active_here
+
+        if rate <= 0:
+            next_send = now + 0.1
+            time.sleep(0.1)
+            continue
+
+        if next_send > now:
+            time.sleep(min(next_send - now, 0.05))
+            continue
+
+        # Behind schedule: send everything owed without sleeping (open loop)
+        worst_lag = max(worst_lag, now - next_send)
+        while next_send <= now:
+            # One vectorized fleet tick per pass over the active sensors
+            if cursor == 0:
+                tick_values, tick_anomalies = fleet.tick(now - started_at)
+                values, injected = tick_values.tolist(), tick_anomalies.tolist()
+            topic, template = sensors[cursor][0], sensors[cursor][1]
+            value, is_injected = values[cursor], injected[cursor]
+            cursor += 1
+            if cursor >= active_here:
+                cursor = 0
+            # ISO timestamps are formatted at most once per millisecond
+            if stamp_ms != int(now * 1000):
+                stamp_ms = int(now * 1000)
+                stamp = (datetime.now().isoformat() + "Z").encode()
+            payload = template % (value, b"true" if is_injected else b"false", stamp, time.time())
+            if publish(topic, payload, qos=qos)[0] == 0:
+                local_sent += 1
+            next_send += random.expovariate(rate) if poisson else 1.0 / rate
 
+        if now - last_flush >= COUNTER_FLUSH_INTERVAL:
+            with sent_counter.get_lock():
+                sent_counter.value += local_sent
+            with lag_ms.get_lock():
+                lag_ms.value = max(lag_ms.value, worst_lag * 1000)
+            local_sent = 0
+            worst_lag = 0.0
+            last_flush = now
+
+    with sent_counter.get_lock():
+        sent_counter.value += local_sent
+    client.loop_stop()
+    client.disconnect()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+def report_latency(run_id, args):
+    """Fetch this run's records for a sample of devices and report publish -> cloud ingest latency."""
+    latencies = []
+    for index in range(1, min(args.sensors, LATENCY_SAMPLE_DEVICES) + 1):
+        try:
+            resp = requests.get(f"{CLOUD_API_URL}/data/by-device/{device_id_for(index)}", timeout=30)
+            for record in resp.json().get("data", []):
+                if record.get("runId") == run_id and "sentAt" in record and "receivedAt" in record:
+                    latencies.append(record["receivedAt"] - record["sentAt"])
+        except Exception as e:
+            print(f"Latency fetch failed for {device_id_for(index)}: {e}")
+
+    if not latencies:
+        print("No records from this run reached the cloud API yet")
+        return
+    print(
+        f"End-to-end latency over {len(latencies)} records "
+        f"(first {LATENCY_SAMPLE_DEVICES} sensors): "
+        f"p50={percentile(latencies, 50) * 1000:.0f}ms "
+        f"p90={percentile(latencies, 90) * 1000:.0f}ms "
+        f"p99={percentile(latencies, 99) * 1000:.0f}ms "
+        f"max={max(latencies) * 1000:.0f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT load generator")
+    parser.add_argument("--sensors", type=int, default=NUM_SENSORS)
+    parser.add_argument("--rate", type=float, default=None,
+                        help="total msg/s at full ramp (default: one message per sensor per PUBLISH_INTERVAL)")
+    parser.add_argument("--processes", type=int, default=1, help="publisher processes, each with its own MQTT client")
+    parser.add_argument("--pacing", choices=["constant", "poisson"], default="constant")
+    parser.add_argument("--qos", type=int, choices=[0, 1], default=0)
+    parser.add_argument("--duration", type=float, default=0, help="seconds to run (0 = until Ctrl+C)")
+    parser.add_argument("--ramp-step", type=int, default=SENSORS_PER_BATCH, help="sensors added per ramp step (0 = no ramp)")
+    parser.add_argument("--ramp-interval", type=float, default=BATCH_INTERVAL)
+    parser.add_argument("--seed", type=int, default=None, help="seed the sensor fleet for reproducible values")
+    parser.add_argument("--latency", action="store_true", help="report end-to-end latency from the cloud API at the end")
+    parser.add_argument("--drain", type=float, default=10.0, help="seconds to wait for the pipeline before measuring latency")
+    args = parser.parse_args()
+    if args.rate is None:
+        args.rate = args.sensors / PUBLISH_INTERVAL
+    args.processes = max(1, min(args.processes, args.sensors))
+
+    run_id = f"{int(time.time())}"
+    print(f"Load run {run_id}: {args.sensors} sensors, {args.rate:.0f} msg/s, "
+          f"{args.processes} processes, {args.pacing} pacing, QoS {args.qos} -> {BROKER}:{PORT}")
+
+    # Minting tokens is an operator step, done once here rather than by every publisher
+    try:
+        tokens = fetch_tokens([device_id_for(index) for index in range(1, args.sensors + 1)])
+    except Exception as e:
+        print(f"Fetching device tokens failed: {e}")
+        sys.exit(1)
+
+    sent_counter = multiprocessing.Value("q", 0)
+    lag_ms = multiprocessing.Value("d", 0.0)
+    stop_event = multiprocessing.Event()
+    start_at = multiprocessing.Value("d", 0.0)
+    barrier = multiprocessing.Barrier(args.processes + 1)
+    workers = [
+        multiprocessing.Process(
+            target=publisher,
+            args=(shard, args, run_id, [tokens[device_id_for(index)] for index in shard_indices(shard, args)],
+                  start_at, barrier, sent_counter, lag_ms, stop_event),
+            daemon=True
+        )
+        for shard in range(args.processes)
+    ]
+    for w in workers:
+        w.start()
+
+    try:
+        barrier.wait(timeout=SETUP_TIMEOUT_SECONDS)
+        start_at.value = started_at = time.time()
+        barrier.wait(timeout=SETUP_TIMEOUT_SECONDS)
+    except threading.BrokenBarrierError:
+        print(f"Publisher setup failed or took longer than {SETUP_TIMEOUT_SECONDS}s, aborting the run")
+        barrier.abort()
+        for w in workers:
+            w.terminate()
+        sys.exit(1)
+
+    last_total = 0
+    last_time = time.time()
+    try:
+        while args.duration <= 0 or time.time() - started_at < args.duration:
+            time.sleep(REPORT_INTERVAL)
+            now = time.time()
+            total = sent_counter.value
+            elapsed = max(now - started_at, 1e-9)
+            with lag_ms.get_lock():
+                worst_lag = lag_ms.value
+                lag_ms.value = 0.0
+            active = active_sensors(max(elapsed, 0), args.sensors, args.ramp_step, args.ramp_interval)
             print(
-                f"Sent: {sent_this_cycle}/{len(sensors)} | "
-                f"Total: {total_sent} | "
-                f"Rate: {rate:.0f} msg/s"
+                f"Sensors: {active} | Total: {total} | "
+                f"Rate: {(total - last_total) / (now - last_time):.0f} msg/s "
+                f"(avg {total / elapsed:.0f}) | Max schedule lag: {worst_lag:.1f}ms"
             )
-
-            time.sleep(PUBLISH_INTERVAL)
+            last_total, last_time = total, now
 
     except KeyboardInterrupt:
         print("\nStopping load simulation...")
 
     finally:
-        client.loop_stop()
-        client.disconnect()
+        stop_event.set()
+        for w in workers:
+            w.join(timeout=5)
+        print(f"Sent {sent_counter.value} messages")
+
+    if args.latency:
+        print(f"Waiting {args.drain:.0f}s for the pipeline to drain...")
+        time.sleep(args.drain)
+        report_latency(run_id, args)
 
 
 if __name__ == "__main__":
     main()
-    
\ No newline at end of file
@@ -0,0 +1,174 @@
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+
+# Binary z-score model artifact, written by the trainer next to the JSON one
+# and served by the cloud as /ml/model.bin. Layout (little-endian):
+#
+#   header    magic, generated_at, training_window_size, profiles, index slots, key bytes
+#   mean      float64[profiles]
+#   stddev    float64[profiles]
+#   n_sigma   float64[profiles]
+#   samples   uint32[profiles]
+#   offsets   uint32[profiles + 1]   start of each key in the key table
+#   index     uint32[slots]          open-addressing hash index: crc32(key) -> profile + 1, 0 = empty
+#   keys      utf-8 profile keys, sorted, concatenated
+#
+# Sections start on 8-byte boundaries, so a reader can use the arrays straight
+# out of the file (mmap) or the HTTP body without copying or parsing.
+
+MAGIC = b"ZSMODEL1"
+HEADER = struct.Struct("<8sqIIII")
+DEFAULT_STDDEV = 0.0001
+DEFAULT_N_SIGMA = 3.0
+LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _padding(size):
+    return -size % 8
+
+
+def _index_slots(count):
+    """Power of two with at most 50% load."""
+    slots = 8
+    while slots < count * 2:
+        slots *= 2
+    return slots
+
+
+def _section_bytes(values):
+    if not LITTLE_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    data = values.tobytes()
+    return data + b"\0" * _padding(len(data))
+
+
+def write_model(artifact):
+    """Encode a JSON model artifact ({"generated_at", "training_window_size", "features": {key: profile}}) to bytes."""
+    features = artifact.get("features") or {}
+    keys = sorted(features)
+    encoded = [key.encode() for key in keys]
+    profiles = [features[key] for key in keys]
+
+    offsets = array("I", [0])
+    for key in encoded:
+        offsets.append(offsets[-1] + len(key))
+
+    slots = _index_slots(len(keys))
+    mask = slots - 1
+    index = array("I", [0]) * slots
+    for i, key in enumerate(encoded):
+        slot = zlib.crc32(key) & mask
+        while index[slot]:
+            slot = (slot + 1) & mask
+        index[slot] = i + 1
+
+    key_table = b"".join(encoded)
+    header = HEADER.pack(
+        MAGIC,
+        int(artifact.get("generated_at") or 0),
+        int(artifact.get("training_window_size") or 0),
+        len(keys),
+        slots,
+        len(key_table)
+    )
+    return b"".join([
+        header,
+        _section_bytes(array("d", (float(p.get("mean", 0.0)) for p in profiles))),
+        _section_bytes(array("d", (float(p.get("stddev", DEFAULT_STDDEV)) for p in profiles))),
+        _section_bytes(array("d", (float(p.get("n_sigma", DEFAULT_N_SIGMA)) for p in profiles))),
+        _section_bytes(array("I", (int(p.get("samples", 0)) for p in profiles))),
+        _section_bytes(offsets),
+        _section_bytes(index),
+        key_table
+    ])
+
+
+class BinaryModel:
+    """Read-only view over an encoded model (bytes or mmap); profiles are looked up through the hash index."""
+
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        if len(view) < HEADER.size:
+            raise ValueError("Model artifact is truncated")
+        magic, self.generated_at, self.training_window_size, self.count, self.slots, key_bytes = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("Not a binary model artifact")
+
+        self.buffer = buffer
+        offset = HEADER.size
+        self.mean, offset = self._section(view, offset, "d", self.count)
+        self.stddev, offset = self._section(view, offset, "d", self.count)
+        self.n_sigma, offset = self._section(view, offset, "d", self.count)
+        self.samples, offset = self._section(view, offset, "I", self.count)
+        self.offsets, offset = self._section(view, offset, "I", self.count + 1)
+        self.index, offset = self._section(view, offset, "I", self.slots)
+        if offset + key_bytes > len(view):
+            raise ValueError("Model artifact is truncated")
+        self.keys = view[offset:offset + key_bytes]
+
+    @staticmethod
+    def _section(view, offset, typecode, count):
+        size = array(typecode).itemsize * count
+        if offset + size > len(view):
+            raise ValueError("Model artifact is truncated")
+        data = view[offset:offset + size]
+        if LITTLE_ENDIAN:
+            values = data.cast(typecode)
+        else:
+            values = array(typecode, data.tobytes())
+            values.byteswap()
+        return values, offset + size + _padding(size)
+
+    def __len__(self):
+        return self.count
+
+    def key_at(self, i):
+        return bytes(self.keys[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+    def index_of(self, profile_key):
+        """Position of profile_key, or None if the model has no profile for it."""
+        encoded = profile_key.encode()
+        mask = self.slots - 1
+        slot = zlib.crc32(encoded) & mask
+        while True:
+            entry = self.index[slot]
+            if entry == 0:
+                return None
+            i = entry - 1
+            if self.keys[self.offsets[i]:self.offsets[i + 1]] == encoded:
+                return i
+            slot = (slot + 1) & mask
+
+    def lookup(self, profile_key):
+        """(mean, stddev, n_sigma) for profile_key, or None."""
+        i = self.index_of(profile_key)
+        if i is None:
+            return None
+        return self.mean[i], self.stddev[i], self.n_sigma[i]
+
+    def to_artifact(self):
+        """Decode back to the JSON artifact form (for debugging)."""
+        features = {}
+        for i in range(self.count):
+            features[self.key_at(i)] = {
+                "mean": self.mean[i],
+                "stddev": self.stddev[i],
+                "samples": self.samples[i],
+                "n_sigma": self.n_sigma[i]
+            }
+        return {
+            "model_type": "zscore_anomaly_detector",
+            "generated_at": self.generated_at,
+            "training_window_size": self.training_window_size,
+            "features": features
+        }
+
+
+def open_model(path):
+    """Map a model file read-only; the mapping stays open as long as the returned model is referenced."""
+    with open(path, "rb") as f:
+        return BinaryModel(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
@@ -1,60 +1,35 @@
 import os
 import json
 import time
-from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, avg, stddev_pop, count
 from logger import log_info, log_error
+from model_format import write_model
+from trainers import create_trainer, select_backend
 
 DATA_PATH = "/data/historical_data.json"
 MODEL_PATH = "/data/anomaly_model.json"
+MODEL_BINARY_PATH = "/data/anomaly_model.bin"
 TRAINING_INTERVAL_SECONDS = 20
-MIN_OBSERVATIONS = 20
-DEFAULT_N_SIGMA = 3.0
 TRAINING_WINDOW_SIZE = 50
+TRAINER_BACKEND = os.getenv("TRAINER_BACKEND", "auto")  # "numpy", "spark" or "auto"
+SPARK_MIN_BYTES = int(os.getenv("SPARK_MIN_BYTES", 1024 ** 3))  # "auto" switches to Spark from this data file size
 
-spark = SparkSession.builder \
-    .appName("SensorAnalytics") \
-    .getOrCreate()
-
+trainers = {}  # backend name -> trainer, created on first use (SparkSession startup is slow)
 last_train_time = 0
-log_info("Spark process started")
-
-
-def build_model(df):
-    """Compute z-score stats (mean, stddev) per profile from training data."""
-    sensor_df = df.select("profileKey", "value").where(
-        col("profileKey").isNotNull() & col("value").isNotNull()
-    )
-
-    metrics_df = sensor_df.groupBy("profileKey").agg(
-        avg("value").alias("mean"),
-        stddev_pop("value").alias("stddev"),
-        count("*").alias("samples")
-    )
-
-    rows = metrics_df.collect()
-    model = {}
+log_info(f"Training process started (backend={TRAINER_BACKEND})")
 
-    for row in rows:
-        if row["samples"] < MIN_OBSERVATIONS:
-            continue
 
-        stddev = float(row["stddev"] or 0.0)
-        if stddev == 0.0:
-            stddev = 0.0001
-
-        model[row["profileKey"]] = {
-            "mean": float(row["mean"]),
-            "stddev": stddev,
-            "samples": int(row["samples"]),
-            "n_sigma": DEFAULT_N_SIGMA
-        }
-
-    return model
+def get_trainer(backend):
+    if backend not in trainers:
+        trainers[backend] = create_trainer(backend)
+    return trainers[backend]
 
 
 def persist_model(model):
-    """Write trained model artifact to shared volume for gateway consumption."""
+    """Write trained model artifact to shared volume for gateway consumption.
+
+    The JSON file is kept for debugging; gateways load the binary one. It is
+    written to a temp file and renamed so readers never see a partial model.
+    """
     artifact = {
         "model_type": "zscore_anomaly_detector",
         "generated_at": int(time.time()),
@@ -65,6 +40,11 @@ def persist_model(model):
     with open(MODEL_PATH, "w", encoding="utf-8") as f:
         json.dump(artifact, f)
 
+    temp_path = f"{MODEL_BINARY_PATH}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(write_model(artifact))
+    os.replace(temp_path, MODEL_BINARY_PATH)
+
     return artifact
 
 try:
@@ -74,22 +54,18 @@ try:
         if now - last_train_time >= TRAINING_INTERVAL_SECONDS:
             try:
                 if os.path.exists(DATA_PATH) and os.path.getsize(DATA_PATH) > 0:
-                    log_info("Processing data for adaptive retraining")
-
-                    df = spark.read.option("multiline", "true").json(DATA_PATH)
-
-                    if not df.rdd.isEmpty():
-                        model = build_model(df)
-                        if model:
-                            artifact = persist_model(model)
-                            log_info(
-                                f"Published adaptive model @ {artifact['generated_at']} "
-                                f"with {len(model)} sensor profiles"
-                            )
-                        else:
-                            log_info("Not enough data to train model yet")
+                    backend = select_backend(TRAINER_BACKEND, DATA_PATH, SPARK_MIN_BYTES)
+                    log_info(f"Processing data for adaptive retraining ({backend})")
+
+                    model = get_trainer(backend).train(DATA_PATH)
+                    if model:
+                        artifact = persist_model(model)
+                        log_info(
+                            f"Published adaptive model @ {artifact['generated_at']} "
+                            f"with {len(model)} sensor profiles"
+                        )
                     else:
-                        log_info("DataFrame empty — skipping")
+                        log_info("Not enough data to train model yet")
 
                 else:
                     log_info("Historical data file not ready for retraining")
@@ -108,5 +84,6 @@ except Exception as e:
     log_error(f"Spark pipeline failed: {e}")
 
 finally:
-    spark.stop()
-    log_info("Spark session stopped.")
+    for trainer in trainers.values():
+        trainer.close()
+    log_info("Trainers stopped.")
@@ -0,0 +1,63 @@
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import col, coalesce, lit, sum as spark_sum
+from trainers import MIN_OBSERVATIONS, profile_entry
+
+
+def build_model(df):
+    """Compute z-score stats (mean, stddev) per profile from training data (see trainers.py for the merge)."""
+    has_summaries = {"count", "mean", "m2"}.issubset(df.columns)
+    if has_summaries:
+        windows_df = df.select(
+            "profileKey",
+            coalesce(col("count"), lit(1)).cast("double").alias("n"),
+            coalesce(col("mean"), col("value")).cast("double").alias("window_mean"),
+            coalesce(col("m2"), lit(0.0)).cast("double").alias("window_m2")
+        )
+    else:
+        windows_df = df.select(
+            "profileKey",
+            lit(1.0).alias("n"),
+            col("value").cast("double").alias("window_mean"),
+            lit(0.0).alias("window_m2")
+        )
+    windows_df = windows_df.where(col("profileKey").isNotNull() & col("window_mean").isNotNull())
+
+    # Pass 1: combined mean. Pass 2: M2 = sum(m2_i + n_i * (mean_i - mean)^2)
+    means_df = windows_df.groupBy("profileKey").agg(
+        spark_sum("n").alias("samples"),
+        (spark_sum(col("n") * col("window_mean")) / spark_sum("n")).alias("mean")
+    )
+    metrics_df = windows_df.join(means_df, "profileKey").groupBy("profileKey", "samples", "mean").agg(
+        spark_sum(
+            col("window_m2") + col("n") * (col("window_mean") - col("mean")) * (col("window_mean") - col("mean"))
+        ).alias("m2")
+    ).select(
+        "profileKey", "mean", "samples", (col("m2") / col("samples")).alias("variance")
+    )
+
+    model = {}
+    for row in metrics_df.collect():
+        if row["samples"] < MIN_OBSERVATIONS:
+            continue
+        model[row["profileKey"]] = profile_entry(row["mean"], row["variance"], row["samples"])
+    return model
+
+
+class SparkTrainer:
+    """Distributed trainer on a SparkSession, for datasets too large for one process."""
+
+    name = "spark"
+
+    def __init__(self):
+        self.spark = SparkSession.builder \
+            .appName("SensorAnalytics") \
+            .getOrCreate()
+
+    def train(self, data_path):
+        df = self.spark.read.option("multiline", "true").json(data_path)
+        if df.rdd.isEmpty():
+            return {}
+        return build_model(df)
+
+    def close(self):
+        self.spark.stop()
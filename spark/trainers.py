@@ -0,0 +1,100 @@
+import json
+import os
+import numpy as np
+
+# Training backends. Each one turns the historical data file exported by the
+# cloud API into {profileKey: {"mean", "stddev", "samples", "n_sigma"}}.
+#
+# Training data mixes raw readings with gateway summary records (count/mean/m2
+# over a window). A raw reading is a window of one, so both are combined with
+# the exact parallel mean/variance merge instead of averaging `value`.
+#
+# "numpy" does the group-by in one process and is the right size for the
+# usual training set (TRAINING_WINDOW_SIZE readings per profile). "spark" is
+# kept for datasets that do not fit in one process; it needs pyspark and a JVM.
+
+MIN_OBSERVATIONS = 20
+DEFAULT_N_SIGMA = 3.0
+TRAINER_BACKENDS = ("numpy", "spark")
+
+
+def profile_entry(mean, variance, samples):
+    """Model entry for one profile from its merged statistics."""
+    stddev = max(float(variance or 0.0), 0.0) ** 0.5
+    if stddev == 0.0:
+        stddev = 0.0001
+    return {
+        "mean": float(mean),
+        "stddev": stddev,
+        "samples": int(samples),
+        "n_sigma": DEFAULT_N_SIGMA
+    }
+
+
+class NumpyTrainer:
+    """In-process trainer: grouped sums over NumPy arrays."""
+
+    name = "numpy"
+
+    def train(self, data_path):
+        with open(data_path, "r", encoding="utf-8") as f:
+            return self.build_model(json.load(f))
+
+    def build_model(self, records):
+        """Compute z-score stats (mean, stddev) per profile from training records."""
+        profile_index = {}
+        codes, counts, means, m2s = [], [], [], []
+        for record in records:
+            profile_key = record.get("profileKey")
+            window_mean = record.get("mean")
+            if window_mean is None:
+                window_mean = record.get("value")
+            if profile_key is None or window_mean is None:
+                continue
+            codes.append(profile_index.setdefault(profile_key, len(profile_index)))
+            counts.append(record.get("count") or 1)
+            means.append(window_mean)
+            m2s.append(record.get("m2") or 0.0)
+
+        if not codes:
+            return {}
+
+        codes = np.asarray(codes, dtype=np.intp)
+        n = np.asarray(counts, dtype=np.float64)
+        window_mean = np.asarray(means, dtype=np.float64)
+        window_m2 = np.asarray(m2s, dtype=np.float64)
+        profiles = len(profile_index)
+
+        # Pass 1: combined mean. Pass 2: M2 = sum(m2_i + n_i * (mean_i - mean)^2)
+        samples = np.bincount(codes, weights=n, minlength=profiles)
+        mean = np.bincount(codes, weights=n * window_mean, minlength=profiles) / samples
+        deviation = window_mean - mean[codes]
+        m2 = np.bincount(codes, weights=window_m2 + n * deviation * deviation, minlength=profiles)
+        variance = m2 / samples
+
+        model = {}
+        for profile_key, i in profile_index.items():
+            if samples[i] < MIN_OBSERVATIONS:
+                continue
+            model[profile_key] = profile_entry(mean[i], variance[i], samples[i])
+        return model
+
+    def close(self):
+        pass
+
+
+def create_trainer(backend):
+    """Trainer instance for a backend name in TRAINER_BACKENDS."""
+    if backend == "numpy":
+        return NumpyTrainer()
+    if backend == "spark":
+        from spark_trainer import SparkTrainer
+        return SparkTrainer()
+    raise ValueError(f"Unknown trainer backend: {backend}")
+
+
+def select_backend(configured, data_path, spark_min_bytes):
+    """Backend for this run: the configured one, or for "auto" spark only once the data file is large."""
+    if configured != "auto":
+        return configured
+    return "spark" if os.path.getsize(data_path) >= spark_min_bytes else "numpy"